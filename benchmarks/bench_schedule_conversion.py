@@ -0,0 +1,172 @@
+"""
+Schedule conversion benchmark
+
+Times convert_from_wiser_schedule and convert_to_wiser_schedule over every
+heating schedule of an emulated house, against the original per-setpoint
+strptime based conversion kept below for reference, and checks the new
+conversion round-trips.
+
+Only needs aiohttp (for the emulator's house builder), not Home Assistant:
+
+    python benchmarks/bench_schedule_conversion.py --rooms 15 --repeat 200
+"""
+import argparse
+import copy
+import importlib
+import json
+import os
+import sys
+import time
+import types
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPONENT_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "custom_components", "wiser")
+sys.path.insert(0, BENCHMARK_DIR)
+
+from hub_emulator import build_hub_data  # noqa: E402
+
+# Import util.py on its own, the package __init__ needs Home Assistant
+_package = types.ModuleType("wiser")
+_package.__path__ = [COMPONENT_DIR]
+sys.modules.setdefault("wiser", _package)
+util = importlib.import_module("wiser.util")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+WEEKENDS = ["saturday", "sunday"]
+SPECIALDAYS = ["weekdays", "weekends"]
+
+
+def reference_from_wiser_schedule(scheduleData, scheduleName=""):
+    """The original conversion, for comparison"""
+    if "id" in scheduleData:
+        del scheduleData["id"]
+    scheduleOutput = {
+        "Name": scheduleName,
+        "Description": "Schedule for " + scheduleName,
+        "Type": "Heating",
+    }
+    for day, sched in scheduleData.items():
+        if day.lower() in (WEEKDAYS + WEEKENDS + SPECIALDAYS):
+            for setpoint, times in sched.items():
+                if setpoint == "SetPoints":
+                    schedSetpoints = []
+                    for k in times:
+                        schedTime = {}
+                        for key, value in k.items():
+                            if key == "Time":
+                                value = (
+                                    datetime.strptime(format(value, "04d"), "%H%M")
+                                ).strftime("%H:%M")
+                            if key == "DegreesC":
+                                key = "Temp"
+                                if value < 0:
+                                    value = "Off"
+                                else:
+                                    value = round(value / 10, 1)
+                            tmp = {key: value}
+                            schedTime.update(tmp)
+                        schedSetpoints.append(schedTime.copy())
+            scheduleOutput.update({day: schedSetpoints})
+    return scheduleOutput
+
+
+def reference_to_wiser_schedule(scheduleData):
+    """The original conversion, for comparison"""
+    scheduleOutput = {"Type": "Heating"}
+    for day, times in scheduleData.items():
+        if day.lower() in (WEEKDAYS + WEEKENDS + SPECIALDAYS):
+            schedDay = {}
+            schedSetpoints = []
+            for k in times:
+                schedTime = {}
+                for key, value in k.items():
+                    if key == "Time":
+                        value = str(value).replace(":", "")
+                    if key == "Temp":
+                        key = "DegreesC"
+                        if value == "Off":
+                            value = -200
+                        else:
+                            value = int(value * 10)
+                    tmp = {key: value}
+                    schedTime.update(tmp)
+                schedSetpoints.append(schedTime.copy())
+                schedDay = {"Setpoints": schedSetpoints}
+            if day.lower() in SPECIALDAYS:
+                if day.lower() == "weekdays":
+                    for d in WEEKDAYS:
+                        scheduleOutput.update({d.capitalize(): schedDay})
+                if day.lower() == "weekends":
+                    for d in WEEKENDS:
+                        scheduleOutput.update({d.capitalize(): schedDay})
+            else:
+                scheduleOutput.update({day: schedDay})
+    return scheduleOutput
+
+
+def best_of(function, schedules, repeat, copy_input=False):
+    """Best time, in milliseconds, to convert every schedule once"""
+    best = None
+    for _ in range(repeat):
+        inputs = copy.deepcopy(schedules) if copy_input else schedules
+        start = time.perf_counter()
+        for name, schedule in inputs:
+            function(schedule, name) if name is not None else function(schedule)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    hub_data = build_hub_data(rooms=args.rooms)
+    rooms = {room["ScheduleId"]: room["Name"] for room in hub_data["Room"]}
+    schedules = [
+        (rooms[schedule["id"]], schedule)
+        for schedule in hub_data["Schedule"]
+        if schedule["id"] in rooms
+    ]
+
+    readable = []
+    for name, schedule in schedules:
+        before = copy.deepcopy(schedule)
+        converted = util.convert_from_wiser_schedule(schedule, name)
+        assert schedule == before, "convert_from_wiser_schedule changed its input"
+        assert converted == reference_from_wiser_schedule(copy.deepcopy(schedule), name)
+        round_trip = util.convert_to_wiser_schedule(converted)
+        expected = {key: value for key, value in schedule.items() if key != "id"}
+        assert round_trip == expected, "schedule for {} did not round-trip".format(name)
+        readable.append((None, converted))
+
+    results = {"schedules": len(schedules)}
+    # The reference from-conversion deletes id, so give it fresh copies and
+    # time the new one the same way
+    results["from_wiser"] = {
+        "reference_ms": best_of(
+            reference_from_wiser_schedule, schedules, args.repeat, True
+        ),
+        "current_ms": best_of(
+            util.convert_from_wiser_schedule, schedules, args.repeat, True
+        ),
+    }
+    results["to_wiser"] = {
+        "reference_ms": best_of(reference_to_wiser_schedule, readable, args.repeat),
+        "current_ms": best_of(util.convert_to_wiser_schedule, readable, args.repeat),
+    }
+    results["both_directions"] = {
+        key: round(results["from_wiser"][key] + results["to_wiser"][key], 4)
+        for key in ("reference_ms", "current_ms")
+    }
+    for direction in ("from_wiser", "to_wiser", "both_directions"):
+        result = results[direction]
+        result["speedup"] = round(result["reference_ms"] / result["current_ms"], 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Local stand-in for a Drayton Wiser HeatHub
+
+Serves a realistic /data/domain/ payload for a configurable house and
+accepts the PATCH endpoints the integration writes to, applying them to its
+state so that refreshes after a write see the result. Latency and failures
+can be injected to exercise the integration's error handling.
+
+Run it on its own with
+
+    python benchmarks/hub_emulator.py --rooms 15 --port 8080
+
+and point the integration at host 127.0.0.1:8080 with any password given
+as --secret.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import random
+
+from aiohttp import web
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SIGNAL_STRENGTHS = ["VeryGood", "Good", "Medium", "Poor"]
+ROOM_NAMES = [
+    "Lounge",
+    "Kitchen",
+    "Dining Room",
+    "Hall",
+    "Study",
+    "Bathroom",
+    "Master Bedroom",
+    "Bedroom 2",
+    "Bedroom 3",
+    "Bedroom 4",
+    "Ensuite",
+    "Landing",
+    "Playroom",
+    "Utility",
+    "Conservatory",
+]
+
+HOTWATER_ON = 1100
+HOTWATER_OFF = -200
+
+
+def room_name(index):
+    if index < len(ROOM_NAMES):
+        return ROOM_NAMES[index]
+    return "Room {}".format(index + 1)
+
+
+def build_schedule(schedule_id, rng, schedule_type="Heating"):
+    """A week of setpoints in the hub's own format"""
+    schedule = {"id": schedule_id, "Type": schedule_type}
+    for day in DAYS:
+        if schedule_type == "Heating":
+            morning = rng.choice([600, 630, 700, 730])
+            evening = rng.choice([1630, 1700, 1730, 1800])
+            setpoints = [
+                {"Time": morning, "DegreesC": rng.choice([190, 200, 210])},
+                {"Time": 900, "DegreesC": 160},
+                {"Time": evening, "DegreesC": rng.choice([200, 210, 215])},
+                {"Time": 2230, "DegreesC": -200},
+            ]
+        else:
+            setpoints = [
+                {"Time": 600, "DegreesC": HOTWATER_ON},
+                {"Time": 800, "DegreesC": HOTWATER_OFF},
+                {"Time": 1700, "DegreesC": HOTWATER_ON},
+                {"Time": 1900, "DegreesC": HOTWATER_OFF},
+            ]
+        schedule[day] = {"SetPoints": setpoints}
+    return schedule
+
+
+def build_hub_data(
+    rooms=15, itrvs_per_room=2, roomstats=5, smart_plugs=3, hot_water=True, seed=1
+):
+    """Build a hub payload for a house of the given size"""
+    rng = random.Random(seed)
+    data = {
+        "System": {
+            "OverrideType": "None",
+            "AwayModeSetPointLimit": 100,
+            "CloudConnectionStatus": "Connected",
+            "ValveProtectionEnabled": False,
+            "EcoModeEnabled": True,
+            "AwayModeAffectsHotWater": True,
+            "ComfortModeEnabled": False,
+            "ActiveSystemVersion": "2.50.2-7d2e4f9bad",
+        },
+        "Zigbee": {"NetworkChannel": 11},
+        "Cloud": {"WiserApiHost": "api-nl.wiserair.com"},
+        "HeatingChannel": [],
+        "Room": [],
+        "Device": [
+            {
+                "id": 0,
+                "NodeId": 0,
+                "ProductType": "Controller",
+                "ModelIdentifier": "WT714R1S0902",
+                "ActiveFirmwareVersion": "2.50.2",
+                "SerialNumber": "HUB0000001",
+                "DeviceLockEnabled": False,
+                "DisplayedSignalStrength": "VeryGood",
+            }
+        ],
+        "SmartValve": [],
+        "RoomStat": [],
+        "SmartPlug": [],
+        "Schedule": [],
+        "HotWater": [],
+    }
+
+    next_device = 1
+    schedule_id = 1
+    repeater_nodes = []
+    for plug in range(smart_plugs):
+        node = 0x1000 + plug
+        repeater_nodes.append(node)
+        data["Schedule"].append(build_schedule(schedule_id, rng, "OnOff"))
+        data["SmartPlug"].append(
+            {
+                "id": next_device,
+                "Name": "Plug {}".format(plug + 1),
+                "ScheduleId": schedule_id,
+                "ManualState": "Off",
+                "Mode": "Auto",
+                "AwayAction": "Off",
+                "OutputState": "Off",
+                "ControlSource": "FromSchedule",
+                "ScheduledState": "Off",
+            }
+        )
+        data["Device"].append(
+            _device(rng, next_device, node, 0, "SmartPlug", battery=False)
+        )
+        next_device += 1
+        schedule_id += 1
+
+    room_ids = []
+    for index in range(rooms):
+        room_id = index + 1
+        room_ids.append(room_id)
+        data["Schedule"].append(build_schedule(schedule_id, rng))
+        valves = []
+        for _valve in range(itrvs_per_room):
+            parent = rng.choice(repeater_nodes) if repeater_nodes and rng.random() < 0.3 else 0
+            data["Device"].append(
+                _device(rng, next_device, 0x2000 + next_device, parent, "iTRV")
+            )
+            data["SmartValve"].append(
+                {"id": next_device, "SetPoint": 200, "MeasuredTemperature": 195}
+            )
+            valves.append(next_device)
+            next_device += 1
+        room = {
+            "id": room_id,
+            "Name": room_name(index),
+            "ScheduleId": schedule_id,
+            "SmartValveIds": valves,
+            "Mode": "Auto",
+            "CalculatedTemperature": rng.randint(170, 215),
+            "CurrentSetPoint": 200,
+            "DisplayedSetPoint": 200,
+            "ScheduledSetPoint": 200,
+            "SetpointOrigin": "FromSchedule",
+            "PercentageDemand": 0,
+            "ControlOutputState": "Off",
+            "WindowState": "Closed",
+            "WindowDetectionActive": False,
+            "HeatingRate": 1200,
+            "AwayModeSuppressed": False,
+        }
+        if index < roomstats:
+            data["Device"].append(
+                _device(rng, next_device, 0x2000 + next_device, 0, "RoomStat")
+            )
+            data["RoomStat"].append(
+                {
+                    "id": next_device,
+                    "SetPoint": 200,
+                    "MeasuredTemperature": room["CalculatedTemperature"],
+                    "MeasuredHumidity": rng.randint(40, 65),
+                }
+            )
+            room["RoomStatId"] = next_device
+            next_device += 1
+        data["Room"].append(room)
+        schedule_id += 1
+
+    data["HeatingChannel"].append(
+        {
+            "id": 1,
+            "Name": "Channel-1",
+            "RoomIds": room_ids,
+            "PercentageDemand": 0,
+            "HeatingRelayState": "Off",
+        }
+    )
+    if hot_water:
+        data["Schedule"].append(build_schedule(schedule_id, rng, "OnOff"))
+        data["HotWater"].append(
+            {
+                "id": 2,
+                "ScheduleId": schedule_id,
+                "Mode": "Auto",
+                "WaterHeatingState": "Off",
+                "HotWaterRelayState": "Off",
+            }
+        )
+    return data
+
+
+def _device(rng, device_id, node_id, parent, product_type, battery=True):
+    device = {
+        "id": device_id,
+        "NodeId": node_id,
+        "ProductType": product_type,
+        "ModelIdentifier": {"iTRV": "iTRV", "RoomStat": "Thermostat"}.get(
+            product_type, "SmartPlug"
+        ),
+        "ActiveFirmwareVersion": "0201000000",
+        "SerialNumber": "{}{:06d}".format(product_type.upper()[:3], device_id),
+        "DeviceLockEnabled": False,
+        "DisplayedSignalStrength": rng.choice(SIGNAL_STRENGTHS),
+        "ReceptionOfController": {"Rssi": rng.randint(-85, -50), "Lqi": rng.randint(60, 200)},
+        "ReceptionOfDevice": {"Rssi": rng.randint(-85, -50), "Lqi": rng.randint(60, 200)},
+    }
+    if product_type in ["iTRV", "RoomStat"]:
+        device["ParentNodeId"] = parent
+    if battery:
+        device["BatteryVoltage"] = rng.randint(26, 31)
+        device["BatteryLevel"] = "Normal"
+    return device
+
+
+class WiserHubEmulator:
+    """aiohttp application emulating the hub's REST interface"""
+
+    def __init__(
+        self,
+        hub_data,
+        secret="secret",
+        latency=0.0,
+        jitter=0.0,
+        failure_rate=0.0,
+        timeout_rate=0.0,
+        churn=0.0,
+        seed=1,
+    ):
+        self.data = hub_data
+        self.secret = secret
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.churn = churn
+        self.requests = {"GET": 0, "PATCH": 0}
+        self.patches = []
+        self._rng = random.Random(seed)
+        self._runner = None
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.router.add_get("/data/domain/", self._get_domain)
+        self.app.router.add_patch("/data/domain/{path:.*}", self._patch)
+
+    @classmethod
+    def for_house(cls, rooms=15, itrvs_per_room=2, roomstats=5, smart_plugs=3,
+                  hot_water=True, **kwargs):
+        return cls(
+            build_hub_data(rooms, itrvs_per_room, roomstats, smart_plugs, hot_water),
+            **kwargs
+        )
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving, returns the host:port to configure the integration with"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return "{}:{}".format(host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.headers.get("SECRET") != self.secret:
+            return web.Response(status=401, text="Unauthorised")
+        self.requests[request.method] = self.requests.get(request.method, 0) + 1
+        delay = self.latency + self._rng.uniform(0, self.jitter)
+        if self.timeout_rate and self._rng.random() < self.timeout_rate:
+            # Long enough to trip any sensible client timeout
+            delay += 30
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            return web.Response(status=500, text="Injected failure")
+        return await handler(request)
+
+    def _tick(self):
+        """Let a share of the rooms drift as a real house would"""
+        if not self.churn:
+            return
+        for room in self.data["Room"]:
+            if self._rng.random() < self.churn:
+                room["CalculatedTemperature"] += self._rng.choice([-1, 1])
+                heating = room["CalculatedTemperature"] < room["CurrentSetPoint"]
+                room["ControlOutputState"] = "On" if heating else "Off"
+                room["PercentageDemand"] = 100 if heating else 0
+
+    async def _get_domain(self, request):
+        self._tick()
+        return web.Response(
+            body=json.dumps(self.data).encode(), content_type="application/json"
+        )
+
+    async def _patch(self, request):
+        path = request.match_info["path"].strip("/").split("/")
+        body = await request.json()
+        self.patches.append(("/".join(path), copy.deepcopy(body)))
+        section = path[0]
+        if section == "System":
+            if len(path) > 1 and path[1] == "RequestOverride":
+                if body.get("type") == 2:
+                    self.data["System"]["OverrideType"] = "Away"
+                    self.data["System"]["AwayModeSetPointLimit"] = body["setPoint"]
+                else:
+                    self.data["System"]["OverrideType"] = "None"
+            else:
+                self.data["System"].update(body)
+            return web.json_response(self.data["System"])
+
+        item = self._find(section, int(path[1]) if len(path) > 1 else None)
+        if item is None:
+            return web.Response(status=404, text="Not found")
+        if section == "Room":
+            self._patch_room(item, body)
+        elif section == "Schedule":
+            item.update(copy.deepcopy(body))
+        elif section == "SmartPlug":
+            if "RequestOutput" in body:
+                item["OutputState"] = body["RequestOutput"]
+                item["ManualState"] = body["RequestOutput"]
+            if "Mode" in body:
+                item["Mode"] = body["Mode"]
+        elif section == "HotWater":
+            override = body.get("RequestOverride", {})
+            if override.get("Type") == "Manual":
+                on = override.get("SetPoint") == HOTWATER_ON
+                item["Mode"] = "Manual"
+                item["WaterHeatingState"] = "On" if on else "Off"
+            else:
+                item["Mode"] = "Auto"
+        return web.json_response(item)
+
+    def _find(self, section, item_id):
+        for item in self.data.get(section) or []:
+            if item.get("id") == item_id:
+                return item
+        return None
+
+    @staticmethod
+    def _patch_room(room, body):
+        if "Mode" in body:
+            room["Mode"] = body["Mode"]
+        override = body.get("RequestOverride")
+        if override is None:
+            if room["Mode"] == "Auto":
+                room["CurrentSetPoint"] = room["ScheduledSetPoint"]
+                room["DisplayedSetPoint"] = room["ScheduledSetPoint"]
+                room["SetpointOrigin"] = "FromSchedule"
+            return
+        if override.get("Type") == "None":
+            room["CurrentSetPoint"] = room["ScheduledSetPoint"]
+            room["DisplayedSetPoint"] = room["ScheduledSetPoint"]
+            room["SetpointOrigin"] = "FromSchedule"
+            return
+        room["CurrentSetPoint"] = override["SetPoint"]
+        room["DisplayedSetPoint"] = override["SetPoint"]
+        if override.get("DurationMinutes"):
+            room["SetpointOrigin"] = "FromBoost"
+        elif room["Mode"] == "Manual":
+            room["SetpointOrigin"] = "FromManualMode"
+        else:
+            room["SetpointOrigin"] = "FromManualOverride"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--secret", default="secret")
+    parser.add_argument("--rooms", type=int, default=15)
+    parser.add_argument("--itrvs-per-room", type=int, default=2)
+    parser.add_argument("--roomstats", type=int, default=5)
+    parser.add_argument("--smart-plugs", type=int, default=3)
+    parser.add_argument("--no-hot-water", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--churn", type=float, default=0.1)
+    args = parser.parse_args()
+
+    emulator = WiserHubEmulator.for_house(
+        args.rooms,
+        args.itrvs_per_room,
+        args.roomstats,
+        args.smart_plugs,
+        not args.no_hot_water,
+        secret=args.secret,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        timeout_rate=args.timeout_rate,
+        churn=args.churn,
+    )
+    web.run_app(emulator.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+End-to-end benchmarks for the Wiser integration
+
+Starts the hub emulator, sets the integration up in a local Home Assistant
+instance pointed at it and reports:
+
+ * refresh latency of WiserHubHandle.async_update
+ * per-entity cost of pushing a refresh through the platforms
+ * event loop blocking time while the integration is working
+ * memory held by the integration
+ * schedule service latency
+
+Needs Home Assistant and aiohttp installed, for example
+
+    python benchmarks/run_benchmarks.py --rooms 15 --iterations 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from hub_emulator import WiserHubEmulator  # noqa: E402
+
+DOMAIN = "wiser"
+SECRET = "benchmark"
+
+
+class LoopMonitor:
+    """Measures event loop blocking from the lag of a short periodic timer"""
+
+    def __init__(self, interval=0.005, threshold=0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.worst = 0.0
+        self.stalls = 0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+                self.worst = max(self.worst, lag)
+
+    def start(self):
+        self.blocked = self.worst = 0.0
+        self.stalls = 0
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return {
+            "blocked_ms": round(self.blocked * 1000, 2),
+            "worst_stall_ms": round(self.worst * 1000, 2),
+            "stalls": self.stalls,
+        }
+
+
+def summarise(samples):
+    """mean/p50/p95/max of a list of durations in seconds, in milliseconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "n": len(samples),
+    }
+
+
+async def async_start_hass(config_dir, host):
+    """Start a bare Home Assistant with the integration set up"""
+    from homeassistant import core
+    from homeassistant.setup import async_setup_component
+
+    os.symlink(
+        os.path.join(REPO_DIR, "custom_components"),
+        os.path.join(config_dir, "custom_components"),
+    )
+    sys.path.insert(0, config_dir)
+    try:
+        hass = core.HomeAssistant(config_dir)
+    except TypeError:
+        hass = core.HomeAssistant()
+        hass.config.config_dir = config_dir
+    hass.config.skip_pip = True
+
+    assert await async_setup_component(
+        hass, DOMAIN, {DOMAIN: {"host": host, "password": SECRET}}
+    )
+    # Hub setup and platform loading run as background tasks
+    for _ in range(200):
+        await hass.async_block_till_done()
+        if DOMAIN in hass.data and hass.states.async_entity_ids("climate"):
+            break
+        await asyncio.sleep(0.05)
+    await hass.async_block_till_done()
+    return hass
+
+
+def handles(hass):
+    data = hass.data[DOMAIN]
+    return list(data.values()) if isinstance(data, dict) else [data]
+
+
+async def bench_refresh(hass, emulator, iterations):
+    """Latency of a full hub refresh, fetch through to dispatch"""
+    handle = handles(hass)[0]
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await handle.async_update()
+        samples.append(time.perf_counter() - start)
+    await hass.async_block_till_done()
+    return summarise(samples)
+
+
+async def bench_entity_updates(hass, emulator, iterations, churn):
+    """Cost of pushing a refresh with the given share of rooms changing"""
+    handle = handles(hass)[0]
+    writes = []
+
+    def count_write(event):
+        if event.data.get("entity_id", "").split(".")[0] in (
+            "climate",
+            "sensor",
+            "switch",
+        ):
+            writes.append(event)
+
+    unsub = hass.bus.async_listen("state_changed", count_write)
+    emulator.churn = churn
+    samples = []
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await handle.async_update()
+            await hass.async_block_till_done()
+            samples.append(time.perf_counter() - start)
+    finally:
+        emulator.churn = 0.0
+        unsub()
+
+    entity_count = len(hass.states.async_all())
+    result = summarise(samples)
+    result["entities"] = entity_count
+    result["state_writes_per_refresh"] = round(len(writes) / iterations, 1)
+    if writes:
+        result["per_write_us"] = round(
+            sum(samples) / len(writes) * 1000000, 1
+        )
+    return result
+
+
+async def bench_schedule_services(hass, config_dir):
+    """get_schedule then set_schedule for every room"""
+    get_samples = []
+    set_samples = []
+    for entity_id in hass.states.async_entity_ids("climate"):
+        filename = os.path.join(config_dir, "{}.yaml".format(entity_id))
+        start = time.perf_counter()
+        await hass.services.async_call(
+            DOMAIN,
+            "get_schedule",
+            {"entity_id": entity_id, "filename": filename},
+            blocking=True,
+        )
+        await hass.async_block_till_done()
+        get_samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await hass.services.async_call(
+            DOMAIN,
+            "set_schedule",
+            {"entity_id": entity_id, "filename": filename},
+            blocking=True,
+        )
+        await hass.async_block_till_done()
+        set_samples.append(time.perf_counter() - start)
+    return {"get_schedule": summarise(get_samples), "set_schedule": summarise(set_samples)}
+
+
+async def async_run(args):
+    emulator = WiserHubEmulator.for_house(
+        args.rooms,
+        args.itrvs_per_room,
+        args.roomstats,
+        args.smart_plugs,
+        secret=SECRET,
+        latency=args.latency,
+    )
+    host = await emulator.start()
+    monitor = LoopMonitor()
+    results = {
+        "house": {
+            "rooms": args.rooms,
+            "itrvs_per_room": args.itrvs_per_room,
+            "roomstats": args.roomstats,
+            "smart_plugs": args.smart_plugs,
+            "hub_latency_ms": args.latency * 1000,
+        }
+    }
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        hass = await async_start_hass(config_dir, host)
+        results["setup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        results["memory_after_setup_kb"] = round(
+            (tracemalloc.get_traced_memory()[0] - baseline) / 1024, 1
+        )
+        try:
+            monitor.start()
+            results["refresh_unchanged"] = await bench_refresh(
+                hass, emulator, args.iterations
+            )
+            results["refresh_unchanged"]["loop"] = await monitor.stop()
+
+            for churn in (0.1, 1.0):
+                monitor.start()
+                key = "entity_updates_churn_{}".format(int(churn * 100))
+                results[key] = await bench_entity_updates(
+                    hass, emulator, args.iterations, churn
+                )
+                results[key]["loop"] = await monitor.stop()
+
+            monitor.start()
+            results["schedule_services"] = await bench_schedule_services(
+                hass, config_dir
+            )
+            results["schedule_services"]["loop"] = await monitor.stop()
+
+            current, peak = tracemalloc.get_traced_memory()
+            results["memory_kb"] = round((current - baseline) / 1024, 1)
+            results["memory_peak_kb"] = round((peak - baseline) / 1024, 1)
+            results["hub_requests"] = dict(emulator.requests)
+        finally:
+            tracemalloc.stop()
+            await hass.async_stop()
+            await emulator.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=15)
+    parser.add_argument("--itrvs-per-room", type=int, default=2)
+    parser.add_argument("--roomstats", type=int, default=5)
+    parser.add_argument("--smart-plugs", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Emulated hub response time in seconds")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(async_run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,164 +11,910 @@ import json
 
 # import time
 from datetime import timedelta
+from time import monotonic, time
 
-from wiserHeatingAPI.wiserHub import wiserHub, TEMP_MINIMUM, TEMP_MAXIMUM
 import voluptuous as vol
 
 from homeassistant.const import (
+    ATTR_AREA_ID,
+    ATTR_ENTITY_ID,
     CONF_HOST,
     CONF_MINIMUM,
+    CONF_NAME,
     CONF_PASSWORD,
     CONF_SCAN_INTERVAL,
+    ENTITY_MATCH_ALL,
+    EVENT_HOMEASSISTANT_STOP,
 )
 from homeassistant.core import callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
-from homeassistant.util import Throttle
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.service import async_extract_entity_ids
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
 
 from .const import (
     _LOGGER,
     CONF_BOOST_TEMP,
     CONF_BOOST_TEMP_TIME,
+    CONF_HUB,
+    CONF_NETWORK_DIAGNOSTICS,
     DOMAIN,
     NOTIFICATION_ID,
     NOTIFICATION_TITLE,
+    TEMP_MAXIMUM,
+    TEMP_MINIMUM,
     VERSION,
     WISER_PLATFORMS,
+    update_signal,
 )
+from .api import (
+    WiserHubAPI,
+    WiserHubConnectionError,
+    WiserHubError,
+    room_mode_state,
+    to_wiser_temp,
+)
+from .analytics import HouseAnalytics
+from .battery import (
+    STORAGE_KEY as BATTERY_STORAGE_KEY,
+    STORAGE_VERSION as BATTERY_STORAGE_VERSION,
+    WiserBatteryMonitor,
+)
+from .commands import WiserCommandQueue
+from .events import hub_events
+from .health import HubHealth
+from .history import WiserHistory
+from .metrics import HubMetrics
+from .polling import AdaptivePollPolicy
+from .profiler import WiserProfiler
+from .schedule import CompiledSchedule
+from .snapshot import OptimisticOverlay, WiserHubSnapshot, changed_items
+from .topology import WiserTopology
+from .schedule_io import load_schedule_file, save_document, save_schedules
+from .util import schedule_unchanged, validate_schedule
 
 MIN_TIME_BETWEEN_UPDATES = timedelta(seconds=30)
 
+STORAGE_VERSION = 1
+STORAGE_KEY = "wiser_hub_{}"
+# Minimum time between writes of the warm-start cache
+CACHE_SAVE_INTERVAL = timedelta(minutes=15)
+
+# Shortest wait before retrying setup, so an almost expired backoff cannot spin
+MIN_SETUP_RETRY = 1
+
+ATTR_DURATION = "duration"
+ATTR_FILENAME = "filename"
+ATTR_HOURS = "hours"
+ATTR_SERIES = "series"
+
+EVENT_SCHEDULES_UPDATED = "wiser_schedules_updated"
+EVENT_METRICS = "wiser_metrics"
+EVENT_HISTORY = "wiser_history"
+
+SERVICE_EXPORT_SCHEDULES = "export_schedules"
+SERVICE_IMPORT_SCHEDULES = "import_schedules"
+SERVICE_DUMP_METRICS = "dump_metrics"
+SERVICE_PROFILE = "profile"
+SERVICE_QUERY_HISTORY = "query_history"
+
+EXPORT_SCHEDULES_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_FILENAME, default="wiser_schedules.yaml"): cv.string,
+        vol.Optional(CONF_HUB): cv.string,
+    }
+)
+
+IMPORT_SCHEDULES_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_FILENAME): cv.string,
+        vol.Optional(CONF_HUB): cv.string,
+    }
+)
+
+DUMP_METRICS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_FILENAME): cv.string,
+        vol.Optional(CONF_HUB): cv.string,
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_DURATION, default=60): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=3600)
+        ),
+        vol.Optional(ATTR_FILENAME, default="wiser_profile.txt"): cv.string,
+    }
+)
+
+
+def wiser_service_schema(fields):
+    """Schema for a service aimed at entities by entity_id and/or area_id"""
+    return vol.All(
+        vol.Schema(
+            {
+                vol.Optional(ATTR_ENTITY_ID): cv.comp_entity_ids,
+                vol.Optional(ATTR_AREA_ID): vol.All(cv.ensure_list, [cv.string]),
+                **fields,
+            }
+        ),
+        cv.has_at_least_one_key(ATTR_ENTITY_ID, ATTR_AREA_ID),
+    )
+
+
+QUERY_HISTORY_SCHEMA = wiser_service_schema(
+    {
+        vol.Optional(ATTR_HOURS, default=24): vol.All(
+            vol.Coerce(float), vol.Range(min=0, min_included=False)
+        ),
+        vol.Optional(ATTR_SERIES): vol.All(cv.ensure_list, [cv.string]),
+    }
+)
+
 PLATFORM_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_HOST): cv.string,
         vol.Optional(CONF_PASSWORD): cv.string,
+        vol.Optional(CONF_NAME): cv.string,
         vol.Optional(CONF_SCAN_INTERVAL, default=0): cv.time_period,
         vol.Optional(CONF_MINIMUM, default=TEMP_MINIMUM): vol.All(vol.Coerce(int)),
         vol.Optional(CONF_BOOST_TEMP, default=2): vol.All(vol.Coerce(int)),
         vol.Optional(CONF_BOOST_TEMP_TIME, default=30): vol.All(vol.Coerce(int)),
+        vol.Optional(CONF_NETWORK_DIAGNOSTICS, default=True): cv.boolean,
     }
 )
 
 
 async def async_setup(hass, config):
+    hubs = config[DOMAIN]
+    hass.data[DOMAIN] = {}
+
+    for hub_config in hubs:
+        name = hub_config.get(CONF_NAME)
+        if name is None and len(hubs) > 1:
+            # Keep entity names apart when several hubs are configured
+            name = hub_config[CONF_HOST]
+        data = WiserHubHandle(hass, hub_config, name)
+        if data.hub_id in hass.data[DOMAIN]:
+            _LOGGER.error("Wiser Hub {} is configured twice".format(data.hub_id))
+            continue
+        hass.data[DOMAIN][data.hub_id] = data
+        # Each hub connects, polls and retries on its own
+        hass.async_create_task(async_setup_hub(hass, config, data))
+
+    async def async_close_hubs(event):
+        for data in hass.data[DOMAIN].values():
+            data.async_stop_polling()
+            data.commands.async_cancel()
+            await data.async_save_cache()
+            await data.wiserhub.async_close()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_hubs)
+
+    async def async_export_schedules(service):
+        """Write every schedule of a hub to one file"""
+        data = get_hub(hass, service.data.get(CONF_HUB))
+        filename = hass.config.path(service.data[ATTR_FILENAME])
+        # Conversion and writing both happen off the event loop
+        await hass.async_add_executor_job(save_schedules, filename, data.snapshot)
+        _LOGGER.info("Wiser schedules saved to {}".format(filename))
+
+    async def async_import_schedules(service):
+        """Set every schedule in a file written by export_schedules"""
+        data = get_hub(hass, service.data.get(CONF_HUB))
+        filename = hass.config.path(service.data[ATTR_FILENAME])
+        document = await hass.async_add_executor_job(load_schedule_file, filename)
+        await data.async_import_schedules(document)
+
+    async def async_dump_metrics(service):
+        """Fire the metrics of one or every hub as events, and save them to a
+        json or yaml file if a filename is given"""
+        if CONF_HUB in service.data:
+            hubs = [get_hub(hass, service.data[CONF_HUB])]
+        else:
+            hubs = list(hass.data[DOMAIN].values())
+        document = {}
+        for data in hubs:
+            metrics = data.metrics.as_dict()
+            document[data.hub_id] = metrics
+            hass.bus.async_fire(EVENT_METRICS, dict(metrics, hub=data.hub_id))
+        if ATTR_FILENAME in service.data:
+            filename = hass.config.path(service.data[ATTR_FILENAME])
+            await hass.async_add_executor_job(save_document, filename, document)
+            _LOGGER.info("Wiser metrics saved to {}".format(filename))
+
+    profiler = WiserProfiler(hass)
+
+    @callback
+    def async_profile(service):
+        """Profile the component for a while and write a report"""
+        profiler.async_start(
+            service.data[ATTR_DURATION],
+            hass.config.path(service.data[ATTR_FILENAME]),
+        )
 
-    host = config[DOMAIN][0][CONF_HOST]
-    secret = config[DOMAIN][0][CONF_PASSWORD]
-    scan_interval = config[DOMAIN][0][CONF_SCAN_INTERVAL]
+    async def async_query_history(service):
+        """Fire a wiser_history event summarising the recent history of each
+        targeted entity"""
+        hours = service.data[ATTR_HOURS]
+        names = service.data.get(ATTR_SERIES)
+        since = time() - hours * 3600
+        for entity in await async_extract_wiser_entities(hass, service, object):
+            if not hasattr(entity, "history_keys"):
+                continue
+            history = []
+            for section, item_id in entity.history_keys():
+                series = entity.data.history.query(section, item_id, since, names)
+                for summary in series.values():
+                    for key in ("first", "last"):
+                        if key in summary:
+                            summary[key] = dt_util.utc_from_timestamp(
+                                summary[key]
+                            ).isoformat()
+                history.append({"type": section, "id": item_id, "series": series})
+            hass.bus.async_fire(
+                EVENT_HISTORY,
+                {ATTR_ENTITY_ID: entity.entity_id, ATTR_HOURS: hours, "history": history},
+            )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_EXPORT_SCHEDULES,
+        async_export_schedules,
+        schema=EXPORT_SCHEDULES_SCHEMA,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_IMPORT_SCHEDULES,
+        async_import_schedules,
+        schema=IMPORT_SCHEDULES_SCHEMA,
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_DUMP_METRICS, async_dump_metrics, schema=DUMP_METRICS_SCHEMA,
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_QUERY_HISTORY,
+        async_query_history,
+        schema=QUERY_HISTORY_SCHEMA,
+    )
+    return True
+
+
+def get_hub(hass, hub_id=None):
+    """Return the handle for hub_id, or for the only hub if there is one"""
+    hubs = hass.data[DOMAIN]
+    if hub_id is None and len(hubs) == 1:
+        data = next(iter(hubs.values()))
+    elif hub_id is None:
+        raise HomeAssistantError(
+            "Several Wiser hubs are set up, say which one with hub"
+        )
+    else:
+        data = hubs.get(hub_id)
+        if data is None:
+            raise HomeAssistantError("No Wiser hub called {}".format(hub_id))
+    if data.snapshot is None:
+        raise HomeAssistantError("Wiser hub {} is not set up yet".format(data.hub_id))
+    return data
 
-    if scan_interval > timedelta(0):
-        MIN_TIME_BETWEEN_UPDATES = scan_interval
 
+def wiser_entity(hass, entity_id):
+    """The Wiser entity with entity_id on any hub, or None"""
+    for data in hass.data[DOMAIN].values():
+        entity = data.entities.get(entity_id)
+        if entity is not None:
+            return entity
+    return None
+
+
+async def async_extract_wiser_entities(hass, service, entity_type):
+    """Wiser entities of entity_type targeted by a service call"""
+    entity_ids = await async_extract_entity_ids(hass, service)
+    if ENTITY_MATCH_ALL in entity_ids:
+        return [
+            entity
+            for data in hass.data[DOMAIN].values()
+            for entity in data.entities.values()
+            if isinstance(entity, entity_type)
+        ]
+    entities = (wiser_entity(hass, entity_id) for entity_id in sorted(entity_ids))
+    return [entity for entity in entities if isinstance(entity, entity_type)]
+
+
+async def async_setup_hub(hass, config, data):
+    """Connect to one hub and load the platforms for it"""
     _LOGGER.info(
         "Wiser setup with Hub IP =  {} and scan interval of {}".format(
-            host, MIN_TIME_BETWEEN_UPDATES
+            data.ip, data.poll_policy.base_interval
         )
     )
 
-    data = WiserHubHandle(hass, config, host, secret)
-
     @callback
     def retryWiserHubSetup():
         hass.async_create_task(wiserHubSetup())
+
+    @callback
+    def loadWiserPlatforms():
+        for component in WISER_PLATFORMS:
+            hass.async_create_task(
+                async_load_platform(
+                    hass, component, DOMAIN, {CONF_HUB: data.hub_id}, config
+                )
+            )
+
+        # One poll loop for the whole hub, entities are pushed updates
+        data.async_start_polling()
     
     async def wiserHubSetup():
-        _LOGGER.info("Initiating WiserHub connection")
+        if data.health.waiting:
+            # Nothing would be sent yet, wait out the rest of the backoff
+            await scheduleWiserHubSetup(attempted=False)
+            return True
+        _LOGGER.info("Initiating WiserHub connection to {}".format(data.ip))
         try:
-            if await data.async_update(no_throttle=True):
-                if data.wiserhub.getDevices is None:
+            if await data.async_update():
+                if not data.snapshot.devices:
                     _LOGGER.error("No Wiser devices found to set up")
                     return False
             
-                hass.data[DOMAIN] = data
+                loadWiserPlatforms()
             
-                for component in WISER_PLATFORMS:
-                    hass.async_create_task(async_load_platform(hass, component, DOMAIN, {}, config))
-            
-                _LOGGER.info("Wiser Component Setup Completed")
+                _LOGGER.info("Wiser Component Setup Completed for {}".format(data.ip))
                 return True
             else:
                 await scheduleWiserHubSetup()
                 return True
-        except (asyncio.TimeoutError) as ex:
+        except WiserHubError:
             await scheduleWiserHubSetup()
             return True
     
-    async def scheduleWiserHubSetup(interval = 30):
-        _LOGGER.error(
-            "Unable to connect to the Wiser Hub, retrying in {} seconds".format(interval)
-        )
+    async def scheduleWiserHubSetup(attempted=True):
+        # Back off while the hub stays unreachable rather than retrying at a fixed rate
+        interval = max(MIN_SETUP_RETRY, data.health.retry_delay())
+        if attempted:
+            _LOGGER.error(
+                "Unable to connect to the Wiser Hub {}, "
+                "retrying in {:.0f} seconds".format(data.ip, interval)
+            )
+        else:
+            _LOGGER.debug(
+                "Wiser Hub {} unavailable, retrying setup in {:.1f} seconds".format(
+                    data.ip, interval
+                )
+            )
         hass.loop.call_later(interval, retryWiserHubSetup)
+
+    await data.batteries.async_load()
+
+    # Start from the last hub data we saw so the entities exist straight away,
+    # the live refresh then replaces it in the background
+    if await data.async_load_cache() and data.snapshot.devices:
+        _LOGGER.info(
+            "Wiser Hub {} set up from cached data, refreshing from the hub".format(
+                data.ip
+            )
+        )
+        loadWiserPlatforms()
+        hass.async_create_task(data.async_update())
         return
         
-    hass.async_create_task(wiserHubSetup())
-    return True
-        
-
+    await wiserHubSetup()
 
 
 class WiserHubHandle:
-    def __init__(self, hass, config, ip, secret):
+    def __init__(self, hass, config, name=None):
         self._hass = hass
         self._config = config
-        self.ip = ip
-        self.secret = secret
-        self.wiserhub = wiserHub(self.ip, self.secret)
+        self.ip = config[CONF_HOST]
+        self.secret = config.get(CONF_PASSWORD)
+        self.name = name
+        self.hub_id = name or self.ip
+        # Refresh and write timings, counts and errors, see metrics.py
+        self.metrics = HubMetrics()
+        self.wiserhub = WiserHubAPI(self.ip, self.secret, metrics=self.metrics)
+        self.health = HubHealth()
+        # Sampled values of the last few days, see history.py
+        self.history = WiserHistory()
+        # Battery voltage trends, kept between restarts, see battery.py
+        self.batteries = WiserBatteryMonitor(
+            Store(
+                hass,
+                BATTERY_STORAGE_VERSION,
+                BATTERY_STORAGE_KEY.format(slugify(self.hub_id)),
+            )
+        )
+        self._store = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY.format(slugify(self.hub_id))
+        )
+        self._cache_saved = None
+        # True while the snapshot comes from the cache rather than the hub
+        self.stale = False
+        # Last hub data as fetched, and as shown with pending writes applied
+        self._hub_snapshot = None
+        self.snapshot = None
+        self._overlay = OptimisticOverlay()
+        # Zigbee mesh routes and link quality, see topology.py
+        self.topology = WiserTopology()
+        # Whole-house figures for the current snapshot, see analytics.py
+        self.analytics = None
+        # Compiled schedules by schedule id, dropped when a schedule changes
+        self._compiled_schedules = {}
         self.minimum_temp = TEMP_MINIMUM
         self.maximum_temp = TEMP_MAXIMUM
-        self.boost_temp = self._config[DOMAIN][0][CONF_BOOST_TEMP]
-        self.boost_time = self._config[DOMAIN][0][CONF_BOOST_TEMP_TIME]
+        self.boost_temp = self._config[CONF_BOOST_TEMP]
+        self.boost_time = self._config[CONF_BOOST_TEMP_TIME]
+        self.network_diagnostics = self._config[CONF_NETWORK_DIAGNOSTICS]
+        self._pending_update = None
+        self._unsub_poll = None
+        self._polling = False
+        scan_interval = self._config[CONF_SCAN_INTERVAL]
+        self.poll_policy = AdaptivePollPolicy(
+            scan_interval
+            if scan_interval > timedelta(0)
+            else MIN_TIME_BETWEEN_UPDATES
+        )
+        self.poll_interval = self.poll_policy.base_interval
+        self.poll_mode = None
+        # entity_id -> entity for this hub's entities, used by the services
+        self.entities = {}
+        # Writes are coalesced and followed by a single refresh per batch
+        self.commands = WiserCommandQueue(hass, self.async_update)
+
+    @property
+    def available(self):
+        """False while the hub is not answering, entities use this directly"""
+        return self.health.available
+
+    async def async_load_cache(self):
+        """Load the last saved hub data as a stale snapshot"""
+        try:
+            cache = await self._store.async_load()
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to read Wiser Hub cache: {}".format(ex))
+            return False
+        if not cache or cache.get("host") != self.ip:
+            return False
+        self._hub_snapshot = WiserHubSnapshot(cache["hub_data"])
+        self.stale = True
+        self._async_publish()
+        return True
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
-    async def async_update(self):
+    async def async_save_cache(self):
+        """Save the live hub data for the next start"""
+        if self._hub_snapshot is None or self.stale:
+            return
+        self._cache_saved = monotonic()
+        await self._store.async_save(
+            {"host": self.ip, "hub_data": self._hub_snapshot.compact()}
+        )
+
+    def compiled_schedule(self, schedule_id):
+        """Return the CompiledSchedule for a schedule id, or None"""
+        compiled = self._compiled_schedules.get(schedule_id)
+        if compiled is None:
+            schedule = self.snapshot.schedules.get(schedule_id)
+            if schedule is None:
+                return None
+            compiled = self._compiled_schedules[schedule_id] = CompiledSchedule(
+                schedule
+            )
+        return compiled
+
+    def entity_name(self, name):
+        """Entity name, including the hub name when there is one"""
+        if self.name:
+            return "Wiser {} {}".format(self.name, name)
+        return "Wiser {}".format(name)
+
+    def unique_id(self, *parts):
+        return "-".join(str(part) for part in (DOMAIN, self.hub_id) + parts)
+
+    def signal(self, section=None, item_id=None):
+        """Dispatcher signal for this hub"""
+        return update_signal(self.hub_id, section, item_id)
+
+    @callback
+    def async_start_polling(self):
+        """Start the single poll loop that feeds every Wiser entity"""
+        self._polling = True
+        self._async_schedule_poll()
+
+    @callback
+    def async_stop_polling(self):
+        self._polling = False
+        if self._unsub_poll is not None:
+            self._unsub_poll()
+            self._unsub_poll = None
+
+    @callback
+    def _async_schedule_poll(self):
+        """(Re)schedule the next poll using the adaptive poll policy"""
+        if not self._polling:
+            return
+        if self._unsub_poll is not None:
+            self._unsub_poll()
+        if self.health.available:
+            interval, mode = self.poll_policy.interval(self.snapshot)
+        else:
+            # The next poll is the probe that checks whether the hub is back
+            interval = timedelta(seconds=self.health.retry_delay())
+            mode = self.health.state
+        if interval != self.poll_interval or mode != self.poll_mode:
+            _LOGGER.debug(
+                "Wiser Hub poll interval now {} ({})".format(interval, mode)
+            )
+            self.poll_interval = interval
+            self.poll_mode = mode
+            async_dispatcher_send(self._hass, self.signal("Polling"))
+        self._unsub_poll = async_call_later(
+            self._hass, interval.total_seconds(), self._async_poll
+        )
+
+    async def _async_poll(self, now=None):
+        self._unsub_poll = None
+        await self.async_update(scheduled=True)
+
+    async def async_update(self, scheduled=False):
+        """
+        Fetch the hub data once and push it to all subscribed entities.
+
+        Callers arriving while a fetch is already in flight share its result
+        rather than starting another request to the hub. scheduled is only
+        set by the poll timer, anything else counts as a forced refresh.
+        """
+        self.metrics.count("refresh_scheduled" if scheduled else "refresh_forced")
+        if self._pending_update is not None:
+            self.metrics.count("refresh_shared")
+        else:
+            self._pending_update = self._hass.async_create_task(
+                self._async_fetch()
+            )
+        pending = self._pending_update
+        try:
+            return await pending
+        finally:
+            if self._pending_update is pending:
+                self._pending_update = None
+                # Any refresh, polled or forced, restarts the poll timer
+                self._async_schedule_poll()
+
+    async def _async_fetch(self):
+        try:
+            return await self._async_fetch_hub_data()
+        finally:
+            async_dispatcher_send(self._hass, self.signal("Metrics"))
+
+    async def _async_fetch_hub_data(self):
+        if not self.health.allow_request():
+            self.metrics.count("refresh_skipped")
+            _LOGGER.debug(
+                "Wiser Hub {} unavailable, next attempt in {:.0f}s".format(
+                    self.hub_id, self.health.retry_delay()
+                )
+            )
+            return False
         _LOGGER.info("**Update of Wiser Hub data requested**")
         try:
-            result = await self._hass.async_add_executor_job(self.wiserhub.refreshData)
+            with self.metrics.timer("fetch_ms"):
+                result = await self.wiserhub.get_hub_data()
             if result is not None:
                 _LOGGER.info("**Wiser Hub data updated**")
+                with self.metrics.timer("publish_ms"):
+                    hub_snapshot = WiserHubSnapshot(result)
+                    self._overlay.reconcile(hub_snapshot)
+                    previous = self._hub_snapshot
+                    self._hub_snapshot = hub_snapshot
+                    recovered = self.health.record_success()
+                    was_stale = self.stale
+                    self.stale = False
+                    self._async_publish()
+                    if previous is not None and not was_stale:
+                        # Cached data may be hours old, only live changes fire
+                        self._async_fire_events(previous, hub_snapshot)
+                    self.history.record(hub_snapshot, time())
+                    if self.batteries.record(hub_snapshot, time()):
+                        async_dispatcher_send(self._hass, self.signal("Battery"))
+                if recovered:
+                    _LOGGER.warning("Wiser Hub {} is available again".format(self.hub_id))
+                if recovered or was_stale:
+                    async_dispatcher_send(self._hass, self.signal())
+                if (
+                    self._cache_saved is None
+                    or monotonic() - self._cache_saved
+                    > CACHE_SAVE_INTERVAL.total_seconds()
+                ):
+                    self._hass.async_create_task(self.async_save_cache())
                 return True
             else:
                 _LOGGER.info("**Unable to update from wiser hub**")
+                self.metrics.count("error_no_data")
+                self._async_record_failure("No data returned")
                 return False
+        except WiserHubConnectionError as ex:
+            _LOGGER.info("**Unable to update from wiser hub** {}".format(ex))
+            self.metrics.count("error_connection")
+            self._async_record_failure(ex)
+            return False
+        except WiserHubError as ex:
+            # Reachable but refusing, e.g. a bad secret or a rebooting hub
+            _LOGGER.warning("**Wiser hub returned an error** {}".format(ex))
+            self.metrics.count("error_hub")
+            self._async_record_failure(ex)
+            return False
         except json.decoder.JSONDecodeError as JSONex:
             _LOGGER.error(
                 "Data not JSON when getting Data from hub, "
                 + "did you enter the right URL? error {}".format(str(JSONex))
             )
-            self.hass.components.persistent_notification.create(
-                "Error: {}"
-                + "<br /> You will need to restart Home Assistant "
-                + " after fixing.".format(JSONex),
+            self._hass.components.persistent_notification.async_create(
+                "Error: {}<br /> You will need to restart Home Assistant "
+                "after fixing.".format(JSONex),
                 title=NOTIFICATION_TITLE,
                 notification_id=NOTIFICATION_ID,
             )
+            self.metrics.count("error_json")
+            self._async_record_failure(JSONex)
             return False
 
+    @callback
+    def _async_record_failure(self, error):
+        if self.health.record_failure(error):
+            _LOGGER.warning(
+                "Wiser Hub {} is not responding, marking it unavailable "
+                "and retrying in {:.0f}s: {}".format(
+                    self.hub_id, self.health.retry_delay(), error
+                )
+            )
+            async_dispatcher_send(self._hass, self.signal())
+
+    @callback
+    def _async_fire_events(self, previous, hub_snapshot):
+        """Fire a wiser_* event for each change the hub reported, see events.py"""
+        for event_type, event_data in hub_events(previous, hub_snapshot):
+            event_data["hub"] = self.hub_id
+            _LOGGER.debug("Firing {} {}".format(event_type, event_data))
+            self.metrics.count("events")
+            self._hass.bus.async_fire(event_type, event_data)
+
+    @callback
+    def _async_publish(self):
+        """
+        Lay pending writes over the hub data and notify the entities whose
+        hub objects changed since the last snapshot they were given.
+        """
+        previous = self.snapshot
+        self.snapshot = self._overlay.apply(self._hub_snapshot)
+        if previous is None:
+            self._compiled_schedules.clear()
+            self.analytics = HouseAnalytics(self.snapshot)
+            self.topology.update(self.snapshot, time())
+            async_dispatcher_send(self._hass, self.signal())
+            return
+        changed = changed_items(previous, self.snapshot)
+        self.metrics.count("objects_changed", len(changed))
+        _LOGGER.debug("Wiser Hub objects changed: {}".format(changed))
+        if any(section in ("Room", "HeatingChannel") for section, _ in changed):
+            self.analytics = HouseAnalytics(self.snapshot)
+            async_dispatcher_send(self._hass, self.signal("Analytics"))
+        devices = [
+            item_id
+            for section, item_id in changed
+            if section == "Device" and item_id is not None
+        ]
+        if devices:
+            # Before the device signals, their sensors read the new links
+            self.topology.update(self.snapshot, time(), devices)
+            async_dispatcher_send(self._hass, self.signal("Topology"))
+        for section, item_id in changed:
+            if section == "Schedule":
+                self._compiled_schedules.pop(item_id, None)
+            async_dispatcher_send(self._hass, self.signal(section, item_id))
+
+    async def _async_write(
+        self, key, write, section=None, item_id=None, values=None, replaces_item=False
+    ):
+        """
+        Queue a hub write, showing the values it should produce straight away.
+
+        The values stay in the overlay until a refresh confirms them, they are
+        dropped at once if the write itself fails. Writes to a hub that is
+        not answering fail straight away. A write that replaces_item, such as
+        a room mode change, drops the overlay values of earlier writes to it.
+        """
+        if not self.health.available:
+            raise WiserHubConnectionError(
+                "Wiser Hub {} is unavailable".format(self.hub_id)
+            )
+        self.poll_policy.command_sent()
+        entry = None
+        if values is not None:
+            entry = self._overlay.add(key, section, item_id, values, replaces_item)
+            self._async_publish()
+
+        async def command():
+            self.metrics.count("writes")
+            try:
+                with self.metrics.timer("write_{}_ms".format(key[0].lower())):
+                    result = await write()
+            except Exception as ex:
+                self.metrics.count("error_write")
+                if entry is not None:
+                    self._overlay.discard(key, entry)
+                    self._async_publish()
+                if isinstance(ex, WiserHubConnectionError):
+                    self._async_record_failure(ex)
+                raise
+            if entry is not None:
+                self._overlay.mark_sent(entry)
+            return result
+
+        return await self.commands.async_send(key, command)
+
     async def set_away_mode(self, away, away_temperature):
         mode = "AWAY" if away else "HOME"
-        if self.wiserhub is None:
-            self.wiserhub = wiserHub(self.ip, self.secret)
         _LOGGER.debug(
             "Setting away mode to {} with temp {}.".format(mode, away_temperature)
         )
         try:
-            self.wiserhub.setHomeAwayMode(mode, away_temperature)
-            await self.async_update(no_throttle=True)
+            await self._async_write(
+                ("System", "RequestOverride"),
+                lambda: self.wiserhub.set_home_away_mode(mode, away_temperature),
+                "System",
+                None,
+                {"OverrideType": "Away" if away else "None"},
+            )
         except BaseException as e:
             _LOGGER.debug("Error setting away mode! {}".format(str(e)))
 
     async def set_system_switch(self, switch, mode):
-        if self.wiserhub is None:
-            self.wiserhub = wiserHub(self.ip, self.secret)
         _LOGGER.debug(
             "Setting {} system switch to {}.".format(switch, "on" if mode else "off")
         )
         try:
-            self.wiserhub.setSystemSwitch(switch, mode)
-            await self.async_update(no_throttle=True)
+            await self._async_write(
+                ("System", switch),
+                lambda: self.wiserhub.set_system_switch(switch, mode),
+                "System",
+                None,
+                {switch: mode},
+            )
         except BaseException as e:
             _LOGGER.debug("Error setting {} system switch! {}".format(switch, str(e)))
 
+    async def set_room_temperature(self, room_id, temperature):
+        # Separate keys from mode writes, so neither replaces the other
+        set_point = to_wiser_temp(temperature)
+        await self._async_write(
+            ("Room", room_id, "SetPoint"),
+            lambda: self.wiserhub.set_room_temperature(room_id, temperature),
+            "Room",
+            room_id,
+            {"CurrentSetPoint": set_point, "DisplayedSetPoint": set_point},
+        )
+
+    async def set_room_mode(self, room_id, mode, boost_temp, boost_time):
+        scheduled_set_point = self._hub_snapshot.room(room_id).get(
+            "ScheduledSetPoint"
+        )
+        await self._async_write(
+            ("Room", room_id, "Mode"),
+            lambda: self.wiserhub.set_room_mode(
+                room_id, mode, boost_temp, boost_time, scheduled_set_point
+            ),
+            "Room",
+            room_id,
+            room_mode_state(mode, boost_temp, scheduled_set_point),
+            replaces_item=True,
+        )
+
+    async def set_schedule(self, schedule_id, schedule_data):
+        """Returns False, without writing, if the hub already has the schedule"""
+        key = ("Schedule", schedule_id)
+        current = self._hub_snapshot.schedules.get(schedule_id)
+        # A queued write for the schedule may be about to change it
+        if (
+            current is not None
+            and not self.commands.is_queued(key)
+            and schedule_unchanged(current, schedule_data)
+        ):
+            _LOGGER.debug("Schedule {} is unchanged, not sending it".format(schedule_id))
+            return False
+        await self._async_write(
+            key, lambda: self.wiserhub.set_schedule(schedule_id, schedule_data),
+        )
+        return True
+
+    async def async_set_schedules(self, schedules):
+        """
+        Send {name: (schedule_id, hub schedule)} together, skipping those the
+        hub already has.
+
+        Returns, and fires as a wiser_schedules_updated event, a report of
+        the names changed, skipped and failed with their error.
+        """
+        names = list(schedules)
+        results = await asyncio.gather(
+            *(self.set_schedule(*schedules[name]) for name in names),
+            return_exceptions=True,
+        )
+        report = {"changed": [], "skipped": [], "failed": {}}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                report["failed"][name] = str(result)
+            elif result:
+                report["changed"].append(name)
+            else:
+                report["skipped"].append(name)
+        _LOGGER.info(
+            "Wiser schedules changed: {}, unchanged: {}, failed: {}".format(
+                report["changed"], report["skipped"], report["failed"]
+            )
+        )
+        self._hass.bus.async_fire(
+            EVENT_SCHEDULES_UPDATED, {"hub": self.hub_id, **report}
+        )
+        return report
+
+    async def async_import_schedules(self, document):
+        """
+        Set the schedules in an export_schedules document.
+
+        Everything is converted and checked before anything is sent, the
+        writes then go out back-to-back through the command queue with one
+        refresh at the end. Schedules the hub already has are skipped,
+        returns the report from async_set_schedules.
+        """
+        snapshot = self.snapshot
+        targets = []
+        for section, items, schedule_type in (
+            ("Rooms", snapshot.rooms.values(), "Heating"),
+            ("SmartPlugs", snapshot.smart_plugs.values(), "OnOff"),
+        ):
+            by_name = {str(item.get("Name")).lower(): item for item in items}
+            for name, schedule in (document.get(section) or {}).items():
+                item = by_name.get(str(name).lower())
+                if item is None or item.get("ScheduleId") is None:
+                    _LOGGER.warning(
+                        "No Wiser {} called {}, its schedule is skipped".format(
+                            section, name
+                        )
+                    )
+                    continue
+                targets.append((name, item["ScheduleId"], schedule, schedule_type))
+        if document.get("HotWater"):
+            for hot_water in snapshot.hot_water.values():
+                targets.append(
+                    (
+                        "HotWater",
+                        hot_water.get("ScheduleId"),
+                        document["HotWater"],
+                        "OnOff",
+                    )
+                )
+                break
+
+        writes = {}
+        for name, schedule_id, schedule, schedule_type in targets:
+            try:
+                writes[name] = (
+                    schedule_id,
+                    validate_schedule({"Type": schedule_type, **schedule}),
+                )
+            except (AttributeError, KeyError, TypeError, ValueError) as ex:
+                raise HomeAssistantError(
+                    "Schedule for {} is not valid: {}".format(name, ex)
+                )
+
+        return await self.async_set_schedules(writes)
 
     async def set_smart_plug_state(self, plug_id, state):
         """
@@ -177,37 +923,51 @@ class WiserHubHandle:
         :param state: Can be On or Off
         :return:
         """
-        if self.wiserhub is None:
-            self.wiserhub = wiserHub(self.ip, self.secret)
         _LOGGER.info(
             "Setting SmartPlug {} to {} ".format(plug_id, state))
 
         try:
-            self.wiserhub.setSmartPlugState(plug_id,state)
-            # Add small delay to allow hub to update status before refreshing
-            await asyncio.sleep(0.5)
-            await self.async_update(no_throttle=True)
-
+            await self._async_write(
+                ("SmartPlug", plug_id),
+                lambda: self.wiserhub.set_smart_plug_state(plug_id, state),
+                "SmartPlug",
+                plug_id,
+                {"OutputState": state.title()},
+            )
         except BaseException as e:
             _LOGGER.debug("Error setting SmartPlug {} to {}, error {}".format(plug_id, state, str(e)))
 
+    async def set_smart_plug_mode(self, plug_id, mode):
+        await self._async_write(
+            ("SmartPlugMode", plug_id),
+            lambda: self.wiserhub.set_smart_plug_mode(plug_id, mode),
+            "SmartPlug",
+            plug_id,
+            {"Mode": mode.title()},
+        )
+
     async def set_hotwater_mode(self, hotwater_mode):
         """
-
+        Set hot water on, off or back to auto (schedule)
         """
-        if self.wiserhub is None:
-            self.wiserhub = wiserHub(self.ip, self.secret)
         _LOGGER.info(
             "Setting Hotwater to {} ".format(hotwater_mode))
-        # Add small delay to allow hub to update status before refreshing
-        await asyncio.sleep(0.5)
-        await self.async_update(no_throttle=True)
-
+        # Auto follows the schedule, so there is no state to show up front
+        states = {"on": "On", "off": "Off"}
         try:
-            self.wiserhub.setHotwaterMode(hotwater_mode)
-
-
+            for hotwater_id in self.snapshot.hot_water:
+                state = states.get(hotwater_mode.lower())
+                await self._async_write(
+                    ("HotWater", hotwater_id),
+                    lambda: self.wiserhub.set_hotwater_mode(
+                        hotwater_id, hotwater_mode
+                    ),
+                    "HotWater",
+                    hotwater_id,
+                    {"WaterHeatingState": state} if state else None,
+                )
+                break
         except BaseException as e:
             _LOGGER.debug(
                 "Error setting Hotwater Mode to  {}, error {}".format(hotwater_mode,
-                                                                    str(e)))
\ No newline at end of file
+                                                                    str(e)))
@@ -0,0 +1,106 @@
+"""
+Whole-house heating figures
+
+Worked out once whenever room or heating channel data changes, rather than
+by each entity on every property read. The rooms are first laid out as
+columns, parallel arrays of temperature, setpoint and demand, and the house
+and each heating channel are then a single pass over their rooms' indexes.
+"""
+from array import array
+
+from .util import WISER_OFF
+
+# Hub temperatures outside this range, in tenths, are not real readings
+TEMP_MIN_VALID = -199
+TEMP_MAX_VALID = 999
+# Stored for a room without a real reading
+NO_TEMPERATURE = TEMP_MIN_VALID - 1
+
+
+class RoomColumns:
+    """Room data of one snapshot as parallel arrays"""
+
+    __slots__ = ("index", "names", "temperatures", "setpoints", "demands", "calling")
+
+    def __init__(self, rooms):
+        self.index = {}
+        self.names = []
+        self.temperatures = array("h")
+        self.setpoints = array("h")
+        self.demands = array("h")
+        self.calling = array("b")
+        for room_id, room in rooms.items():
+            self.index[room_id] = len(self.names)
+            self.names.append(room.get("Name"))
+            temperature = room.get("CalculatedTemperature")
+            if (
+                temperature is None
+                or not TEMP_MIN_VALID <= temperature <= TEMP_MAX_VALID
+            ):
+                temperature = NO_TEMPERATURE
+            self.temperatures.append(int(temperature))
+            self.setpoints.append(room.get("CurrentSetPoint") or WISER_OFF)
+            demand = room.get("PercentageDemand") or 0
+            self.demands.append(demand)
+            self.calling.append(
+                room.get("ControlOutputState") == "On" or demand > 0
+            )
+
+    def aggregate(self, indexes):
+        """House figures over the rooms at indexes"""
+        temperatures = self.temperatures
+        setpoints = self.setpoints
+        demands = self.demands
+        rooms = demand_total = 0
+        temperature_count = temperature_total = weighted_total = weight = 0
+        calling = []
+        below = {}
+        for index in indexes:
+            rooms += 1
+            demand = demands[index]
+            demand_total += demand
+            if self.calling[index]:
+                calling.append(self.names[index])
+            temperature = temperatures[index]
+            if temperature == NO_TEMPERATURE:
+                continue
+            temperature_count += 1
+            temperature_total += temperature
+            weighted_total += temperature * demand
+            weight += demand
+            setpoint = setpoints[index]
+            if setpoint != WISER_OFF and temperature < setpoint:
+                below[self.names[index]] = round((setpoint - temperature) / 10, 1)
+        return {
+            "rooms": rooms,
+            "heat_demand": round(demand_total / rooms, 1) if rooms else None,
+            "mean_temperature": round(temperature_total / temperature_count / 10, 1)
+            if temperature_count
+            else None,
+            "demand_weighted_temperature": round(weighted_total / weight / 10, 1)
+            if weight
+            else None,
+            "rooms_calling_for_heat": calling,
+            "rooms_below_setpoint": below,
+        }
+
+
+class HouseAnalytics:
+    """Figures for the whole house and each heating channel of a snapshot"""
+
+    __slots__ = ("house", "channels")
+
+    def __init__(self, snapshot):
+        columns = RoomColumns(snapshot.rooms)
+        self.house = columns.aggregate(range(len(columns.names)))
+        self.channels = {}
+        for channel_id, channel in snapshot.heating_channels.items():
+            figures = columns.aggregate(
+                columns.index[room_id]
+                for room_id in channel.get("RoomIds") or []
+                if room_id in columns.index
+            )
+            figures["name"] = channel.get("Name")
+            figures["percentage_demand"] = channel.get("PercentageDemand")
+            figures["relay_state"] = channel.get("HeatingRelayState")
+            self.channels[channel_id] = figures
@@ -0,0 +1,278 @@
+"""
+Asyncio client for the Wiser HeatHub REST interface
+
+Replaces the blocking wiserHeatingAPI calls so that no hub I/O runs on the
+event loop thread or ties up an executor slot. One keep-alive connection is
+pooled per hub, the HeatHub web server copes badly with parallel requests.
+"""
+import asyncio
+import json
+
+import aiohttp
+
+from .const import _LOGGER, TEMP_MAXIMUM, TEMP_MINIMUM, TEMP_OFF
+from .metrics import SIZE_BUCKETS, HubMetrics
+
+WISERHUBURL = "http://{}/data/domain/"
+WISERMODEURL = "System/RequestOverride"
+WISERSYSTEMURL = "System"
+WISERROOMURL = "Room/{}"
+WISERSCHEDULEURL = "Schedule/{}"
+WISERSMARTPLUGURL = "SmartPlug/{}"
+WISERHOTWATERURL = "HotWater/{}/"
+
+TIMEOUT = 5
+KEEPALIVE_TIMEOUT = 60
+
+DHW_ON_TEMP = 1100
+DHW_OFF_TEMP = -200
+
+
+class WiserHubError(Exception):
+    """Base class for hub errors"""
+
+
+class WiserHubConnectionError(WiserHubError):
+    """The hub could not be reached or did not answer in time"""
+
+
+class WiserRESTException(WiserHubError):
+    """The hub rejected a request"""
+
+
+class WiserNotFound(WiserHubError):
+    """The hub does not know the requested object"""
+
+
+def to_wiser_temp(temp):
+    """Convert from celsius to the hub's tenths of a degree"""
+    return int(temp * 10)
+
+
+def from_wiser_temp(temp):
+    return round(temp / 10, 1)
+
+
+def check_temp_range(temp):
+    return temp == TEMP_OFF or TEMP_MINIMUM <= temp <= TEMP_MAXIMUM
+
+
+def manual_set_point(scheduled_set_point):
+    """Temperature used when a room is switched to manual"""
+    set_temp = from_wiser_temp(scheduled_set_point or 0)
+    return set_temp if set_temp >= TEMP_MINIMUM else TEMP_MINIMUM
+
+
+def room_mode_state(mode, boost_temp=20, scheduled_set_point=None):
+    """Room values the hub is expected to report after set_room_mode"""
+    mode = mode.lower()
+    if mode == "auto":
+        return {"Mode": "Auto"}
+    if mode == "boost":
+        set_point = to_wiser_temp(boost_temp)
+        return {
+            "SetpointOrigin": "FromBoost",
+            "CurrentSetPoint": set_point,
+            "DisplayedSetPoint": set_point,
+        }
+    if mode == "manual":
+        set_point = to_wiser_temp(manual_set_point(scheduled_set_point))
+    else:
+        set_point = to_wiser_temp(TEMP_OFF)
+    return {
+        "Mode": "Manual",
+        "CurrentSetPoint": set_point,
+        "DisplayedSetPoint": set_point,
+    }
+
+
+class WiserHubAPI:
+    """Async read/write access to a single HeatHub"""
+
+    def __init__(self, host, secret, timeout=TIMEOUT, metrics=None):
+        self.host = host
+        self.metrics = metrics if metrics is not None else HubMetrics()
+        self._base_url = WISERHUBURL.format(host)
+        self._headers = {
+            "SECRET": secret,
+            "Content-Type": "application/json;charset=UTF-8",
+        }
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+
+    @property
+    def session(self):
+        """Keep-alive session, created on first use inside the event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=1, keepalive_timeout=KEEPALIVE_TIMEOUT
+                ),
+                headers=self._headers,
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def async_close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, path, data=None):
+        url = self._base_url + path
+        try:
+            async with self.session.request(method, url, json=data) as response:
+                body = await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            raise WiserHubConnectionError(
+                "Error communicating with Wiser Hub at {}: {}".format(self.host, ex)
+            ) from ex
+        if status == 404:
+            raise WiserNotFound("{} not found on hub".format(path))
+        if status != 200:
+            raise WiserRESTException(
+                "Error {} {} on hub, status {} {}".format(
+                    method, path, status, body.decode(errors="replace")
+                )
+            )
+        return body
+
+    async def _patch(self, path, data):
+        _LOGGER.debug("Sending patch data {} to {}".format(data, path))
+        await self._request("PATCH", path, data)
+
+    async def get_hub_data(self):
+        """Fetch the full hub payload, raises json.JSONDecodeError if not JSON"""
+        body = await self._request("GET", "")
+        self.metrics.observe("payload_kib", len(body) / 1024, SIZE_BUCKETS)
+        with self.metrics.timer("parse_ms"):
+            return json.loads(body)
+
+    async def set_room_temperature(self, room_id, temperature):
+        if not check_temp_range(temperature):
+            raise ValueError(
+                "Room temperature must be between {} and {} or {} (off)".format(
+                    TEMP_MINIMUM, TEMP_MAXIMUM, TEMP_OFF
+                )
+            )
+        await self._patch(
+            WISERROOMURL.format(room_id),
+            {
+                "RequestOverride": {
+                    "Type": "Manual",
+                    "SetPoint": to_wiser_temp(temperature),
+                }
+            },
+        )
+
+    async def set_room_mode(
+        self, room_id, mode, boost_temp=20, boost_time=30, scheduled_set_point=None
+    ):
+        """
+        Set the room mode to auto, manual, off or boost.
+
+        scheduled_set_point is the room's current ScheduledSetPoint, used as
+        the manual temperature when switching to manual.
+        """
+        mode = mode.lower()
+        if mode == "auto":
+            patch_data = {"Mode": "Auto"}
+        elif mode == "boost":
+            if not TEMP_MINIMUM <= boost_temp <= TEMP_MAXIMUM:
+                raise ValueError(
+                    "Boost temperature can only be between {} and {}".format(
+                        TEMP_MINIMUM, TEMP_MAXIMUM
+                    )
+                )
+            patch_data = {
+                "RequestOverride": {
+                    "Type": "Manual",
+                    "DurationMinutes": boost_time,
+                    "SetPoint": to_wiser_temp(boost_temp),
+                    "Originator": "App",
+                }
+            }
+        elif mode == "manual":
+            patch_data = {
+                "Mode": "Manual",
+                "RequestOverride": {
+                    "Type": "Manual",
+                    "SetPoint": to_wiser_temp(manual_set_point(scheduled_set_point)),
+                },
+            }
+        elif mode == "off":
+            patch_data = {
+                "Mode": "Manual",
+                "RequestOverride": {
+                    "Type": "Manual",
+                    "SetPoint": to_wiser_temp(TEMP_OFF),
+                },
+            }
+        else:
+            raise ValueError(
+                "Room mode should be auto, boost, off or manual, not {}".format(mode)
+            )
+
+        # If not a boost operation cancel any current boost
+        if mode != "boost":
+            await self._patch(
+                WISERROOMURL.format(room_id),
+                {
+                    "RequestOverride": {
+                        "Type": "None",
+                        "DurationMinutes": 0,
+                        "SetPoint": 0,
+                        "Originator": "App",
+                    }
+                },
+            )
+        await self._patch(WISERROOMURL.format(room_id), patch_data)
+
+    async def set_schedule(self, schedule_id, schedule_data):
+        await self._patch(WISERSCHEDULEURL.format(schedule_id), schedule_data)
+
+    async def set_home_away_mode(self, mode, temperature=10):
+        if mode not in ["HOME", "AWAY"]:
+            raise ValueError("Home/away mode can only be HOME or AWAY")
+        if mode == "AWAY":
+            if temperature is None or not check_temp_range(temperature):
+                raise ValueError(
+                    "Away temperature can only be between {} and {} or {} (off)".format(
+                        TEMP_MINIMUM, TEMP_MAXIMUM, TEMP_OFF
+                    )
+                )
+            patch_data = {"type": 2, "setPoint": to_wiser_temp(temperature)}
+        else:
+            patch_data = {"type": 0, "setPoint": 0}
+        await self._patch(WISERMODEURL, patch_data)
+
+    async def set_system_switch(self, switch, mode=False):
+        await self._patch(WISERSYSTEMURL, {switch: mode})
+
+    async def set_smart_plug_state(self, plug_id, state):
+        if state.title() not in ["On", "Off"]:
+            raise ValueError("SmartPlug state must be either On or Off")
+        await self._patch(
+            WISERSMARTPLUGURL.format(plug_id), {"RequestOutput": state.title()}
+        )
+
+    async def set_smart_plug_mode(self, plug_id, mode):
+        if mode.title() not in ["Auto", "Manual"]:
+            raise ValueError("SmartPlug mode must be either Auto or Manual")
+        await self._patch(WISERSMARTPLUGURL.format(plug_id), {"Mode": mode.title()})
+
+    async def set_hotwater_mode(self, hotwater_id, mode):
+        """Switch hot water on or off manually, or back to auto (schedule)"""
+        mode_mapping = {
+            "on": {"RequestOverride": {"Type": "Manual", "SetPoint": DHW_ON_TEMP}},
+            "off": {"RequestOverride": {"Type": "Manual", "SetPoint": DHW_OFF_TEMP}},
+            "auto": {"RequestOverride": {"Type": "None", "Mode": "Auto"}},
+        }
+        if mode.lower() not in mode_mapping:
+            raise ValueError(
+                "Hot water can be either on, off or auto, not {}".format(mode)
+            )
+        await self._patch(
+            WISERHOTWATERURL.format(hotwater_id), mode_mapping[mode.lower()]
+        )
@@ -0,0 +1,229 @@
+"""
+Battery life forecasts for battery powered Wiser devices
+
+The hub reports battery voltage in whole tenths of a volt, so a slowly
+falling voltage arrives as a staircase and a fit over every reading mostly
+measures where on the current step it happens to be. Instead each device's
+voltage is sampled at most once per BATTERY_INTERVAL and only the steps are
+kept: the time each lower level is first seen, once CONFIRM_READINGS
+readings in a row agree so a single low reading is ignored. A running,
+exponentially weighted least squares fit of level against those times,
+with older steps fading with a half life of BATTERY_HALF_LIFE days, gives
+the rate of fall. Only the five weighted sums are kept, so an update costs
+the same however long the device has been watched. A jump up in voltage
+means the batteries were changed and starts the fit again.
+
+The forecast counts on from the latest step, which makes it the same
+whether the hub rounds or truncates the voltage. Once the next step is
+overdue the forecast moves out with it.
+
+The state is saved by the caller's store, a battery lasts far longer than
+Home Assistant stays up. Nothing here needs Home Assistant.
+"""
+from datetime import datetime, timedelta, timezone
+
+from .const import _LOGGER
+
+STORAGE_VERSION = 1
+STORAGE_KEY = "wiser_batteries_{}"
+BATTERY_SAVE_DELAY = 300
+
+BATTERY_INTERVAL = 3600
+BATTERY_HALF_LIFE = 90
+SECONDS_PER_DAY = 24 * 3600
+
+# Rise in hub voltage, in tenths of a volt, taken as new batteries
+BATTERY_REPLACED_RISE = 2
+
+# Hub voltage at which the batteries should be changed, by product type.
+# Wiser support recommend 2.6V for iTRVs, RoomStats carry on for longer
+BATTERY_LOW_VOLTAGE = {"iTRV": 26, "RoomStat": 24}
+
+# Readings in a row at a lower level before it counts as a step down
+CONFIRM_READINGS = 3
+
+# Steps needed, and the time they must span, before a forecast is made
+MIN_STEPS = 2
+MIN_SPAN_DAYS = 3
+
+
+class BatteryTrend:
+    """Weighted least squares fit of voltage steps against days since origin"""
+
+    __slots__ = (
+        "origin",
+        "weight",
+        "sum_t",
+        "sum_v",
+        "sum_tt",
+        "sum_tv",
+        "steps",
+        "stepped",
+        "last",
+        "voltage",
+        "level",
+        "level_since",
+        "pending",
+        "pending_since",
+        "pending_count",
+    )
+
+    def __init__(self, origin, state=None):
+        self.origin = origin
+        self.weight = self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.0
+        self.steps = 0
+        self.stepped = self.last = origin
+        self.voltage = self.level = self.level_since = None
+        self.pending = self.pending_since = None
+        self.pending_count = 0
+        if state is not None:
+            (
+                self.weight,
+                self.sum_t,
+                self.sum_v,
+                self.sum_tt,
+                self.sum_tv,
+                self.steps,
+                self.stepped,
+                self.last,
+                self.voltage,
+                self.level,
+                self.level_since,
+                self.pending,
+                self.pending_since,
+                self.pending_count,
+            ) = state
+
+    def as_list(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def _days(self, timestamp):
+        return (timestamp - self.origin) / SECONDS_PER_DAY
+
+    def add(self, timestamp, voltage):
+        self.last = timestamp
+        self.voltage = voltage
+        if self.level is None:
+            # Part way down a step, not the start of one
+            self.level = voltage
+            self.level_since = timestamp
+            return
+        if voltage >= self.level:
+            self.pending = self.pending_since = None
+            self.pending_count = 0
+            return
+        if self.pending is None:
+            self.pending = voltage
+            self.pending_since = timestamp
+            self.pending_count = 1
+        else:
+            self.pending = max(self.pending, voltage)
+            self.pending_count += 1
+        if self.pending_count >= CONFIRM_READINGS:
+            self._add_step(self.pending_since, self.pending)
+
+    def _add_step(self, timestamp, level):
+        fade = 0.5 ** (
+            (timestamp - self.stepped) / SECONDS_PER_DAY / BATTERY_HALF_LIFE
+        )
+        t = self._days(timestamp)
+        self.weight = self.weight * fade + 1
+        self.sum_t = self.sum_t * fade + t
+        self.sum_v = self.sum_v * fade + level
+        self.sum_tt = self.sum_tt * fade + t * t
+        self.sum_tv = self.sum_tv * fade + t * level
+        self.steps += 1
+        self.stepped = timestamp
+        self.level = level
+        self.level_since = timestamp
+        self.pending = self.pending_since = None
+        self.pending_count = 0
+
+    def slope(self):
+        """Voltage change in tenths per day, None until there is a trend"""
+        spread = self.weight * self.sum_tt - self.sum_t * self.sum_t
+        if self.steps < MIN_STEPS or spread <= 0:
+            return None
+        # The weighted spread of step times, in days
+        if spread / self.weight ** 2 < (MIN_SPAN_DAYS / 2) ** 2:
+            return None
+        return (self.weight * self.sum_tv - self.sum_t * self.sum_v) / spread
+
+    def days_until(self, low_voltage, timestamp):
+        """Days from timestamp until the voltage reads low_voltage, or None"""
+        slope = self.slope()
+        if slope is None or slope >= 0:
+            return None
+        if self.level <= low_voltage:
+            return 0.0
+        days_per_step = -1 / slope
+        now = self._days(timestamp)
+        since = self._days(self.level_since)
+        remaining = since + (self.level - low_voltage) * days_per_step - now
+        overdue = now - (since + days_per_step)
+        if overdue > 0:
+            # The next step has not come yet, so nor has anything after it
+            remaining += overdue
+        return max(0.0, remaining)
+
+
+class WiserBatteryMonitor:
+    """Battery trends for every battery powered device of one hub"""
+
+    def __init__(self, store, interval=BATTERY_INTERVAL):
+        self._store = store
+        self.interval = interval
+        self.trends = {}
+
+    async def async_load(self):
+        try:
+            stored = await self._store.async_load()
+            for device_id, state in (stored or {}).items():
+                self.trends[int(device_id)] = BatteryTrend(state[0], state[1:])
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to read Wiser battery history: {}".format(ex))
+            self.trends = {}
+
+    def _data_to_save(self):
+        return {
+            str(device_id): trend.as_list() for device_id, trend in self.trends.items()
+        }
+
+    def record(self, snapshot, timestamp):
+        """Add the voltage of each device not sampled in the last interval,
+        returns the ids of the devices that were sampled"""
+        sampled = []
+        for device_id, device in snapshot.devices.items():
+            if device.get("ProductType") not in BATTERY_LOW_VOLTAGE:
+                continue
+            voltage = device.get("BatteryVoltage")
+            if not voltage:
+                # Not reported for a while after the hub restarts
+                continue
+            trend = self.trends.get(device_id)
+            if trend is not None and timestamp - trend.last < self.interval:
+                continue
+            if trend is None or voltage >= trend.level + BATTERY_REPLACED_RISE:
+                if trend is not None:
+                    _LOGGER.info(
+                        "Batteries changed in Wiser device {}".format(device_id)
+                    )
+                trend = self.trends[device_id] = BatteryTrend(timestamp)
+            trend.add(timestamp, voltage)
+            sampled.append(device_id)
+        if sampled:
+            self._store.async_delay_save(self._data_to_save, BATTERY_SAVE_DELAY)
+        return sampled
+
+    def forecast(self, device_id, product_type, timestamp):
+        """Days until the device's batteries are low and the UTC datetime that
+        falls on, both None while there is no downward trend yet"""
+        trend = self.trends.get(device_id)
+        low_voltage = BATTERY_LOW_VOLTAGE.get(product_type)
+        if trend is None or low_voltage is None:
+            return None, None
+        days = trend.days_until(low_voltage, timestamp)
+        if days is None:
+            return None, None
+        due = datetime.fromtimestamp(timestamp, timezone.utc) + timedelta(days=days)
+        return round(days, 1), due
@@ -7,10 +7,12 @@ Angelosantagata@gmail.com
 """
 import asyncio
 import logging
+import os
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant.components.climate import ClimateDevice
 from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
 from homeassistant.components.climate.const import (
     HVAC_MODE_AUTO,
@@ -25,12 +27,15 @@ from homeassistant.const import (
     ATTR_TEMPERATURE,
     TEMP_CELSIUS,
 )
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.entity import Entity
-from homeassistant.util import ruamel_yaml as yaml
+from homeassistant.util import dt as dt_util
 
-from .const import _LOGGER, DOMAIN
+from . import async_extract_wiser_entities, wiser_entity, wiser_service_schema
+from .api import from_wiser_temp
+from .const import _LOGGER, CONF_HUB, DOMAIN, TEMP_OFF
 
-from .util import convert_to_wiser_schedule, convert_from_wiser_schedule
+from .schedule_io import load_room_schedule, save_room_schedule
 
 
 ATTR_TIME_PERIOD = "time_period"
@@ -69,116 +74,134 @@ WISER_PRESET_TO_HASS = {
 SUPPORT_FLAGS = SUPPORT_TARGET_TEMPERATURE | SUPPORT_PRESET_MODE
 
 
-BOOST_HEATING_SCHEMA = vol.Schema(
+BOOST_HEATING_SCHEMA = wiser_service_schema(
     {
-        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
         vol.Optional(ATTR_TIME_PERIOD, default=60): vol.Coerce(int),
         vol.Optional(ATTR_TEMPERATURE, default="23.0"): vol.Coerce(float),
         vol.Optional(ATTR_TEMPERATURE_DELTA, default="0"): vol.Coerce(float),
     }
 )
 
-GET_SET_SCHEDULE_SCHEMA = vol.Schema(
-    {
-        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
-        vol.Optional(ATTR_FILENAME, default=""): vol.Coerce(str),
-    }
+GET_SET_SCHEDULE_SCHEMA = wiser_service_schema(
+    {vol.Optional(ATTR_FILENAME, default=""): vol.Coerce(str)}
 )
 
 COPY_SCHEDULE_SCHEMA = vol.Schema(
     {
         vol.Required(ATTR_ENTITY_ID): cv.entity_id,
-        vol.Required(ATTR_COPYTO_ENTITY_ID): cv.entity_id,
+        vol.Required(ATTR_COPYTO_ENTITY_ID): cv.entity_ids,
     }
 )
 
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up Wiser climate device"""
-    data = hass.data[DOMAIN]
+    if discovery_info is None:
+        return
+    data = hass.data[DOMAIN][discovery_info[CONF_HUB]]
 
-    wiser_rooms = [
-        WiserRoom(hass, data, room.get("id")) for room in data.wiserhub.getRooms()
-    ]
+    wiser_rooms = [WiserRoom(hass, data, room_id) for room_id in data.snapshot.rooms]
     async_add_entities(wiser_rooms, True)
 
-    @callback
-    def heating_boost(service):
+    if hass.services.has_service(DOMAIN, SERVICE_BOOST_HEATING):
+        # Registered by the first hub, the services cover every hub
+        return
+
+    async def async_set_schedules(rooms, scheduleData):
+        """Send one schedule to several rooms, as one batch per hub"""
+        by_hub = {}
+        for room in rooms:
+            schedule_id = room.schedule_id
+            if schedule_id is None:
+                _LOGGER.warning("{} has no schedule to set".format(room.name))
+                continue
+            by_hub.setdefault(room.data, {})[room.name] = (schedule_id, scheduleData)
+        reports = await asyncio.gather(
+            *(data.async_set_schedules(schedules) for data, schedules in by_hub.items())
+        )
+        failed = {
+            name: error for report in reports for name, error in report["failed"].items()
+        }
+        if failed:
+            raise HomeAssistantError("Unable to set schedules: {}".format(failed))
+
+    async def heating_boost(service):
         """Handle the service call."""
-        entity_id = service.data[ATTR_ENTITY_ID]
         boost_time = service.data[ATTR_TIME_PERIOD]
         boost_temp = service.data[ATTR_TEMPERATURE]
         boost_temp_delta = service.data[ATTR_TEMPERATURE_DELTA]
 
-        for room in wiser_rooms:
-            _LOGGER.debug("*****BOOST for {}".format(room.entity_id))
-            if room.entity_id == entity_id:
-                if boost_temp_delta > 0:
-                    boost_temp = ((room.current_temperature)) + boost_temp_delta
-                _LOGGER.debug(
-                    "Boost service called for {} to set to {}C for {} mins.".format(
-                        room.name, boost_temp, boost_time
-                    )
+        async def boost(room):
+            temp = boost_temp
+            if boost_temp_delta > 0:
+                temp = room.current_temperature + boost_temp_delta
+            _LOGGER.debug(
+                "Boost service called for {} to set to {}C for {} mins.".format(
+                    room.name, temp, boost_time
                 )
+            )
+            await room.set_room_mode(room.room_id, "boost", temp, boost_time)
 
-                hass.async_create_task(
-                    room.set_room_mode(room.room_id, "boost", boost_temp, boost_time)
-                )
-                room.schedule_update_ha_state(True)
-                break
+        rooms = await async_extract_wiser_entities(hass, service, WiserRoom)
+        await asyncio.gather(*(boost(room) for room in rooms))
 
-    @callback
-    def get_schedule(service):
+    async def get_schedule(service):
         """Handle the service call"""
-        entity_id = service.data[ATTR_ENTITY_ID]
-        filename = (
-            service.data[ATTR_FILENAME]
-            if service.data[ATTR_FILENAME] != ""
-            else ("schedule_" + entity_id + ".yaml")
-        )
+        rooms = await async_extract_wiser_entities(hass, service, WiserRoom)
+        filename = service.data[ATTR_FILENAME]
 
-        for room in wiser_rooms:
-            if room.entity_id == entity_id:
-                scheduleData = room.schedule
-                _LOGGER.debug("Sched Service Data = {}".format(scheduleData))
-                if scheduleData != None:
-                    scheduleData = convert_from_wiser_schedule(scheduleData, room.name)
-                    yaml.save_yaml(filename, scheduleData)
-                else:
-                    raise Exception("No schedule data returned")
-                break
+        async def save(room):
+            if filename == "":
+                room_filename = "schedule_" + room.entity_id + ".yaml"
+            elif len(rooms) > 1:
+                # One file per room, named after the room's entity
+                name, extension = os.path.splitext(filename)
+                room_filename = "{}_{}{}".format(
+                    name, room.entity_id.split(".", 1)[1], extension
+                )
+            else:
+                room_filename = filename
+            scheduleData = room.schedule
+            _LOGGER.debug("Sched Service Data = {}".format(scheduleData))
+            if scheduleData is None:
+                raise HomeAssistantError("No schedule data for {}".format(room.name))
+            # Conversion and the file write run in the executor
+            await hass.async_add_executor_job(
+                save_room_schedule,
+                hass.config.path(room_filename),
+                scheduleData,
+                room.name,
+            )
 
-    @callback
-    def set_schedule(service):
+        await asyncio.gather(*(save(room) for room in rooms))
+
+    async def set_schedule(service):
         """Handle the service call"""
-        entity_id = service.data[ATTR_ENTITY_ID]
-        filename = service.data[ATTR_FILENAME]
-        # Get schedule data
-        scheduleData = yaml.load_yaml(filename)
-        # Set schedule
-        for room in wiser_rooms:
-            if room.entity_id == entity_id:
-                hass.async_create_task(
-                    room.set_room_schedule(room.room_id, scheduleData)
-                )
-                room.schedule_update_ha_state(True)
-                break
+        rooms = await async_extract_wiser_entities(hass, service, WiserRoom)
+        if not rooms:
+            return
+        # Read, parse and validate the file before anything is sent
+        scheduleData = await hass.async_add_executor_job(
+            load_room_schedule, hass.config.path(service.data[ATTR_FILENAME])
+        )
+        await async_set_schedules(rooms, scheduleData)
 
-    @callback
-    def copy_schedule(service):
+    async def copy_schedule(service):
         """Handle the service call"""
-        entity_id = service.data[ATTR_ENTITY_ID]
-        to_entity_id = service.data[ATTR_COPYTO_ENTITY_ID]
-
-        for room in wiser_rooms:
-            if room.entity_id == entity_id:
-                for to_room in wiser_rooms:
-                    if to_room.entity_id == to_entity_id:
-                        hass.async_create_task(
-                            room.copy_room_schedule(room.room_id, to_room.room_id)
-                        )
-                        room.schedule_update_ha_state(True)
-                        break
+        room = wiser_entity(hass, service.data[ATTR_ENTITY_ID])
+        if not isinstance(room, WiserRoom) or room.schedule is None:
+            raise HomeAssistantError(
+                "No Wiser room schedule for {}".format(service.data[ATTR_ENTITY_ID])
+            )
+        to_rooms = [
+            to_room
+            for to_room in (
+                wiser_entity(hass, entity_id)
+                for entity_id in service.data[ATTR_COPYTO_ENTITY_ID]
+            )
+            if isinstance(to_room, WiserRoom) and to_room is not room
+        ]
+        await async_set_schedules(to_rooms, room.schedule)
 
     hass.services.async_register(
         DOMAIN, SERVICE_BOOST_HEATING, heating_boost, schema=BOOST_HEATING_SCHEMA,
@@ -197,6 +220,14 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     )
 
 
+def schedule_temp(set_point):
+    """Schedule setpoint in degrees, Off for the hub's off value"""
+    if set_point is None:
+        return None
+    temp = from_wiser_temp(set_point)
+    return "Off" if temp <= TEMP_OFF else temp
+
+
 """ Definition of WiserRoom """
 
 
@@ -207,7 +238,7 @@ class WiserRoom(ClimateDevice):
         self.hass = hass
         self.schedule = {}
         self.room_id = room_id
-        self._force_update = False
+        self._unsub_dispatchers = []
         self._hvac_modes_list = [HVAC_MODE_AUTO, HVAC_MODE_HEAT, HVAC_MODE_OFF]
         self._preset_modes_list = [
             PRESET_BOOST30,
@@ -217,19 +248,49 @@ class WiserRoom(ClimateDevice):
             PRESET_BOOST_CANCEL,
         ]
         _LOGGER.info(
-            "Wiser Room Initialisation for {}".format(
-                self.data.wiserhub.getRoom(self.room_id).get("Name")
-            )
+            "Wiser Room Initialisation for {}".format(self._room.get("Name"))
         )
 
+    async def async_added_to_hass(self):
+        """Subscribe to hub updates for this room and its schedule."""
+        signals = (
+            self.data.signal(),
+            self.data.signal("Room", self.room_id),
+            self.data.signal("Schedule", self._room.get("ScheduleId")),
+        )
+        self._unsub_dispatchers = [
+            async_dispatcher_connect(self.hass, signal, self._async_hub_updated)
+            for signal in signals
+        ]
+        self.data.entities[self.entity_id] = self
+
+    async def async_will_remove_from_hass(self):
+        self.data.entities.pop(self.entity_id, None)
+        for unsub in self._unsub_dispatchers:
+            unsub()
+        self._unsub_dispatchers = []
+
+    @callback
+    def _async_hub_updated(self):
+        self.async_schedule_update_ha_state(True)
+
     async def async_update(self):
         _LOGGER.debug("WiserRoom Update requested for {}".format(self.name))
-        if self._force_update:
-            await self.data.async_update(no_throttle=True)
-            self._force_update = False
-        else:
-            await self.data.async_update()
-        self.schedule = self.data.wiserhub.getRoomSchedule(self.room_id)
+        self.schedule = self.data.snapshot.room_schedule(self.room_id)
+
+    def history_keys(self):
+        """Hub objects whose history the query_history service reports"""
+        return [("Room", self.room_id)]
+
+    @property
+    def _room(self):
+        """Hub data for this room from the current snapshot"""
+        return self.data.snapshot.room(self.room_id)
+
+    @property
+    def schedule_id(self):
+        """Id of the hub schedule this room follows, None if it has none"""
+        return self._room.get("ScheduleId")
 
     @property
     def supported_features(self):
@@ -238,12 +299,17 @@ class WiserRoom(ClimateDevice):
 
     @property
     def should_poll(self):
-        return True
+        return False
+
+    @property
+    def available(self):
+        return self.data.available
 
     @property
     def state(self):
-        state = self.data.wiserhub.getRoom(self.room_id).get("Mode")
-        current_temp = self.data.wiserhub.getRoom(self.room_id).get("DisplayedSetPoint")
+        room = self._room
+        state = room.get("Mode")
+        current_temp = room.get("DisplayedSetPoint")
         _LOGGER.info("State requested for room %s, state=%s", self.room_id, state)
 
         if state.lower() == "manual":
@@ -257,7 +323,11 @@ class WiserRoom(ClimateDevice):
 
     @property
     def name(self):
-        return "Wiser " + self.data.wiserhub.getRoom(self.room_id).get("Name")
+        return self.data.entity_name(self._room.get("Name"))
+
+    @property
+    def unique_id(self):
+        return self.data.unique_id("room", self.room_id)
 
     @property
     def temperature_unit(self):
@@ -273,9 +343,7 @@ class WiserRoom(ClimateDevice):
 
     @property
     def current_temperature(self):
-        temp = (
-            self.data.wiserhub.getRoom(self.room_id).get("CalculatedTemperature") / 10
-        )
+        temp = self._room.get("CalculatedTemperature") / 10
         if temp < self.min_temp:
             """ Sometimes we get really low temps (like -3000!),
                 not sure why, if we do then just set it to -20 for now till i
@@ -287,20 +355,20 @@ class WiserRoom(ClimateDevice):
     @property
     def icon(self):
         # Change icon to show if radiator is heating, not heating or set to off.
-        if self.data.wiserhub.getRoom(self.room_id).get("ControlOutputState") == "On":
+        room = self._room
+        if room.get("ControlOutputState") == "On":
             return "mdi:radiator"
         else:
-            if self.data.wiserhub.getRoom(self.room_id).get("CurrentSetPoint") == -200:
+            if room.get("CurrentSetPoint") == -200:
                 return "mdi:radiator-off"
             else:
                 return "mdi:radiator-disabled"
 
     @property
     def hvac_mode(self):
-        state = self.data.wiserhub.getRoom(self.room_id).get("Mode")
-        current_set_point = self.data.wiserhub.getRoom(self.room_id).get(
-            "CurrentSetPoint"
-        )
+        room = self._room
+        state = room.get("Mode")
+        current_set_point = room.get("CurrentSetPoint")
         if state.lower() == "manual":
             if current_set_point == -200:
                 state = HVAC_MODE_OFF
@@ -328,8 +396,9 @@ class WiserRoom(ClimateDevice):
 
     @property
     def preset_mode(self):
-        wiser_preset = self.data.wiserhub.getRoom(self.room_id).get("SetpointOrigin")
-        mode = self.data.wiserhub.getRoom(self.room_id).get("Mode")
+        room = self._room
+        wiser_preset = room.get("SetpointOrigin")
+        mode = room.get("Mode")
 
         if (
             mode.lower() == HVAC_MODE_AUTO
@@ -373,10 +442,7 @@ class WiserRoom(ClimateDevice):
             preset_mode = PRESET_BOOST
 
             """ Set boost temp to current + boost_temp """
-            boost_temp = (
-                self.data.wiserhub.getRoom(self.room_id).get("CalculatedTemperature")
-                / 10
-            ) + boost_temp
+            boost_temp = (self._room.get("CalculatedTemperature") / 10) + boost_temp
 
         await self.set_room_mode(self.room_id, preset_mode, boost_temp, boost_time)
         return True
@@ -388,12 +454,11 @@ class WiserRoom(ClimateDevice):
 
     @property
     def target_temperature(self):
-        target = self.data.wiserhub.getRoom(self.room_id).get("DisplayedSetPoint") / 10
+        room = self._room
+        target = room.get("DisplayedSetPoint") / 10
 
-        state = self.data.wiserhub.getRoom(self.room_id).get("Mode")
-        current_set_point = self.data.wiserhub.getRoom(self.room_id).get(
-            "DisplayedSetPoint"
-        )
+        state = room.get("Mode")
+        current_set_point = room.get("DisplayedSetPoint")
 
         if state.lower() == "manual" and current_set_point == -200:
             target = None
@@ -406,24 +471,23 @@ class WiserRoom(ClimateDevice):
     def state_attributes(self):
         # Generic attributes
         attrs = super().state_attributes
-        attrs["percentage_demand"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "PercentageDemand"
-        )
-        attrs["control_output_state"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "ControlOutputState"
-        )
-        attrs["heating_rate"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "HeatingRate"
-        )
-        attrs["window_state"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "WindowState"
-        )
-        attrs["window_detection_active"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "WindowDetectionActive"
-        )
-        attrs["away_mode_supressed"] = self.data.wiserhub.getRoom(self.room_id).get(
-            "AwayModeSuppressed"
-        )
+        room = self._room
+        attrs["percentage_demand"] = room.get("PercentageDemand")
+        attrs["control_output_state"] = room.get("ControlOutputState")
+        attrs["heating_rate"] = room.get("HeatingRate")
+        attrs["window_state"] = room.get("WindowState")
+        attrs["window_detection_active"] = room.get("WindowDetectionActive")
+        attrs["away_mode_supressed"] = room.get("AwayModeSuppressed")
+
+        compiled = self.data.compiled_schedule(room.get("ScheduleId"))
+        if compiled:
+            now = dt_util.now()
+            next_change_at, next_setpoint = compiled.next_change(now)
+            attrs["scheduled_setpoint_now"] = schedule_temp(compiled.setpoint_at(now))
+            attrs["next_setpoint"] = schedule_temp(next_setpoint)
+            attrs["next_change_at"] = (
+                next_change_at.isoformat() if next_change_at else None
+            )
 
         return attrs
 
@@ -436,8 +500,7 @@ class WiserRoom(ClimateDevice):
         _LOGGER.debug(
             "Setting temperature for {} to {}".format(self.name, target_temperature)
         )
-        self.data.wiserhub.setRoomTemperature(self.room_id, target_temperature)
-        self._force_update = True
+        await self.data.set_room_temperature(self.room_id, target_temperature)
 
     async def set_room_mode(self, room_id, mode, boost_temp=None, boost_time=None):
         """ Set to default values if not passed in """
@@ -446,25 +509,4 @@ class WiserRoom(ClimateDevice):
         _LOGGER.debug(
             "Setting Room Mode to {} for roomId {}".format(mode, self.room_id)
         )
-        self.data.wiserhub.setRoomMode(room_id, mode, boost_temp, boost_time)
-        self._force_update = True
-
-    async def set_room_schedule(self, room_id, scheduleData):
-        if scheduleData != None:
-            scheduleData = convert_to_wiser_schedule(scheduleData)
-            self.data.wiserhub.setRoomSchedule(room_id, scheduleData)
-            _LOGGER.debug("Set room schedule for {}".format(self.name))
-            self._force_update = True
-            return True
-        else:
-            return False
-
-    async def copy_room_schedule(self, room_id, to_room_id):
-        self.data.wiserhub.copyRoomSchedule(room_id, to_room_id)
-        _LOGGER.debug(
-            "Copied room schedule from {} to {}".format(
-                self.name, self.data.wiserhub.getRoom(to_room_id).get("Name")
-            )
-        )
-        self._force_update = True
-        return True
+        await self.data.set_room_mode(room_id, mode, boost_temp, boost_time)
@@ -0,0 +1,102 @@
+"""
+Write queue for a Wiser Hub
+
+Commands are keyed by the hub object they change. Writes to the same key
+that arrive before the queue is flushed collapse into the last one, which
+takes its place in the queue. Writes to different keys are sent
+back-to-back over the hub's single keep-alive connection and the whole
+batch ends with one confirmation refresh.
+"""
+from collections import OrderedDict
+
+from .const import _LOGGER
+
+COMMAND_DELAY = 0.5
+
+
+class WiserCommandQueue:
+    """Coalescing, serialised write queue for one hub"""
+
+    def __init__(self, hass, refresh, delay=COMMAND_DELAY):
+        self._hass = hass
+        self._refresh = refresh
+        self._delay = delay
+        self._pending = OrderedDict()
+        self._sending = {}
+        self._unsub_flush = None
+        self._flush_task = None
+
+    async def async_send(self, key, command):
+        """
+        Queue command, a coroutine function taking no arguments, for key.
+
+        Returns once the command (or a later one for the same key that
+        replaced it) has been sent and the hub data refreshed, raising any
+        error the write hit.
+        """
+        future = self._hass.loop.create_future()
+        if key in self._pending:
+            _LOGGER.debug("Coalescing queued hub write for {}".format(key))
+            futures = self._pending[key][1]
+        else:
+            futures = []
+        futures.append(future)
+        self._pending[key] = (command, futures)
+        # Sent in the order last asked for, after writes queued before it
+        self._pending.move_to_end(key)
+        self._schedule_flush()
+        return await future
+
+    def is_queued(self, key):
+        """True while a write for key is waiting or being sent"""
+        return key in self._pending or key in self._sending
+
+    def _schedule_flush(self):
+        # A plain loop timer keeps the queue free of Home Assistant imports
+        if self._unsub_flush is None and self._flush_task is None:
+            self._unsub_flush = self._hass.loop.call_later(
+                self._delay, self._async_start_flush
+            ).cancel
+
+    def _async_start_flush(self):
+        self._unsub_flush = None
+        self._flush_task = self._hass.async_create_task(self._async_flush())
+
+    async def _async_flush(self):
+        outcomes = []
+        try:
+            # Commands queued while a batch is being sent join this flush
+            while self._pending:
+                batch = self._sending = self._pending
+                self._pending = OrderedDict()
+                _LOGGER.debug("Sending {} queued hub writes".format(len(batch)))
+                for key, (command, futures) in batch.items():
+                    try:
+                        outcomes.append((futures, await command(), None))
+                    except Exception as ex:  # pylint: disable=broad-except
+                        outcomes.append((futures, None, ex))
+            await self._refresh()
+        finally:
+            self._sending = {}
+            for futures, result, error in outcomes:
+                for future in futures:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            self._flush_task = None
+            if self._pending:
+                self._schedule_flush()
+
+    def async_cancel(self):
+        """Drop anything still queued, used when the hub is unloaded"""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        for _command, futures in self._pending.values():
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+        self._pending.clear()
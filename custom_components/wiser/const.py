@@ -7,11 +7,18 @@ VERSION = "1.3.1"
 WISER_PLATFORMS = ["climate", "sensor", "switch"]
 
 BATTERY_FULL = 31
+TEMP_MINIMUM = 5
+TEMP_MAXIMUM = 30
+TEMP_OFF = -20
 NOTIFICATION_ID = "wiser_notification"
 NOTIFICATION_TITLE = "Wiser Component Setup"
 
+WISER_UPDATE_SIGNAL = "wiser_update_received"
+
 CONF_BOOST_TEMP = "boost_temp"
 CONF_BOOST_TEMP_TIME = "boost_time"
+CONF_HUB = "hub"
+CONF_NETWORK_DIAGNOSTICS = "network_diagnostics"
 
 WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
 WEEKENDS = ["saturday", "sunday"]
@@ -32,3 +39,10 @@ SIGNAL_STRENGTH_ICONS = {
     "Good": "mdi:wifi-strength-3",
     "VeryGood": "mdi:wifi-strength-4",
 }
+
+
+def update_signal(hub_id, section=None, item_id=None):
+    """Dispatcher signal for changes to one hub object, or to the whole hub"""
+    if section is None:
+        return "{}_{}".format(WISER_UPDATE_SIGNAL, hub_id)
+    return "{}_{}_{}_{}".format(WISER_UPDATE_SIGNAL, hub_id, section, item_id)
@@ -0,0 +1,78 @@
+"""
+Home Assistant events for changes reported by a Wiser Hub
+
+After each refresh the new hub data is compared with the last, and a typed
+event is fired for every change worth reacting to, so automations and
+loggers do not have to watch entity states for them. Only data from the hub
+is compared, values shown early for a pending write do not fire events.
+
+Every event carries hub, type (the hub section), id, name, old and new.
+"""
+from .snapshot import changed_items
+
+EVENT_WINDOW = "wiser_window_state_changed"
+EVENT_SETPOINT_ORIGIN = "wiser_setpoint_origin_changed"
+EVENT_BOOST_STARTED = "wiser_boost_started"
+EVENT_BOOST_ENDED = "wiser_boost_ended"
+EVENT_ROOM_OUTPUT = "wiser_room_output_changed"
+EVENT_OVERRIDE = "wiser_override_changed"
+EVENT_SMART_PLUG_OUTPUT = "wiser_smart_plug_output_changed"
+EVENT_HOT_WATER_RELAY = "wiser_hot_water_relay_changed"
+EVENT_HEATING_RELAY = "wiser_heating_relay_changed"
+
+# Hub section -> ((hub key, event type), ...)
+HUB_EVENTS = {
+    "Room": (
+        ("WindowState", EVENT_WINDOW),
+        ("SetpointOrigin", EVENT_SETPOINT_ORIGIN),
+        ("ControlOutputState", EVENT_ROOM_OUTPUT),
+    ),
+    "System": (("OverrideType", EVENT_OVERRIDE),),
+    "SmartPlug": (("OutputState", EVENT_SMART_PLUG_OUTPUT),),
+    "HotWater": (("WaterHeatingState", EVENT_HOT_WATER_RELAY),),
+    "HeatingChannel": (("HeatingRelayState", EVENT_HEATING_RELAY),),
+}
+
+# FromBoost, or FromBoostDuringAway for a boost started while away
+BOOST_ORIGIN = "fromboost"
+
+
+def _is_boost(origin):
+    return str(origin or "").lower().startswith(BOOST_ORIGIN)
+
+
+def hub_events(old, new):
+    """Yield (event type, event data) for each change from old to new"""
+    for section, item_id in sorted(
+        changed_items(old, new), key=lambda key: (key[0], str(key[1]))
+    ):
+        watched = HUB_EVENTS.get(section)
+        if watched is None or (item_id is None and section != "System"):
+            continue
+        old_item = old.item(section, item_id)
+        new_item = new.item(section, item_id)
+        if not old_item or not new_item:
+            # Added or removed, not a change of state
+            continue
+        for key, event_type in watched:
+            old_value = old_item.get(key)
+            new_value = new_item.get(key)
+            if old_value == new_value:
+                continue
+            data = {
+                "type": section,
+                "id": item_id,
+                "name": new_item.get("Name"),
+                "old": old_value,
+                "new": new_value,
+            }
+            yield event_type, data
+            if key != "SetpointOrigin":
+                continue
+            boosted = _is_boost(new_value)
+            # Moving between the home and away boost origins is the same boost
+            if boosted != _is_boost(old_value):
+                yield (
+                    EVENT_BOOST_STARTED if boosted else EVENT_BOOST_ENDED,
+                    dict(data),
+                )
@@ -0,0 +1,93 @@
+"""
+Connection health for a Wiser Hub
+
+A small circuit breaker around the hub connection:
+
+ * closed    - the hub is answering and requests go through as normal
+ * open      - the hub has stopped answering, nothing is sent to it until a
+               backoff delay has passed. The delay doubles with every failed
+               attempt, with some jitter so several hubs do not retry in step
+ * half_open - the delay has passed and a single probe request is allowed,
+               success closes the circuit again and failure re-opens it
+
+Entities report unavailable while the circuit is not closed.
+"""
+import random
+from time import monotonic
+
+FAILURE_THRESHOLD = 2
+BASE_BACKOFF = 15
+MAX_BACKOFF = 600
+JITTER = 0.2
+
+HEALTH_CLOSED = "closed"
+HEALTH_OPEN = "open"
+HEALTH_HALF_OPEN = "half_open"
+
+
+class HubHealth:
+    """Circuit breaker state for one hub"""
+
+    def __init__(
+        self,
+        failure_threshold=FAILURE_THRESHOLD,
+        base_backoff=BASE_BACKOFF,
+        max_backoff=MAX_BACKOFF,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = HEALTH_CLOSED
+        self.failures = 0
+        self.last_error = None
+        self._retry_at = 0.0
+
+    @property
+    def available(self):
+        return self.state == HEALTH_CLOSED
+
+    @property
+    def waiting(self):
+        """True while the circuit is open and requests are still refused"""
+        return self.state == HEALTH_OPEN and monotonic() < self._retry_at
+
+    def backoff(self):
+        """Seconds to wait after the current run of failures"""
+        delay = min(
+            self.max_backoff, self.base_backoff * 2 ** max(self.failures - 1, 0)
+        )
+        return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def retry_delay(self):
+        """Seconds until the next attempt at the hub is worth making"""
+        if self.state == HEALTH_OPEN:
+            return max(0.0, self._retry_at - monotonic())
+        return self.backoff()
+
+    def allow_request(self):
+        """True if a request may be sent now, moving an expired open circuit
+        to half open so that request becomes the probe"""
+        if self.state == HEALTH_CLOSED:
+            return True
+        if self.state == HEALTH_OPEN and monotonic() >= self._retry_at:
+            self.state = HEALTH_HALF_OPEN
+            return True
+        return False
+
+    def record_success(self):
+        """Returns True if the hub has just come back"""
+        recovered = self.state != HEALTH_CLOSED
+        self.state = HEALTH_CLOSED
+        self.failures = 0
+        self.last_error = None
+        return recovered
+
+    def record_failure(self, error=None):
+        """Returns True if the hub has just become unavailable"""
+        was_available = self.available
+        self.failures += 1
+        self.last_error = str(error) if error is not None else None
+        if self.state == HEALTH_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = HEALTH_OPEN
+            self._retry_at = monotonic() + self.backoff()
+        return was_available and not self.available
@@ -0,0 +1,187 @@
+"""
+Recent history of room, device and heating channel values
+
+The hub only reports current values. WiserHistory keeps a sample every
+HISTORY_INTERVAL for each room, RoomStat, device and heating channel in
+fixed-size ring buffers: one array of timestamps per hub object and one
+array of 16 bit hub values per series. A room's four series take about 10KB
+for three days, and nothing is allocated after the first sample.
+"""
+from array import array
+
+from .snapshot import SECTIONS
+
+HISTORY_INTERVAL = 300
+HISTORY_SAMPLES = 3 * 24 * 3600 // HISTORY_INTERVAL
+
+# Stored for a value the hub did not report, the hub uses it too for a room
+# with no temperature reading
+MISSING = -32768
+
+# Text values kept as numbers
+STATES = {"On": 1, "Off": 0}
+
+# Hub section -> (series name, hub key or path of keys, hub units per unit)
+HISTORY_SERIES = {
+    "Room": (
+        ("temperature", "CalculatedTemperature", 10),
+        ("setpoint", "CurrentSetPoint", 10),
+        ("demand", "PercentageDemand", 1),
+        ("heating_rate", "HeatingRate", 1),
+    ),
+    "RoomStat": (
+        ("temperature", "MeasuredTemperature", 10),
+        ("humidity", "MeasuredHumidity", 1),
+    ),
+    "Device": (
+        ("battery_voltage", "BatteryVoltage", 10),
+        ("rssi", ("ReceptionOfController", "Rssi"), 1),
+        ("lqi", ("ReceptionOfController", "Lqi"), 1),
+    ),
+    "HeatingChannel": (
+        ("demand", "PercentageDemand", 1),
+        ("relay", "HeatingRelayState", 1),
+    ),
+}
+
+
+def _hub_value(item, key):
+    """A hub value as a 16 bit integer, or MISSING"""
+    if isinstance(key, tuple):
+        value = item
+        for part in key:
+            value = value.get(part) if isinstance(value, dict) else None
+    else:
+        value = item.get(key)
+    if isinstance(value, str):
+        value = STATES.get(value)
+    if not isinstance(value, (int, float)) or not MISSING < value <= 32767:
+        return MISSING
+    return int(value)
+
+
+class HistoryBuffer:
+    """Ring buffer of timestamped samples of several series"""
+
+    __slots__ = ("times", "series", "start", "count")
+
+    def __init__(self, series_count, size=HISTORY_SAMPLES):
+        self.times = array("I", [0]) * size
+        self.series = [array("h", [MISSING]) * size for _ in range(series_count)]
+        # Index of the oldest sample and how many are held
+        self.start = 0
+        self.count = 0
+
+    @property
+    def nbytes(self):
+        return sum(
+            values.itemsize * len(values) for values in [self.times] + self.series
+        )
+
+    def append(self, timestamp, values):
+        size = len(self.times)
+        index = (self.start + self.count) % size
+        if self.count == size:
+            self.start = (self.start + 1) % size
+        else:
+            self.count += 1
+        self.times[index] = timestamp
+        for series, value in zip(self.series, values):
+            series[index] = value
+
+    def samples(self, series_index, since=0):
+        """(timestamp, value) pairs oldest first, skipping missing values"""
+        size = len(self.times)
+        times = self.times
+        values = self.series[series_index]
+        for offset in range(self.count):
+            index = (self.start + offset) % size
+            if times[index] >= since and values[index] != MISSING:
+                yield times[index], values[index]
+
+
+def summarise(samples, scale=1):
+    """Count, min, max, mean and least squares slope per hour of samples"""
+    count = 0
+    sum_t = sum_v = sum_tt = sum_tv = 0.0
+    minimum = maximum = None
+    first = last = None
+    for timestamp, value in samples:
+        if first is None:
+            first = timestamp
+        last = timestamp
+        # Times relative to the first sample keep the sums small
+        t = (timestamp - first) / 3600
+        count += 1
+        sum_t += t
+        sum_v += value
+        sum_tt += t * t
+        sum_tv += t * value
+        if minimum is None or value < minimum:
+            minimum = value
+        if maximum is None or value > maximum:
+            maximum = value
+    if not count:
+        return {"count": 0}
+    spread = count * sum_tt - sum_t * sum_t
+    slope = (count * sum_tv - sum_t * sum_v) / spread if spread else None
+    return {
+        "count": count,
+        "first": first,
+        "last": last,
+        "min": minimum / scale,
+        "max": maximum / scale,
+        "mean": round(sum_v / count / scale, 2),
+        "slope_per_hour": None if slope is None else round(slope / scale, 3),
+    }
+
+
+class WiserHistory:
+    """History buffers for every hub object of one hub"""
+
+    def __init__(self, interval=HISTORY_INTERVAL, size=HISTORY_SAMPLES):
+        self.interval = interval
+        self.size = size
+        self.buffers = {}
+        self._last_sample = None
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def record(self, snapshot, timestamp):
+        """Sample the snapshot if HISTORY_INTERVAL has passed since the last
+        sample, returns True if it was sampled"""
+        timestamp = int(timestamp)
+        if (
+            self._last_sample is not None
+            and timestamp - self._last_sample < self.interval
+        ):
+            return False
+        self._last_sample = timestamp
+        seen = set()
+        for section, series in HISTORY_SERIES.items():
+            for item_id, item in getattr(snapshot, SECTIONS[section]).items():
+                key = (section, item_id)
+                seen.add(key)
+                buffer = self.buffers.get(key)
+                if buffer is None:
+                    buffer = self.buffers[key] = HistoryBuffer(len(series), self.size)
+                buffer.append(
+                    timestamp, [_hub_value(item, hub_key) for _, hub_key, _ in series]
+                )
+        # Forget rooms and devices that have been removed from the hub
+        for key in set(self.buffers) - seen:
+            del self.buffers[key]
+        return True
+
+    def query(self, section, item_id, since=0, names=None):
+        """{series name: summary} for one hub object, since a timestamp"""
+        buffer = self.buffers.get((section, item_id))
+        if buffer is None:
+            return {}
+        return {
+            name: summarise(buffer.samples(index, since), scale)
+            for index, (name, _, scale) in enumerate(HISTORY_SERIES[section])
+            if names is None or name in names
+        }
@@ -0,0 +1,118 @@
+"""
+Counters and latency histograms for a Wiser Hub
+
+Kept in memory per hub handle. Everything is recorded on the event loop,
+so there is no locking, and a histogram is a fixed list of bucket counts so
+recording costs the same however long Home Assistant has been running.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# Bucket upper bounds, milliseconds for timings and KiB for sizes
+TIME_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS = (4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Histogram:
+    """Count, sum, extremes and bucketed distribution of observed values"""
+
+    __slots__ = ("buckets", "counts", "count", "total", "minimum", "maximum", "last")
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        # One extra bucket for values above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.last = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values,
+        capped at the largest value seen"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def as_dict(self):
+        def rounded(value):
+            return None if value is None else round(value, 2)
+
+        return {
+            "count": self.count,
+            "mean": rounded(self.total / self.count) if self.count else None,
+            "min": rounded(self.minimum),
+            "max": rounded(self.maximum),
+            "last": rounded(self.last),
+            "p50": rounded(self.percentile(0.5)),
+            "p95": rounded(self.percentile(0.95)),
+            "buckets": {
+                str(bound): count for bound, count in zip(self.buckets, self.counts)
+            },
+            "overflow": self.counts[-1],
+        }
+
+
+class HubMetrics:
+    """Named counters and histograms for one hub"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value, buckets=TIME_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Record the time spent in the block, in milliseconds"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (perf_counter() - start) * 1000)
+
+    def last(self, name):
+        histogram = self.histograms.get(name)
+        return None if histogram is None else histogram.last
+
+    @property
+    def errors(self):
+        return sum(
+            count for name, count in self.counters.items() if name.startswith("error")
+        )
+
+    def as_dict(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {
+                name: histogram.as_dict()
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
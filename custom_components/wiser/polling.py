@@ -0,0 +1,76 @@
+"""
+Adaptive poll scheduling for a Wiser Hub
+
+The hub's embedded web server is small, so the poll rate follows what the
+house is doing rather than running at a fixed rate:
+
+ * fast    - shortly after a command, during a boost or while any room is
+             calling for heat (ControlOutputState On)
+ * normal  - the configured scan interval while there is some demand or hot
+             water heating but nothing needs close tracking
+ * idle    - backed off while nothing is heating or the house is in Away mode
+"""
+from datetime import timedelta
+from time import monotonic
+
+FAST_INTERVAL = timedelta(seconds=10)
+COMMAND_WINDOW = timedelta(minutes=2)
+IDLE_FACTOR = 4
+MAX_IDLE_INTERVAL = timedelta(minutes=10)
+
+POLL_FAST = "fast"
+POLL_NORMAL = "normal"
+POLL_IDLE = "idle"
+
+
+class AdaptivePollPolicy:
+    """Works out the next poll interval from the latest hub snapshot"""
+
+    def __init__(self, base_interval):
+        self.base_interval = base_interval
+        self.fast_interval = min(base_interval, FAST_INTERVAL)
+        self.idle_interval = max(
+            base_interval, min(base_interval * IDLE_FACTOR, MAX_IDLE_INTERVAL)
+        )
+        self._last_command = None
+
+    def command_sent(self):
+        self._last_command = monotonic()
+
+    def _recent_command(self):
+        return (
+            self._last_command is not None
+            and monotonic() - self._last_command < COMMAND_WINDOW.total_seconds()
+        )
+
+    def mode(self, snapshot):
+        """Return POLL_FAST, POLL_NORMAL or POLL_IDLE for the snapshot"""
+        if self._recent_command():
+            return POLL_FAST
+        if snapshot is None:
+            return POLL_NORMAL
+
+        demand = False
+        for room in snapshot.rooms.values():
+            if room.get("ControlOutputState") == "On":
+                return POLL_FAST
+            # FromBoost, or FromBoostDuringAway for a boost started while away
+            if str(room.get("SetpointOrigin", "")).lower().startswith("fromboost"):
+                return POLL_FAST
+            if room.get("PercentageDemand"):
+                demand = True
+
+        if snapshot.system.get("OverrideType") == "Away":
+            return POLL_IDLE
+        if demand or snapshot.hotwater_relay_status == "On":
+            return POLL_NORMAL
+        return POLL_IDLE
+
+    def interval(self, snapshot):
+        """Return the (interval, mode) to wait before the next poll"""
+        mode = self.mode(snapshot)
+        if mode == POLL_FAST:
+            return self.fast_interval, mode
+        if mode == POLL_IDLE:
+            return self.idle_interval, mode
+        return self.base_interval, mode
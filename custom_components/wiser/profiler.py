@@ -0,0 +1,173 @@
+"""
+Profiling sessions for the Wiser component
+
+Started by the wiser.profile service and stopped after a fixed time, no
+restart needed. While a session runs:
+
+ * cProfile records every call on the event loop thread, the report keeps
+   only the functions in this component, so hub refreshes, entity property
+   getters and the service handlers
+ * a heartbeat task measures how late the event loop wakes it up
+ * a watchdog thread takes a stack sample of the event loop whenever the
+   heartbeat is more than LAG_THRESHOLD late, showing what blocked it
+
+The report is written as plain text when the session ends.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import traceback
+from collections import Counter
+from time import monotonic
+
+from homeassistant.core import callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+
+from .const import _LOGGER
+from .metrics import Histogram
+
+HEARTBEAT_INTERVAL = 0.05
+LAG_THRESHOLD = 0.1
+WATCHDOG_INTERVAL = 0.02
+REPORT_FUNCTIONS = 40
+REPORT_STACKS = 10
+
+COMPONENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopWatchdog(threading.Thread):
+    """Samples the event loop thread's stack while its heartbeat is late"""
+
+    def __init__(self, loop_thread_id):
+        super().__init__(name="wiser_profiler", daemon=True)
+        self._loop_thread_id = loop_thread_id
+        self._stop_event = threading.Event()
+        self.heartbeat = monotonic()
+        self.stacks = Counter()
+        self.samples = 0
+
+    def run(self):
+        while not self._stop_event.wait(WATCHDOG_INTERVAL):
+            if monotonic() - self.heartbeat < LAG_THRESHOLD:
+                continue
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                self._loop_thread_id
+            )
+            if frame is None:
+                continue
+            self.samples += 1
+            stack = traceback.extract_stack(frame)
+            self.stacks[
+                tuple(
+                    "{}:{} {}".format(entry.filename, entry.lineno, entry.name)
+                    for entry in stack[-8:]
+                )
+            ] += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def write_report(filename, profile, lag, watchdog, duration, started):
+    """Format and write a session's report, run in the executor"""
+    output = io.StringIO()
+    output.write(
+        "Wiser profile, {}s from {}\n\n".format(duration, started.isoformat())
+    )
+
+    summary = lag.as_dict()
+    output.write(
+        "Event loop lag (ms): {count} heartbeats, mean {mean}, p95 {p95}, "
+        "max {max}\n".format(**summary)
+    )
+    output.write(
+        "Event loop blocked for more than {:.0f}ms: {} samples of {:.0f}ms\n\n".format(
+            LAG_THRESHOLD * 1000, watchdog.samples, WATCHDOG_INTERVAL * 1000
+        )
+    )
+
+    stats = pstats.Stats(profile, stream=output)
+    wiser = sum(
+        entry[2]
+        for (path, _, _), entry in stats.stats.items()
+        if path.startswith(COMPONENT_DIR)
+    )
+    output.write(
+        "Event loop time in Wiser code: {:.3f}s in {}s\n\n".format(wiser, duration)
+    )
+
+    if watchdog.stacks:
+        output.write("Stacks seen while the event loop was blocked:\n")
+        for stack, count in watchdog.stacks.most_common(REPORT_STACKS):
+            marker = " (Wiser)" if any(COMPONENT_DIR in line for line in stack) else ""
+            output.write("\n{} samples{}\n".format(count, marker))
+            for line in stack:
+                output.write("    {}\n".format(line))
+        output.write("\n")
+
+    output.write("Wiser functions by cumulative time:\n")
+    stats.sort_stats("cumulative").print_stats(
+        re.escape(COMPONENT_DIR), REPORT_FUNCTIONS
+    )
+
+    with open(filename, "w", encoding="utf-8") as report_file:
+        report_file.write(output.getvalue())
+
+
+class WiserProfiler:
+    """Runs one profiling session at a time"""
+
+    def __init__(self, hass):
+        self._hass = hass
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    @callback
+    def async_start(self, duration, filename):
+        """Start a session of duration seconds writing its report to filename"""
+        if self.running:
+            raise HomeAssistantError("A Wiser profiling session is already running")
+        self._task = self._hass.async_create_task(
+            self._async_run(duration, filename)
+        )
+
+    async def _async_heartbeat(self, lag, watchdog):
+        while True:
+            expected = monotonic() + HEARTBEAT_INTERVAL
+            watchdog.heartbeat = monotonic()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            lag.observe(max(0.0, monotonic() - expected) * 1000)
+
+    async def _async_run(self, duration, filename):
+        _LOGGER.warning("Wiser profiling started for {}s".format(duration))
+        started = dt_util.utcnow()
+        lag = Histogram()
+        watchdog = LoopWatchdog(threading.get_ident())
+        profile = cProfile.Profile()
+        heartbeat = self._hass.async_create_task(self._async_heartbeat(lag, watchdog))
+        watchdog.start()
+        profile.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profile.disable()
+            watchdog.stop()
+            heartbeat.cancel()
+            self._task = None
+        try:
+            await self._hass.async_add_executor_job(
+                write_report, filename, profile, lag, watchdog, duration, started
+            )
+        except OSError as ex:
+            _LOGGER.error("Unable to write Wiser profiling report: {}".format(ex))
+            return
+        _LOGGER.warning("Wiser profiling report written to {}".format(filename))
@@ -0,0 +1,74 @@
+"""
+Compiled Wiser schedules
+
+The hub returns a schedule as a dict of days, each holding a list of
+{"Time": hhmm, "DegreesC": tenths} setpoints. CompiledSchedule flattens a
+week of those into two sorted arrays, minute of the week and setpoint, so the
+setpoint in force at any moment and the next change after it are a binary
+search away instead of a walk over the schedule.
+"""
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
+
+from .const import WEEKDAYS, WEEKENDS
+
+DAYS = WEEKDAYS + WEEKENDS
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_week(when):
+    """Minutes since midnight on Monday for a datetime"""
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+class CompiledSchedule:
+    """A week of setpoint changes, sorted by minute of the week"""
+
+    __slots__ = ("minutes", "setpoints")
+
+    def __init__(self, schedule: dict):
+        transitions = {}
+        for day, entries in schedule.items():
+            try:
+                day_start = DAYS.index(day.lower()) * MINUTES_PER_DAY
+            except ValueError:
+                continue  # id, Type and other non-day keys
+            for setpoint in (entries or {}).get("SetPoints") or []:
+                time = int(setpoint.get("Time", 0))
+                if setpoint.get("DegreesC") is None:
+                    continue
+                transitions[day_start + (time // 100) * 60 + time % 100] = int(
+                    setpoint["DegreesC"]
+                )
+
+        minutes = sorted(transitions)
+        # Drop setpoints that repeat the one already in force, the list wraps
+        # round from Sunday night into Monday morning
+        kept = [
+            minute
+            for index, minute in enumerate(minutes)
+            if transitions[minute] != transitions[minutes[index - 1]]
+        ] or minutes[:1]
+        self.minutes = array("H", kept)
+        self.setpoints = array("h", (transitions[minute] for minute in kept))
+
+    def __bool__(self):
+        return bool(self.minutes)
+
+    def setpoint_at(self, when):
+        """Scheduled setpoint, in tenths of a degree, in force at when"""
+        if not self.minutes:
+            return None
+        # Index -1 is the last change of the week, still in force on Monday
+        return self.setpoints[bisect_right(self.minutes, minute_of_week(when)) - 1]
+
+    def next_change(self, when):
+        """Return (datetime, setpoint) of the next change after when"""
+        if len(self.minutes) < 2:
+            return None, None
+        index = bisect_right(self.minutes, minute_of_week(when)) % len(self.minutes)
+        delta = (self.minutes[index] - minute_of_week(when)) % MINUTES_PER_WEEK
+        start = when.replace(second=0, microsecond=0)
+        return start + timedelta(minutes=delta), self.setpoints[index]
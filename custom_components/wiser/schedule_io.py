@@ -0,0 +1,98 @@
+"""
+Schedule files, and other documents the services save
+
+These do blocking file I/O and YAML/JSON parsing, the service handlers run
+them in the executor rather than on the event loop. Files ending in .json
+are JSON, anything else is YAML.
+"""
+import json
+import os
+import tempfile
+
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import ruamel_yaml as yaml
+
+from .util import convert_from_wiser_schedule, validate_schedule
+
+
+def _is_json(filename):
+    return filename.lower().endswith(".json")
+
+
+def save_document(filename, document):
+    """Write document straight to a temporary file, then move it into place"""
+    if not _is_json(filename):
+        # save_yaml dumps to a temporary file and replaces filename too
+        yaml.save_yaml(filename, document)
+        return
+    with tempfile.NamedTemporaryFile(
+        "w",
+        encoding="utf-8",
+        dir=os.path.dirname(filename) or ".",
+        suffix=".tmp",
+        delete=False,
+    ) as output:
+        json.dump(document, output, indent=2)
+    os.replace(output.name, filename)
+
+
+def load_schedule_file(filename):
+    try:
+        if _is_json(filename):
+            with open(filename, encoding="utf-8") as schedule_file:
+                document = json.load(schedule_file)
+        else:
+            document = yaml.load_yaml(filename)
+    except (OSError, ValueError) as ex:
+        raise HomeAssistantError(
+            "Unable to read schedule file {}: {}".format(filename, ex)
+        )
+    if not isinstance(document, dict):
+        raise HomeAssistantError("{} does not contain a schedule".format(filename))
+    return document
+
+
+def save_room_schedule(filename, schedule, name):
+    save_document(filename, convert_from_wiser_schedule(schedule, name))
+
+
+def load_room_schedule(filename):
+    """Read a get_schedule file and convert it to the hub's form"""
+    document = load_schedule_file(filename)
+    try:
+        return validate_schedule(document)
+    except (AttributeError, KeyError, TypeError, ValueError) as ex:
+        raise HomeAssistantError(
+            "Schedule in {} is not valid: {}".format(filename, ex)
+        )
+
+
+def export_schedules(snapshot):
+    """
+    Every room, hot water and smart plug schedule in a snapshot, in the
+    readable form used by get_schedule with rooms and plugs keyed by name
+    """
+    document = {}
+    for section, items in (
+        ("Rooms", snapshot.rooms.values()),
+        ("SmartPlugs", snapshot.smart_plugs.values()),
+    ):
+        schedules = {}
+        for item in items:
+            schedule = snapshot.schedules.get(item.get("ScheduleId"))
+            if schedule is not None:
+                schedules[item.get("Name")] = convert_from_wiser_schedule(schedule)
+        if schedules:
+            document[section] = schedules
+    for hot_water in snapshot.hot_water.values():
+        schedule = snapshot.schedules.get(hot_water.get("ScheduleId"))
+        if schedule is not None:
+            document["HotWater"] = convert_from_wiser_schedule(schedule)
+        break
+    return document
+
+
+def save_schedules(filename, snapshot):
+    """Convert and write a whole hub's schedules, snapshots are read-only so
+    this is safe off the event loop"""
+    save_document(filename, export_schedules(snapshot))
@@ -15,26 +15,55 @@ from homeassistant.const import (
     ATTR_ATTRIBUTION,
     ATTR_BATTERY_LEVEL,
     CONF_ENTITY_NAMESPACE,
+    DEVICE_CLASS_BATTERY,
     STATE_UNKNOWN,
+    TEMP_CELSIUS,
 )
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.icon import icon_for_battery_level
-
-from .const import _LOGGER, BATTERY_FULL, DOMAIN, SIGNAL_STRENGTH_ICONS
+from homeassistant.util import dt as dt_util
+
+from .battery import BATTERY_LOW_VOLTAGE
+from .const import (
+    _LOGGER,
+    BATTERY_FULL,
+    CONF_HUB,
+    DOMAIN,
+    SIGNAL_STRENGTH_ICONS,
+)
 
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Setup the sensor platform."""
-    data = hass.data[DOMAIN]  # Get Handler
+    if discovery_info is None:
+        return
+    data = hass.data[DOMAIN][discovery_info[CONF_HUB]]  # Get Handler
     wiser_devices = []
 
     # Add device sensors, only if there are some
-    if data.wiserhub.getDevices() is not None:
-        for device in data.wiserhub.getDevices():
+    if data.snapshot.devices:
+        for device in data.snapshot.devices.values():
             wiser_devices.append(
                 WiserDeviceSensor(data, device.get("id"), device.get("ProductType"))
             )
 
+    # Add battery sensors, and the fleet wide next batteries due
+    battery_devices = [
+        device.get("id")
+        for device in data.snapshot.devices.values()
+        if device.get("ProductType") in BATTERY_LOW_VOLTAGE
+    ]
+    for device_id in battery_devices:
+        wiser_devices.append(WiserBatterySensor(data, device_id, "Battery"))
+    if battery_devices:
+        wiser_devices.append(WiserBatteriesDueSensor(data, sensorType="Batteries Due"))
+
+    # Add the zigbee mesh sensor
+    if data.network_diagnostics:
+        wiser_devices.append(WiserMeshSensor(data, sensorType="Zigbee Network"))
+
     # Add cloud status sensor
     wiser_devices.append(WiserSystemCloudSensor(data, sensorType="Cloud Sensor"))
     # Add operation sensor
@@ -45,8 +74,16 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     wiser_devices.append(WiserSystemCircuitState(data, sensorType="HEATING"))
     # Dont display Hotwater if hotwater not supported
     # https://github.com/asantaga/wiserHomeAssistantPlatform/issues/8
-    if data.wiserhub.getHotwater() is not None:
+    if data.snapshot.hot_water:
         wiser_devices.append(WiserSystemCircuitState(data, sensorType="HOTWATER"))
+    # Whole-house figures, and the same per heating channel
+    for sensor_type in ("Heat Demand", "Temperature", "Rooms Calling", "Rooms Below"):
+        wiser_devices.append(WiserHouseSensor(data, sensorType=sensor_type))
+    for channel_id in data.snapshot.heating_channels:
+        wiser_devices.append(WiserHeatingChannelSensor(data, channel_id, "Channel"))
+    # Diagnostics for the integration's own hub traffic
+    wiser_devices.append(WiserHubRefreshSensor(data, sensorType="Refresh Time"))
+    wiser_devices.append(WiserHubErrorSensor(data, sensorType="Errors"))
 
     async_add_entities(wiser_devices, True)
 
@@ -60,16 +97,52 @@ class WiserSensor(Entity):
         self.deviceId = device_id
         self.sensor_type = sensorType
         self._state = None
+        self._unsub_dispatchers = []
+
+    async def async_added_to_hass(self):
+        """Subscribe to hub updates for the objects this sensor shows."""
+        self._unsub_dispatchers = [
+            async_dispatcher_connect(self.hass, signal, self._async_hub_updated)
+            for signal in self.update_signals()
+        ]
+        self.data.entities[self.entity_id] = self
+
+    async def async_will_remove_from_hass(self):
+        self.data.entities.pop(self.entity_id, None)
+        for unsub in self._unsub_dispatchers:
+            unsub()
+        self._unsub_dispatchers = []
+
+    def update_signals(self):
+        """Dispatcher signals that should refresh this sensor"""
+        return [self.data.signal()]
+
+    @callback
+    def _async_hub_updated(self):
+        self.async_schedule_update_ha_state(True)
 
     async def async_update(self):
         _LOGGER.debug("{} device update requested".format(self.device_name))
-        await self.data.async_update()
+
+    @property
+    def should_poll(self):
+        """Updates are pushed by the hub handle"""
+        return False
+
+    @property
+    def available(self):
+        """Unavailable while the hub is not answering"""
+        return self.data.available
 
     @property
     def name(self):
         """Return the name of the sensor"""
         return self.device_name
 
+    @property
+    def unique_id(self):
+        return self.data.unique_id("sensor", self.sensor_type, self.deviceId)
+
     @property
     def state(self):
         """Return the state of the sensor."""
@@ -83,48 +156,57 @@ class WiserDeviceSensor(WiserSensor):
     def __init__(self, data, device_id=0, sensorType=""):
         super().__init__(data, device_id, sensorType)
         self.device_name = self.get_device_name()
+        # Attributes for the current device data, None until next needed
+        self._attrs = None
         _LOGGER.info("{} device init".format(self.device_name))
 
+    def update_signals(self):
+        signals = super().update_signals()
+        signals.append(self.data.signal("Device", self.deviceId))
+        if self.sensor_type == "RoomStat":
+            signals.append(self.data.signal("RoomStat", self.deviceId))
+        if self.sensor_type == "Controller":
+            signals.append(self.data.signal("Zigbee"))
+        return signals
+
+    def history_keys(self):
+        """Hub objects whose history the query_history service reports"""
+        keys = [("Device", self.deviceId)]
+        if self.sensor_type == "RoomStat":
+            keys.append(("RoomStat", self.deviceId))
+        return keys
+
+    @callback
+    def _async_hub_updated(self):
+        # Only the signals for this device's data get here
+        self._attrs = None
+        super()._async_hub_updated()
+
     async def async_update(self):
         """Fetch new state data for the sensor."""
         await super().async_update()
-        self._state = self.data.wiserhub.getDevice(self.deviceId).get(
+        self._state = self.data.snapshot.device(self.deviceId).get(
             "DisplayedSignalStrength"
         )
 
     def get_device_name(self):
         """Return the name of the Device"""
-        product_type = str(
-            self.data.wiserhub.getDevice(self.deviceId).get("ProductType") or ""
-        )
+        device_data = self.data.snapshot.device(self.deviceId)
+        product_type = str(device_data.get("ProductType") or "")
 
         if product_type == "Controller":
-            return "Wiser Heathub"  # Only ever one of these
-        elif product_type == "iTRV":
-            # Multiple ones get automagically number _n by HA
-            return (
-                "Wiser "
-                + product_type
-                + "-"
-                + self.data.wiserhub.getDeviceRoom(self.deviceId)["roomName"]
-            )
-        elif product_type == "RoomStat":
-            # Usually only one per room
-            return (
-                "Wiser "
-                + product_type
-                + "-"
-                + self.data.wiserhub.getDeviceRoom(self.deviceId)["roomName"]
+            return self.data.entity_name("Heathub")  # Only ever one of these per hub
+        elif product_type in ("iTRV", "RoomStat"):
+            # Named after the room, or the serial number when not in a room.
+            # Multiple iTRVs in a room get automagically number _n by HA
+            return self.data.entity_name(
+                device_label(self.data.snapshot, self.deviceId)
             )
         else:
-            return (
-                "Wiser "
-                + product_type
+            return self.data.entity_name(
+                product_type
                 + "-"
-                + str(
-                    self.data.wiserhub.getDevice(self.deviceId).get("SerialNumber")
-                    or ""
-                )
+                + str(device_data.get("SerialNumber") or "")
             )
 
     @property
@@ -132,9 +214,7 @@ class WiserDeviceSensor(WiserSensor):
         """Return icon for signal strength"""
         try:
             return SIGNAL_STRENGTH_ICONS[
-                self.data.wiserhub.getDevice(self.deviceId).get(
-                    "DisplayedSignalStrength"
-                )
+                self.data.snapshot.device(self.deviceId).get("DisplayedSignalStrength")
             ]
         except KeyError as ex:
             # Handle anything else as no signal
@@ -142,75 +222,71 @@ class WiserDeviceSensor(WiserSensor):
 
     @property
     def device_state_attributes(self):
+        """Built on first use after this device's data changes, then reused"""
+        if self._attrs is None:
+            self._attrs = self._device_attributes()
+        return self._attrs
+
+    def _device_attributes(self):
         _LOGGER.debug(
             "State attributes for {} {}".format(self.deviceId, self.sensor_type)
         )
-        attrs = {}
-        device_data = self.data.wiserhub.getDevice(self.deviceId)
+        device_data = self.data.snapshot.device(self.deviceId)
+        get = device_data.get
+        product_type = get("ProductType")
 
         """ Generic attributes """
-        attrs["vendor"] = "Drayton Wiser"
-        attrs["product_type"] = device_data.get("ProductType")
-        attrs["model_identifier"] = device_data.get("ModelIdentifier")
-        attrs["device_lock_enabled"] = device_data.get("DeviceLockEnabled")
-        attrs["displayed_signal_strength"] = device_data.get("DisplayedSignalStrength")
-        attrs["firmware"] = device_data.get("ActiveFirmwareVersion")
-        attrs["serial_number"] = device_data.get("SerialNumber")
+        attrs = {
+            "vendor": "Drayton Wiser",
+            "product_type": product_type,
+            "model_identifier": get("ModelIdentifier"),
+            "device_lock_enabled": get("DeviceLockEnabled"),
+            "displayed_signal_strength": get("DisplayedSignalStrength"),
+            "firmware": get("ActiveFirmwareVersion"),
+            "serial_number": get("SerialNumber"),
+        }
 
         """ if controller then add the zigbee data to the controller info """
-        if device_data.get("ProductType")=="Controller":
-            attrs["zigbee_channel"] = self.data.wiserhub.getHubData().get("Zigbee").get("NetworkChannel")
-
-
-
-        """ Network Data"""
-        attrs["node_id"] = device_data.get("NodeId")
-        attrs["displayed_signal_strength"] = device_data.get("DisplayedSignalStrength")
-
-        if self.sensor_type in ["RoomStat", "iTRV"]:
-            attrs["parent_node_id"] = device_data.get("ParentNodeId")
-            """ hub route"""
-            if device_data.get("ParentNodeId")==0:
-
-                attrs["hub_route"] = "direct"
-            else:
-                attrs["hub_route"] = "repeater"
-
-
-        if device_data.get("ReceptionOfDevice") is not None:
-            attrs["device_reception_RSSI"] = device_data.get("ReceptionOfDevice").get(
-                "Rssi"
-            )
-            attrs["device_reception_LQI"] = device_data.get("ReceptionOfDevice").get(
-                "Lqi"
+        if product_type == "Controller":
+            attrs["zigbee_channel"] = self.data.snapshot.zigbee.get("NetworkChannel")
+
+        """ Network Data, can be turned off with network_diagnostics """
+        if self.data.network_diagnostics:
+            attrs["node_id"] = get("NodeId")
+
+            if self.sensor_type in ("RoomStat", "iTRV"):
+                parent_node_id = get("ParentNodeId")
+                attrs["parent_node_id"] = parent_node_id
+                """ hub route"""
+                attrs["hub_route"] = "direct" if parent_node_id == 0 else "repeater"
+
+            device_reception = get("ReceptionOfDevice")
+            if device_reception is not None:
+                attrs["device_reception_RSSI"] = device_reception.get("Rssi")
+                attrs["device_reception_LQI"] = device_reception.get("Lqi")
+
+            controller_reception = get("ReceptionOfController")
+            if controller_reception is not None:
+                attrs["controller_reception_RSSI"] = controller_reception.get("Rssi")
+                attrs["controller_reception_LQI"] = controller_reception.get("Lqi")
+
+            attrs.update(
+                self.data.topology.link(self.deviceId, dt_util.utcnow().timestamp())
             )
 
-        if device_data.get("ReceptionOfController") is not None:
-            attrs["controller_reception_RSSI"] = device_data.get(
-                "ReceptionOfController"
-            ).get("Rssi")
-            attrs["device_reception_LQI"] = device_data.get(
-                "ReceptionOfController"
-            ).get("Lqi")
-
         """ Battery Data """
-        if self.sensor_type in ["RoomStat", "iTRV", "SmartPlug"] and device_data.get(
-            "BatteryVoltage"
-        ):
-            attrs["battery_voltage"] = device_data.get("BatteryVoltage")
-            attrs["battery_percent"] = int(
-                device_data.get("BatteryVoltage") / BATTERY_FULL * 100
-            )
-            attrs["battery_level"] = device_data.get("BatteryLevel")
-            attrs["serial_number"] = device_data.get("SerialNumber")
+        battery_voltage = get("BatteryVoltage")
+        if self.sensor_type in ("RoomStat", "iTRV", "SmartPlug") and battery_voltage:
+            attrs["battery_voltage"] = battery_voltage
+            attrs["battery_percent"] = int(battery_voltage / BATTERY_FULL * 100)
+            attrs["battery_level"] = get("BatteryLevel")
 
         """ Other """
         if self.sensor_type == "RoomStat":
-            attrs["humidity"] = self.data.wiserhub.getRoomStatData(self.deviceId).get(
+            attrs["humidity"] = self.data.snapshot.room_stat(self.deviceId).get(
                 "MeasuredHumidity"
             )
 
-
         return attrs
 
 
@@ -222,20 +298,36 @@ class WiserSystemCircuitState(WiserSensor):
         self.device_name = self.get_device_name()
         _LOGGER.info("{} device init".format(self.device_name))
 
+    def update_signals(self):
+        signals = super().update_signals()
+        if self.sensor_type == "HEATING":
+            signals.append(self.data.signal("HeatingChannel"))
+        else:
+            signals.append(self.data.signal("HotWater"))
+        return signals
+
+    def history_keys(self):
+        if self.sensor_type != "HEATING":
+            return []
+        return [
+            ("HeatingChannel", channel_id)
+            for channel_id in self.data.snapshot.heating_channels
+        ]
+
     async def async_update(self):
         """Fetch new state data for the sensor."""
         await super().async_update()
         if self.sensor_type == "HEATING":
-            self._state = self.data.wiserhub.getHeatingRelayStatus()
+            self._state = self.data.snapshot.heating_relay_status
         else:
-            self._state = self.data.wiserhub.getHotwaterRelayStatus()
+            self._state = self.data.snapshot.hotwater_relay_status
 
     def get_device_name(self):
         """Return the name of the Device """
         if self.sensor_type == "HEATING":
-            return "Wiser Heating"
+            return self.data.entity_name("Heating")
         else:
-            return "Wiser Hot Water"
+            return self.data.entity_name("Hot Water")
 
     @property
     def icon(self):
@@ -256,8 +348,8 @@ class WiserSystemCircuitState(WiserSensor):
         """ returns additional info"""
         attrs = {}
         if self.sensor_type == "HEATING":
-            heating_channels = self.data.wiserhub.getHeatingChannels()
-            for heatingChannel in heating_channels:
+            heating_channels = self.data.snapshot.heating_channels
+            for heatingChannel in heating_channels.values():
                 channel_name = heatingChannel.get("Name")
                 channel_pct_dmd = heatingChannel.get("PercentageDemand")
                 channel_room_ids = heatingChannel.get("RoomIds")
@@ -276,14 +368,17 @@ class WiserSystemCloudSensor(WiserSensor):
         self.device_name = self.get_device_name()
         _LOGGER.info("{} device init".format(self.device_name))
 
+    def update_signals(self):
+        return super().update_signals() + [self.data.signal("System")]
+
     async def async_update(self):
         """Fetch new state data for the sensor."""
         await super().async_update()
-        self._state = self.data.wiserhub.getSystem().get("CloudConnectionStatus")
+        self._state = self.data.snapshot.system.get("CloudConnectionStatus")
 
     def get_device_name(self):
         """Return the name of the Device """
-        return "Wiser Cloud Status"
+        return self.data.entity_name("Cloud Status")
 
     @property
     def icon(self):
@@ -299,17 +394,23 @@ class WiserSystemOperationModeSensor(WiserSensor):
     def __init__(self, data, device_id=0, sensorType=""):
         super().__init__(data, device_id, sensorType)
         self.device_name = self.get_device_name()
-        self.override_type = self.data.wiserhub.getSystem().get("OverrideType")
-        self.away_temperature = self.data.wiserhub.getSystem().get(
+        self.override_type = self.data.snapshot.system.get("OverrideType")
+        self.away_temperature = self.data.snapshot.system.get(
             "AwayModeSetPointLimit"
         )
         _LOGGER.info("{} device init".format(self.device_name))
 
+    def update_signals(self):
+        return super().update_signals() + [
+            self.data.signal("System"),
+            self.data.signal("Polling"),
+        ]
+
     async def async_update(self):
         """Fetch new state data for the sensor."""
         await super().async_update()
-        self.override_type = self.data.wiserhub.getSystem().get("OverrideType")
-        self.away_temperature = self.data.wiserhub.getSystem().get(
+        self.override_type = self.data.snapshot.system.get("OverrideType")
+        self.away_temperature = self.data.snapshot.system.get(
             "AwayModeSetPointLimit"
         )
         self._state = self.mode()
@@ -322,7 +423,7 @@ class WiserSystemOperationModeSensor(WiserSensor):
 
     def get_device_name(self):
         """Return the name of the Device """
-        return "Wiser Operation Mode"
+        return self.data.entity_name("Operation Mode")
 
     @property
     def icon(self):
@@ -334,7 +435,12 @@ class WiserSystemOperationModeSensor(WiserSensor):
     @property
     def device_state_attributes(self):
         """Return the device state attributes."""
-        attrs = {"AwayModeTemperature": -1.0}
+        attrs = {
+            "AwayModeTemperature": -1.0,
+            "poll_interval": self.data.poll_interval.total_seconds(),
+            "poll_mode": self.data.poll_mode,
+            "stale": self.data.stale,
+        }
         if self.away_temperature:
             try:
                 attrs["AwayModeTemperature"] = round(self.away_temperature / 10.0, 1)
@@ -344,3 +450,317 @@ class WiserSystemOperationModeSensor(WiserSensor):
                     self.away_temperature,
                 )
         return attrs
+
+
+class WiserHubMetricsSensor(WiserSensor):
+    """Base for sensors showing the integration's own hub metrics"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self.device_name = self.data.entity_name("Hub " + sensorType)
+
+    def update_signals(self):
+        return [self.data.signal("Metrics")]
+
+    @property
+    def available(self):
+        """Still reported while the hub is down, that is when they matter"""
+        return True
+
+
+class WiserHubRefreshSensor(WiserHubMetricsSensor):
+    """Time taken by the last hub fetch, with the refresh timings as attributes"""
+
+    async def async_update(self):
+        fetch_ms = self.data.metrics.last("fetch_ms")
+        self._state = None if fetch_ms is None else round(fetch_ms)
+
+    @property
+    def unit_of_measurement(self):
+        return "ms"
+
+    @property
+    def icon(self):
+        return "mdi:timer-outline"
+
+    @property
+    def device_state_attributes(self):
+        attrs = {}
+        for name, histogram in self.data.metrics.histograms.items():
+            if histogram.count:
+                summary = histogram.as_dict()
+                for statistic in ("mean", "p95", "max"):
+                    attrs["{}_{}".format(name, statistic)] = summary[statistic]
+        for name in ("refresh_scheduled", "refresh_forced", "refresh_shared"):
+            attrs[name] = self.data.metrics.counters.get(name, 0)
+        return attrs
+
+
+class WiserHubErrorSensor(WiserHubMetricsSensor):
+    """Total hub errors since start up, broken down in the attributes"""
+
+    async def async_update(self):
+        self._state = self.data.metrics.errors
+
+    @property
+    def icon(self):
+        return "mdi:alert-circle-outline"
+
+    @property
+    def device_state_attributes(self):
+        attrs = {
+            name: count
+            for name, count in self.data.metrics.counters.items()
+            if name.startswith("error")
+        }
+        attrs["health"] = self.data.health.state
+        attrs["last_error"] = self.data.health.last_error
+        return attrs
+
+
+# Sensor type -> (name, figure shown as the state, unit, icon)
+HOUSE_SENSORS = {
+    "Heat Demand": ("House Heat Demand", "heat_demand", "%", "mdi:radiator"),
+    "Temperature": (
+        "House Temperature",
+        "mean_temperature",
+        TEMP_CELSIUS,
+        "mdi:thermometer",
+    ),
+    "Rooms Calling": (
+        "Rooms Calling For Heat",
+        "rooms_calling_for_heat",
+        "rooms",
+        "mdi:fire",
+    ),
+    "Rooms Below": (
+        "Rooms Below Setpoint",
+        "rooms_below_setpoint",
+        "rooms",
+        "mdi:thermometer-chevron-down",
+    ),
+}
+
+
+class WiserAnalyticsSensor(WiserSensor):
+    """Base for sensors showing figures from the hub's HouseAnalytics"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self._figures = {}
+
+    def update_signals(self):
+        return super().update_signals() + [self.data.signal("Analytics")]
+
+    @property
+    def device_state_attributes(self):
+        return self._figures
+
+
+class WiserHouseSensor(WiserAnalyticsSensor):
+    """One whole-house figure, with the others as attributes"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self.device_name = self.data.entity_name(HOUSE_SENSORS[sensorType][0])
+
+    async def async_update(self):
+        self._figures = self.data.analytics.house
+        value = self._figures.get(HOUSE_SENSORS[self.sensor_type][1])
+        # Lists of rooms are shown as how many there are
+        self._state = len(value) if isinstance(value, (list, dict)) else value
+
+    @property
+    def unit_of_measurement(self):
+        return HOUSE_SENSORS[self.sensor_type][2]
+
+    @property
+    def icon(self):
+        return HOUSE_SENSORS[self.sensor_type][3]
+
+
+class WiserHeatingChannelSensor(WiserAnalyticsSensor):
+    """Demand of one heating channel, with its rooms' figures as attributes"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self.device_name = self.data.entity_name(
+            data.snapshot.heating_channels[device_id].get("Name") or "Heating Channel"
+        )
+
+    async def async_update(self):
+        self._figures = self.data.analytics.channels.get(self.deviceId, {})
+        self._state = self._figures.get("percentage_demand")
+
+    @property
+    def unit_of_measurement(self):
+        return "%"
+
+    @property
+    def icon(self):
+        return "mdi:radiator"
+
+
+def device_label(snapshot, device_id):
+    """Product type and room, or serial number, of a device"""
+    device = snapshot.device(device_id)
+    room = snapshot.device_room(device_id)
+    return "{}-{}".format(
+        device.get("ProductType"), room.get("Name") or device.get("SerialNumber")
+    )
+
+
+def battery_percent(voltage):
+    return min(100, int(voltage / BATTERY_FULL * 100))
+
+
+class WiserBatterySensor(WiserSensor):
+    """Battery level of one device and when it is forecast to run low"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        device = self.data.snapshot.device(device_id)
+        self.product_type = device.get("ProductType")
+        self.device_name = self.data.entity_name(
+            device_label(self.data.snapshot, device_id) + " Battery"
+        )
+        self._attrs = {}
+
+    def update_signals(self):
+        return super().update_signals() + [
+            self.data.signal("Device", self.deviceId),
+            self.data.signal("Battery"),
+        ]
+
+    async def async_update(self):
+        device = self.data.snapshot.device(self.deviceId)
+        voltage = device.get("BatteryVoltage")
+        days, due = self.data.batteries.forecast(
+            self.deviceId, self.product_type, dt_util.utcnow().timestamp()
+        )
+        self._state = battery_percent(voltage) if voltage else None
+        if due is not None:
+            due = dt_util.as_local(due).date().isoformat()
+        # Voltages in the hub's tenths of a volt, as on the device sensors
+        self._attrs = {
+            "battery_voltage": voltage,
+            "battery_level": device.get("BatteryLevel"),
+            "low_battery_voltage": BATTERY_LOW_VOLTAGE[self.product_type],
+            "days_until_low": days,
+            "low_battery_due": due,
+        }
+
+    @property
+    def device_class(self):
+        return DEVICE_CLASS_BATTERY
+
+    @property
+    def unit_of_measurement(self):
+        return "%"
+
+    @property
+    def icon(self):
+        if self._state is None:
+            return "mdi:battery-unknown"
+        return icon_for_battery_level(self._state)
+
+    @property
+    def device_state_attributes(self):
+        return self._attrs
+
+
+class WiserBatteriesDueSensor(WiserSensor):
+    """Days until the next device's batteries are forecast to run low"""
+
+    # How many of the soonest devices to list
+    LISTED = 10
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self.device_name = self.data.entity_name("Next Batteries Due")
+        self._attrs = {}
+
+    def update_signals(self):
+        return super().update_signals() + [self.data.signal("Battery")]
+
+    async def async_update(self):
+        now = dt_util.utcnow().timestamp()
+        forecasts = []
+        for device_id, device in self.data.snapshot.devices.items():
+            product_type = device.get("ProductType")
+            if product_type not in BATTERY_LOW_VOLTAGE:
+                continue
+            days, due = self.data.batteries.forecast(device_id, product_type, now)
+            if days is None:
+                continue
+            forecasts.append((days, device_label(self.data.snapshot, device_id), due))
+        forecasts.sort(key=lambda forecast: forecast[0])
+        self._state = round(forecasts[0][0]) if forecasts else None
+        self._attrs = {
+            "due_within_30_days": sum(1 for days, _, _ in forecasts if days <= 30),
+            "forecast_devices": len(forecasts),
+            "next_due": {
+                name: dt_util.as_local(due).date().isoformat()
+                for _, name, due in forecasts[: self.LISTED]
+            },
+        }
+
+    @property
+    def unit_of_measurement(self):
+        return "days"
+
+    @property
+    def icon(self):
+        return "mdi:battery-clock"
+
+    @property
+    def device_state_attributes(self):
+        return self._attrs
+
+
+class WiserMeshSensor(WiserSensor):
+    """Devices with zigbee link problems, with the mesh layout as attributes"""
+
+    def __init__(self, data, device_id=0, sensorType=""):
+        super().__init__(data, device_id, sensorType)
+        self.device_name = self.data.entity_name("Zigbee Network")
+        self._attrs = {}
+
+    def update_signals(self):
+        return super().update_signals() + [self.data.signal("Topology")]
+
+    async def async_update(self):
+        snapshot = self.data.snapshot
+        topology = self.data.topology
+        problems = topology.problems(dt_util.utcnow().timestamp())
+        self._state = len(problems)
+        repeaters = {}
+        hops = []
+        for node in topology.nodes.values():
+            if node.hops:
+                hops.append(node.hops)
+            children = topology.children.get(node.node_id)
+            if children and node.product_type != "Controller":
+                repeaters[device_label(snapshot, node.device_id)] = len(children)
+        self._attrs = {
+            "devices": len(topology.nodes),
+            "direct": len(topology.children.get(0, ())),
+            "repeaters": repeaters,
+            "max_hops": max(hops) if hops else None,
+            "problems": {
+                device_label(snapshot, device_id): ", ".join(found)
+                for device_id, found in problems.items()
+            },
+        }
+
+    @property
+    def unit_of_measurement(self):
+        return "devices"
+
+    @property
+    def icon(self):
+        return "mdi:lan-disconnect" if self._state else "mdi:lan-connect"
+
+    @property
+    def device_state_attributes(self):
+        return self._attrs
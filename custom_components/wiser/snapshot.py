@@ -0,0 +1,265 @@
+"""
+Indexed, read-only view of a Wiser Hub payload
+
+A snapshot is built once after every successful refresh so the platforms can
+look rooms, devices and plugs up by id instead of scanning the hub JSON on
+every property access.
+"""
+from time import monotonic
+from types import MappingProxyType
+
+from .const import _LOGGER
+
+EMPTY = MappingProxyType({})
+
+# Snapshot attribute holding each hub section
+SECTIONS = {
+    "Room": "rooms",
+    "Device": "devices",
+    "SmartPlug": "smart_plugs",
+    "HeatingChannel": "heating_channels",
+    "RoomStat": "room_stats",
+    "Schedule": "schedules",
+    "HotWater": "hot_water",
+}
+
+# Hub sections kept in the warm-start cache, everything the platforms read
+CACHED_SECTIONS = ("System", "Zigbee") + tuple(SECTIONS)
+
+# How long a written value may be missing from the hub data before it is
+# treated as not applied and rolled back
+OPTIMISTIC_TIMEOUT = 60
+
+
+def _index(items):
+    """Key a list of hub objects by their id"""
+    return MappingProxyType({item.get("id"): item for item in (items or [])})
+
+
+class WiserHubSnapshot:
+    """Immutable, id-keyed snapshot of the hub data"""
+
+    __slots__ = (
+        "raw",
+        "system",
+        "zigbee",
+        "rooms",
+        "devices",
+        "smart_plugs",
+        "heating_channels",
+        "room_stats",
+        "schedules",
+        "hot_water",
+        "device_rooms",
+    )
+
+    def __init__(self, hub_data: dict):
+        self.raw = hub_data
+        self.system = MappingProxyType(hub_data.get("System") or {})
+        self.zigbee = MappingProxyType(hub_data.get("Zigbee") or {})
+        self.rooms = _index(hub_data.get("Room"))
+        self.devices = _index(hub_data.get("Device"))
+        self.smart_plugs = _index(hub_data.get("SmartPlug"))
+        self.heating_channels = _index(hub_data.get("HeatingChannel"))
+        self.room_stats = _index(hub_data.get("RoomStat"))
+        self.schedules = _index(hub_data.get("Schedule"))
+        self.hot_water = _index(hub_data.get("HotWater"))
+
+        device_rooms = {}
+        for room_id, room in self.rooms.items():
+            if room.get("RoomStatId") is not None:
+                device_rooms[room.get("RoomStatId")] = room_id
+            for valve_id in room.get("SmartValveIds") or []:
+                device_rooms[valve_id] = room_id
+        self.device_rooms = MappingProxyType(device_rooms)
+
+    def compact(self):
+        """The parts of the hub payload worth caching between restarts"""
+        return {
+            section: self.raw[section]
+            for section in CACHED_SECTIONS
+            if section in self.raw
+        }
+
+    def item(self, section, item_id=None):
+        """Return one hub object, or the System section"""
+        if section == "System":
+            return self.system
+        return getattr(self, SECTIONS[section]).get(item_id, EMPTY)
+
+    def patched(self, overrides):
+        """
+        Return a copy of the snapshot with overrides laid over it.
+
+        overrides is a list of (section, id, values) with the values to
+        replace in that hub object, the id is ignored for the System section.
+        """
+        if not overrides:
+            return self
+        snapshot = object.__new__(WiserHubSnapshot)
+        for slot in self.__slots__:
+            setattr(snapshot, slot, getattr(self, slot))
+        patched_sections = {}
+        for section, item_id, values in overrides:
+            if section == "System":
+                snapshot.system = MappingProxyType({**snapshot.system, **values})
+                continue
+            items = patched_sections.setdefault(
+                section, dict(getattr(self, SECTIONS[section]))
+            )
+            if item_id in items:
+                items[item_id] = {**items[item_id], **values}
+        for section, items in patched_sections.items():
+            setattr(snapshot, SECTIONS[section], MappingProxyType(items))
+        return snapshot
+
+    def room(self, room_id):
+        return self.rooms.get(room_id, EMPTY)
+
+    def device(self, device_id):
+        return self.devices.get(device_id, EMPTY)
+
+    def smart_plug(self, plug_id):
+        return self.smart_plugs.get(plug_id, EMPTY)
+
+    def room_stat(self, device_id):
+        return self.room_stats.get(device_id, EMPTY)
+
+    def device_room(self, device_id):
+        """Return the room a roomstat or iTRV belongs to"""
+        return self.room(self.device_rooms.get(device_id))
+
+    def room_schedule(self, room_id):
+        return self.schedules.get(self.room(room_id).get("ScheduleId"))
+
+    @property
+    def heating_relay_status(self):
+        """On if any heating channel has its relay on"""
+        for channel in self.heating_channels.values():
+            if channel.get("HeatingRelayState") == "On":
+                return "On"
+        return "Off"
+
+    @property
+    def hotwater_relay_status(self):
+        for hot_water in self.hot_water.values():
+            return hot_water.get("WaterHeatingState")
+        return False
+
+
+def changed_items(old, new):
+    """
+    Return the (section, id) keys whose data differs between two snapshots.
+
+    A (section, None) key is included for every section with a change, System
+    and Zigbee are single objects and only ever appear that way.
+    """
+    changed = set()
+    if old.system != new.system:
+        changed.add(("System", None))
+    if old.zigbee != new.zigbee:
+        changed.add(("Zigbee", None))
+    for section, attr in SECTIONS.items():
+        old_items = getattr(old, attr)
+        new_items = getattr(new, attr)
+        if old_items is new_items:
+            continue
+        section_changed = False
+        for item_id in old_items.keys() | new_items.keys():
+            old_item = old_items.get(item_id)
+            new_item = new_items.get(item_id)
+            if old_item is not new_item and old_item != new_item:
+                changed.add((section, item_id))
+                section_changed = True
+        if section_changed:
+            changed.add((section, None))
+    return changed
+
+
+# Hub values that also confirm a commanded one, a boost started while the
+# house is away is reported with its own origin
+EQUIVALENT_VALUES = {"FromBoost": ("FromBoostDuringAway",)}
+
+
+def _matches(expected, actual):
+    if expected in (None, "None"):
+        return actual in (None, "None")
+    if expected == actual:
+        return True
+    return isinstance(expected, str) and actual in EQUIVALENT_VALUES.get(expected, ())
+
+
+class OptimisticOverlay:
+    """
+    Values commanded on the hub but not yet seen in its data.
+
+    Entries are shown straight away. Once their write has been sent the next
+    refresh either confirms them or, after OPTIMISTIC_TIMEOUT, rolls them
+    back with a logged mismatch.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def add(self, key, section, item_id, values, replaces_item=False):
+        """
+        Record values expected in a hub object once the write for key lands.
+
+        The latest write owns each value, earlier entries for the same object
+        stop expecting the ones it sets, or all of them if replaces_item.
+        """
+        item = (section, item_id)
+        for other_key, other in list(self._entries.items()):
+            if other["item"] != item:
+                continue
+            other["values"] = {
+                name: value
+                for name, value in other["values"].items()
+                if name not in values and not replaces_item
+            }
+            if not other["values"]:
+                del self._entries[other_key]
+        entry = {"item": item, "values": values, "sent": None}
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        return entry
+
+    @staticmethod
+    def mark_sent(entry):
+        entry["sent"] = monotonic()
+
+    def discard(self, key, entry):
+        """Drop entry if it has not been replaced by a later write"""
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def apply(self, snapshot):
+        return snapshot.patched(
+            [entry["item"] + (entry["values"],) for entry in self._entries.values()]
+        )
+
+    def reconcile(self, snapshot):
+        """Settle sent entries against freshly fetched hub data"""
+        now = monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry["sent"] is None:
+                continue
+            actual = snapshot.item(*entry["item"])
+            mismatched = {
+                name: actual.get(name)
+                for name, value in entry["values"].items()
+                if not _matches(value, actual.get(name))
+            }
+            if not mismatched:
+                _LOGGER.debug("Hub confirmed {} for {}".format(entry["values"], key))
+                del self._entries[key]
+            elif now - entry["sent"] > OPTIMISTIC_TIMEOUT:
+                _LOGGER.warning(
+                    "Hub did not apply {} for {}, it reports {}. Rolling back".format(
+                        entry["values"], key, mismatched
+                    )
+                )
+                del self._entries[key]
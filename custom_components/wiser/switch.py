@@ -1,13 +1,15 @@
 import asyncio
 
 from homeassistant.components.switch import SwitchDevice
-from .const import _LOGGER, DOMAIN, WISER_SWITCHES
+from . import async_extract_wiser_entities, wiser_service_schema
+from .const import _LOGGER, CONF_HUB, DOMAIN, WISER_SWITCHES
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant.const import (
     ATTR_ENTITY_ID,
 )
 from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
 
 from .const import _LOGGER, DOMAIN
@@ -20,9 +22,8 @@ SERVICE_SET_SMARTPLUG_MODE="set_smartplug_mode"
 SERVICE_SET_HOTWATER_MODE="set_hotwater_mode"
 
 
-SET_PLUG_MODE_SCHEMA = vol.Schema(
+SET_PLUG_MODE_SCHEMA = wiser_service_schema(
     {
-        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
         vol.Required(ATTR_PLUG_MODE, default="Auto"): vol.Coerce(str),
     }
 )
@@ -31,51 +32,55 @@ SET_HOTWATER_MODE_SCHEMA = vol.Schema(
     {
 
         vol.Required(ATTR_HOTWATER_MODE, default="auto"): vol.Coerce(str),
+        vol.Optional(CONF_HUB): cv.string,
     }
 )
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Add the Wiser System Switch entities"""
-    data = hass.data[DOMAIN]
+    if discovery_info is None:
+        return
+    data = hass.data[DOMAIN][discovery_info[CONF_HUB]]
 
     # Add System Switches
     wiser_switches = [
         WiserSwitch(hass, data, switchType, hubKey)  for switchType, hubKey in WISER_SWITCHES.items()
     ]
-    async_add_entities(wiser_switches)
+    async_add_entities(wiser_switches, True)
 
     # Add SmartPlugs (if any)
-    if data.wiserhub.getSmartPlugs() is not None:
+    if data.snapshot.smart_plugs:
         wiser_smart_plugs = [
-            WiserSmartPlug(hass, data, plug.get("id"), plug.get("Name")) for plug in data.wiserhub.getSmartPlugs()
+            WiserSmartPlug(hass, data, plug.get("id"), plug.get("Name")) for plug in data.snapshot.smart_plugs.values()
         ]
-        async_add_entities(wiser_smart_plugs)
+        async_add_entities(wiser_smart_plugs, True)
 
+    if hass.services.has_service(DOMAIN, SERVICE_SET_HOTWATER_MODE):
+        # Registered by the first hub, the services cover every hub
+        return True
 
 
-    @callback
-    def set_smartplug_mode(service):
-        device_found=False
-        entity_id = service.data[ATTR_ENTITY_ID]
+    async def set_smartplug_mode(service):
         smart_plug_mode = service.data[ATTR_PLUG_MODE]
-        print("data = {} {}".format(entity_id,smart_plug_mode))
-
-        for smart_plug in wiser_smart_plugs:
-
-            if smart_plug.entity_id == entity_id:
-                device_found=True
-                hass.async_create_task(
-                    smart_plug.set_smartplug_mode(smart_plug_mode)
-                )
-            smart_plug.schedule_update_ha_state(True)
-            break
+        smart_plugs = await async_extract_wiser_entities(hass, service, WiserSmartPlug)
+        await asyncio.gather(
+            *(
+                smart_plug.set_smartplug_mode(smart_plug_mode)
+                for smart_plug in smart_plugs
+            )
+        )
 
     @callback
     def set_hotwater_mode(service):
         hotwater_mode = service.data[ATTR_HOTWATER_MODE]
-        hass.async_create_task(
-            data.set_hotwater_mode(hotwater_mode)
-        )
+        hub_id = service.data.get(CONF_HUB)
+        for hub in hass.data[DOMAIN].values():
+            if hub_id is not None and hub.hub_id != hub_id:
+                continue
+            if hub.snapshot.hot_water:
+                hass.async_create_task(
+                    hub.set_hotwater_mode(hotwater_mode)
+                )
 
 
     """ Register Services """
@@ -98,39 +103,59 @@ class WiserSwitch(SwitchDevice):
         """Initialize the sensor."""
         _LOGGER.info("Wiser {} Switch Init".format(switchType))
         self.data = data
-        self._force_update = False
+        self._unsub_dispatchers = []
         self.hass = hass
         self.hub_key = hubKey
         self.switch_type = switchType
         self.awayTemperature = None
 
+    async def async_added_to_hass(self):
+        """Subscribe to hub updates for the system settings."""
+        self._unsub_dispatchers = [
+            async_dispatcher_connect(self.hass, signal, self._async_hub_updated)
+            for signal in (self.data.signal(), self.data.signal("System"))
+        ]
+        self.data.entities[self.entity_id] = self
+
+    async def async_will_remove_from_hass(self):
+        self.data.entities.pop(self.entity_id, None)
+        for unsub in self._unsub_dispatchers:
+            unsub()
+        self._unsub_dispatchers = []
+
+    @callback
+    def _async_hub_updated(self):
+        self.async_schedule_update_ha_state(True)
+
     async def async_update(self):
         _LOGGER.debug("Wiser {} Switch Update requested".format(self.switch_type))
-        if self._force_update:
-            await self.data.async_update(no_throttle=True)
-            self._force_update = False
-        else:
-            await self.data.async_update()
-
         if self.switch_type == "Away Mode":
             self.awayTemperature = round(
-                self.data.wiserhub.getSystem().get("AwayModeSetPointLimit") / 10, 1
+                self.data.snapshot.system.get("AwayModeSetPointLimit") / 10, 1
             )
 
     @property
     def name(self):
         """Return the name of the Device """
-        return "Wiser " + self.switch_type
+        return self.data.entity_name(self.switch_type)
+
+    @property
+    def unique_id(self):
+        return self.data.unique_id("switch", self.hub_key)
 
     @property
     def should_poll(self):
         """Return the polling state."""
-        return True
+        return False
+
+    @property
+    def available(self):
+        return self.data.available
 
     @property
     def is_on(self):
         """Return true if device is on."""
-        status = self.data.wiserhub.getSystem().get(self.hub_key)
+        status = self.data.snapshot.system.get(self.hub_key)
         _LOGGER.debug("{}: {}".format(self.switch_type, status))
         if self.switch_type == "Away Mode":
             return status and status.lower() == "away"
@@ -162,33 +187,57 @@ class WiserSmartPlug(SwitchDevice):
         self.plug_name = name
         self.smart_plug_id = plugId
         self.data = data
-        self._force_update = False
+        self._unsub_dispatchers = []
         self.hass = hass
         self._is_on = False
 
+    async def async_added_to_hass(self):
+        """Subscribe to hub updates for this plug."""
+        signals = (
+            self.data.signal(),
+            self.data.signal("SmartPlug", self.smart_plug_id),
+        )
+        self._unsub_dispatchers = [
+            async_dispatcher_connect(self.hass, signal, self._async_hub_updated)
+            for signal in signals
+        ]
+        self.data.entities[self.entity_id] = self
+
+    async def async_will_remove_from_hass(self):
+        self.data.entities.pop(self.entity_id, None)
+        for unsub in self._unsub_dispatchers:
+            unsub()
+        self._unsub_dispatchers = []
+
+    @callback
+    def _async_hub_updated(self):
+        self.async_schedule_update_ha_state(True)
 
     async def async_update(self):
         _LOGGER.debug(" SmartPlug {} Status requested".format(self.plug_name))
-        if self._force_update:
-            await self.data.async_update(no_throttle=True)
-            self._force_update = False
-        else:
-            await self.data.async_update()
         #Update status
-        smartPlugs = self.data.wiserhub.getSmartPlugs()
-        for plug in smartPlugs:
-            if plug.get("id") == self.smart_plug_id:
-                self._is_on = True if plug.get("OutputState") == "On" else False
+        plug = self.data.snapshot.smart_plug(self.smart_plug_id)
+        self._is_on = True if plug.get("OutputState") == "On" else False
                 
     @property
     def name(self):
         """Return the name of the SmartPlug """
+        if self.data.name:
+            return "{} {}".format(self.data.name, self.plug_name)
         return self.plug_name
 
+    @property
+    def unique_id(self):
+        return self.data.unique_id("smartplug", self.smart_plug_id)
+
     @property
     def should_poll(self):
         """Return the polling state."""
-        return True
+        return False
+
+    @property
+    def available(self):
+        return self.data.available
 
     @property
     def is_on(self):
@@ -201,7 +250,7 @@ class WiserSmartPlug(SwitchDevice):
     @property
     def device_state_attributes(self):
         attrs = {}
-        device_data = self.data.wiserhub.getSmartPlug(self.smart_plug_id)
+        device_data = self.data.snapshot.smart_plug(self.smart_plug_id)
         attrs["ManualState"] = device_data.get("ManualState")
         attrs["Name"] = device_data.get("Name")
         attrs["Mode"] = device_data.get("Mode")
@@ -225,8 +274,7 @@ class WiserSmartPlug(SwitchDevice):
         _LOGGER.debug(
             "Setting Smartplug {} Mode to {} ".format(self.smart_plug_id, plug_mode)
         )
-        self.data.wiserhub.setSmartPlugMode(self.smart_plug_id,plug_mode)
-        self._force_update = True
+        await self.data.set_smart_plug_mode(self.smart_plug_id, plug_mode)
 
 
 
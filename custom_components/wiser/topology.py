@@ -0,0 +1,196 @@
+"""
+Zigbee mesh topology of a Wiser Hub
+
+Devices report their own NodeId and the ParentNodeId they route through,
+0 being the hub itself, so iTRVs and RoomStats hang off the hub or off a
+smart plug acting as a repeater. WiserTopology turns that into a tree with
+the hop count of every device, and follows the quality of each device's
+link over time.
+
+Link quality is the weaker of the two directions the hub reports
+(ReceptionOfDevice and ReceptionOfController). Each node keeps a fast and
+a slow time weighted average of it, a link is degrading when the fast one
+falls well below the slow one or under a fixed floor. Only the devices that
+changed in a refresh are updated, the routes are only rebuilt when a node
+joins, leaves or changes parent.
+"""
+from math import exp
+
+# Time constants, in seconds, of the recent and the long term link averages
+FAST_AVERAGE = 3600
+SLOW_AVERAGE = 7 * 24 * 3600
+
+# LQI runs 0-255 and RSSI is in dBm
+LQI_DROP = 20
+LQI_POOR = 60
+RSSI_POOR = -85
+
+# More hops than this, hub -> repeater -> device, is flagged
+MAX_HOPS = 2
+
+
+class LinkAverage:
+    """Fast and slow time weighted averages of a value that is held between
+    updates"""
+
+    __slots__ = ("value", "fast", "slow", "last")
+
+    def __init__(self, value, timestamp):
+        self.value = self.fast = self.slow = value
+        self.last = timestamp
+
+    def averages(self, timestamp):
+        """(fast, slow) averages at timestamp"""
+        elapsed = max(0.0, timestamp - self.last)
+        return (
+            self.value + (self.fast - self.value) * exp(-elapsed / FAST_AVERAGE),
+            self.value + (self.slow - self.value) * exp(-elapsed / SLOW_AVERAGE),
+        )
+
+    def update(self, value, timestamp):
+        # The previous value has been in force since the last update
+        self.fast, self.slow = self.averages(timestamp)
+        self.value = value
+        self.last = timestamp
+
+
+class MeshNode:
+    """One device in the mesh"""
+
+    __slots__ = (
+        "device_id",
+        "node_id",
+        "parent_node_id",
+        "product_type",
+        "hops",
+        "lqi",
+        "rssi",
+    )
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.node_id = None
+        self.parent_node_id = None
+        self.product_type = None
+        self.hops = None
+        self.lqi = None
+        self.rssi = None
+
+
+def _weakest(device, key):
+    values = [
+        reception.get(key)
+        for reception in (
+            device.get("ReceptionOfDevice"),
+            device.get("ReceptionOfController"),
+        )
+        if reception and reception.get(key) is not None
+    ]
+    return min(values) if values else None
+
+
+class WiserTopology:
+    """Mesh tree and link quality of every device of one hub"""
+
+    def __init__(self):
+        self.nodes = {}
+        # NodeId -> device ids routing through it, 0 is the hub
+        self.children = {}
+
+    def update(self, snapshot, timestamp, device_ids=None):
+        """Update the given devices, or all of them, from snapshot"""
+        if device_ids is None:
+            device_ids = set(self.nodes) | set(snapshot.devices)
+        rebuild = False
+        for device_id in device_ids:
+            device = snapshot.devices.get(device_id)
+            if device is None:
+                rebuild |= self.nodes.pop(device_id, None) is not None
+                continue
+            node = self.nodes.get(device_id)
+            if node is None:
+                node = self.nodes[device_id] = MeshNode(device_id)
+                rebuild = True
+            node.product_type = device.get("ProductType")
+            node_id = device.get("NodeId")
+            parent_node_id = device.get("ParentNodeId")
+            if (node_id, parent_node_id) != (node.node_id, node.parent_node_id):
+                node.node_id = node_id
+                node.parent_node_id = parent_node_id
+                rebuild = True
+            for attr, key in (("lqi", "Lqi"), ("rssi", "Rssi")):
+                value = _weakest(device, key)
+                average = getattr(node, attr)
+                if value is None:
+                    continue
+                if average is None:
+                    setattr(node, attr, LinkAverage(value, timestamp))
+                elif value != average.value:
+                    average.update(value, timestamp)
+        if rebuild:
+            self._build_routes()
+        return rebuild
+
+    def _build_routes(self):
+        by_node_id = {}
+        children = {}
+        for node in self.nodes.values():
+            if node.node_id is not None:
+                by_node_id[node.node_id] = node
+            if node.product_type != "Controller" and node.parent_node_id is not None:
+                children.setdefault(node.parent_node_id, []).append(node.device_id)
+        self.children = children
+
+        def hops(node, seen):
+            if node.product_type == "Controller":
+                return 0
+            if node.parent_node_id == 0:
+                return 1
+            parent = by_node_id.get(node.parent_node_id)
+            if parent is None or parent.device_id in seen:
+                # Routed through a node the hub did not report, or a loop
+                return None
+            seen.add(parent.device_id)
+            parent_hops = hops(parent, seen)
+            return None if parent_hops is None else parent_hops + 1
+
+        for node in self.nodes.values():
+            node.hops = hops(node, {node.device_id})
+
+    def link(self, device_id, timestamp):
+        """Link figures and problems of one device"""
+        node = self.nodes.get(device_id)
+        if node is None:
+            return {}
+        problems = []
+        figures = {"hops": node.hops}
+        if node.product_type != "Controller":
+            if node.hops is None:
+                problems.append("no route")
+            elif node.hops > MAX_HOPS:
+                problems.append("too many hops")
+            figures["repeating_for"] = len(self.children.get(node.node_id, ()))
+        if node.lqi is not None:
+            fast, slow = node.lqi.averages(timestamp)
+            figures["link_lqi_average"] = round(fast)
+            figures["link_lqi_baseline"] = round(slow)
+            if fast < LQI_POOR:
+                problems.append("poor LQI")
+            elif fast < slow - LQI_DROP:
+                problems.append("LQI falling")
+        if node.rssi is not None:
+            fast, _ = node.rssi.averages(timestamp)
+            figures["link_rssi_average"] = round(fast)
+            if fast < RSSI_POOR:
+                problems.append("poor RSSI")
+        figures["link_problems"] = problems
+        return figures
+
+    def problems(self, timestamp):
+        """{device id: problems} for every device with a problem"""
+        found = {}
+        for device_id in self.nodes:
+            problems = self.link(device_id, timestamp).get("link_problems")
+            if problems:
+                found[device_id] = problems
+        return found
@@ -1,95 +1,249 @@
-from datetime import datetime
-from .const import _LOGGER, WEEKDAYS, WEEKENDS, SPECIALDAYS
+from .const import TEMP_MAXIMUM, TEMP_MINIMUM, WEEKDAYS, WEEKENDS
+
+WISER_OFF = -200
+
+# Hub hhmm integer <-> "HH:MM", built once rather than parsed per setpoint
+WISER_TIMES = {
+    hour * 100 + minute: "{:02d}:{:02d}".format(hour, minute)
+    for hour in range(24)
+    for minute in range(60)
+}
+TEXT_TIMES = {text: wiser_time for wiser_time, text in WISER_TIMES.items()}
+
+# Heating temperatures in 0.1C steps, and Off, to the hub's tenths
+WISER_TEMPS = {
+    tenths / 10: tenths for tenths in range(TEMP_MINIMUM * 10, TEMP_MAXIMUM * 10 + 1)
+}
+WISER_TEMPS.update({"Off": WISER_OFF, "off": WISER_OFF, "OFF": WISER_OFF})
+TEMPS_FROM_WISER = {tenths: temp for temp, tenths in WISER_TEMPS.items()}
+TEMPS_FROM_WISER[WISER_OFF] = "Off"
+
+# On/off schedules, used by hot water and smart plugs
+WISER_ON = 1100
+WISER_STATES = {"On": WISER_ON, "Off": WISER_OFF, "on": WISER_ON, "off": WISER_OFF}
+STATES_FROM_WISER = {WISER_ON: "On", WISER_OFF: "Off"}
+
+# Day key (lower case) -> hub day names it covers
+SCHEDULE_DAYS = {day: (day.capitalize(),) for day in WEEKDAYS + WEEKENDS}
+SCHEDULE_DAYS["weekdays"] = tuple(day.capitalize() for day in WEEKDAYS)
+SCHEDULE_DAYS["weekends"] = tuple(day.capitalize() for day in WEEKENDS)
+
+
+def _from_wiser_time(value):
+    try:
+        return WISER_TIMES[int(value)]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Invalid schedule time {!r}".format(value))
+
+
+def _to_wiser_time(value):
+    """Accepts "HH:MM" as written by get_schedule, or the hub's hhmm"""
+    if isinstance(value, int) and value in WISER_TIMES:
+        return value
+    text = str(value)
+    wiser_time = TEXT_TIMES.get(text if len(text) == 5 else text.zfill(5))
+    if wiser_time is None:
+        wiser_time = TEXT_TIMES.get("{}:{}".format(text[:-2].zfill(2), text[-2:]))
+    if wiser_time is None:
+        raise ValueError("Invalid schedule time {!r}".format(value))
+    return wiser_time
+
+
+def _setpoint_time(setpoint):
+    return setpoint["Time"]
+
+
+def _from_wiser_temp(value):
+    return "Off" if value < 0 else round(value / 10, 1)
+
+
+def _to_wiser_temp(value, heating=True):
+    if isinstance(value, str) and value.lower() == "off":
+        return WISER_OFF
+    try:
+        temp = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid schedule temperature {!r}".format(value))
+    if heating and not TEMP_MINIMUM <= temp <= TEMP_MAXIMUM:
+        raise ValueError(
+            "Schedule temperature {} is outside {}-{}C".format(
+                value, TEMP_MINIMUM, TEMP_MAXIMUM
+            )
+        )
+    return int(round(temp * 10))
+
+
+def _from_wiser_state(value):
+    return "On" if value > 0 else "Off"
+
+
+def _to_wiser_state(value, heating=False):
+    state = WISER_STATES.get(str(value).lower())
+    if state is None:
+        raise ValueError("Invalid schedule state {!r}, use On or Off".format(value))
+    return state
+
+
+# Schedule type -> (readable key, hub value table, readable value table,
+# and the slower converters for values not in the tables)
+SCHEDULE_FORMS = {
+    "Heating": ("Temp", TEMPS_FROM_WISER, WISER_TEMPS, _from_wiser_temp, _to_wiser_temp),
+    "OnOff": ("State", STATES_FROM_WISER, WISER_STATES, _from_wiser_state, _to_wiser_state),
+}
+
+
+def _from_wiser_setpoints(setpoints, schedule_type):
+    key, table, _, convert, _ = SCHEDULE_FORMS.get(
+        schedule_type, SCHEDULE_FORMS["Heating"]
+    )
+    try:
+        # Table lookups for every value the hub should send
+        return [
+            {
+                "Time": WISER_TIMES[setpoint["Time"]],
+                key: table[setpoint["DegreesC"]],
+            }
+            for setpoint in setpoints
+        ]
+    except (KeyError, TypeError):
+        return [
+            {
+                "Time": _from_wiser_time(setpoint["Time"]),
+                key: convert(setpoint["DegreesC"]),
+            }
+            for setpoint in setpoints
+        ]
+
+
+def _to_wiser_setpoints(day, times, schedule_type):
+    # Only heating schedules have their temperatures range checked
+    heating = schedule_type == "Heating"
+    key, _, table, _, convert = SCHEDULE_FORMS.get(
+        schedule_type, SCHEDULE_FORMS["Heating"]
+    )
+    setpoints = []
+    last_time = -1
+    in_order = True
+    for entry in times:
+        # Table lookups cover what get_schedule writes, anything else goes
+        # through the slower parsing and validation
+        wiser_time = TEXT_TIMES.get(entry["Time"])
+        if wiser_time is None:
+            wiser_time = _to_wiser_time(entry["Time"])
+        value = table.get(entry[key])
+        if value is None:
+            value = convert(entry[key], heating)
+        if wiser_time <= last_time:
+            in_order = False
+        last_time = wiser_time
+        setpoints.append({"Time": wiser_time, "DegreesC": value})
+    if not in_order:
+        setpoints.sort(key=_setpoint_time)
+        for previous, setpoint in zip(setpoints, setpoints[1:]):
+            if previous["Time"] == setpoint["Time"]:
+                raise ValueError(
+                    "{} has more than one setpoint at {}".format(
+                        day, WISER_TIMES[setpoint["Time"]]
+                    )
+                )
+    return setpoints
+
+
+def canonical_schedule(scheduleData: dict):
+    """
+    A hub schedule reduced to {Day: ((time, setpoint), ...)} in time order,
+    for comparing schedules regardless of key case, ordering or the id
+    """
+    canonical = {}
+    for day, sched in scheduleData.items():
+        if day.lower() in SCHEDULE_DAYS and isinstance(sched, dict):
+            canonical[day.capitalize()] = tuple(
+                sorted(
+                    (int(setpoint["Time"]), int(setpoint["DegreesC"]))
+                    for setpoint in sched.get("SetPoints") or []
+                )
+            )
+    return canonical
+
+
+def schedule_unchanged(current: dict, scheduleData: dict):
+    """True if every day in scheduleData is already in the current hub schedule"""
+    if scheduleData.get("Type", current.get("Type")) != current.get("Type"):
+        return False
+    current_days = canonical_schedule(current)
+    return all(
+        current_days.get(day) == setpoints
+        for day, setpoints in canonical_schedule(scheduleData).items()
+    )
 
 
 def convert_from_wiser_schedule(scheduleData: dict, scheduleName=""):
     """
     Description: Converts from wiser format to human readable format
-    
-    Param: scheduleData
-    Param: mode
+
+    Param: scheduleData, left unchanged
+    Param: scheduleName, adds a Name, Description and Type header if given
+    Heating setpoints become Time and Temp, on/off ones Time and State.
     """
-    # Remove Id key from schedule as not needed
-    if "id" in scheduleData:
-        del scheduleData["id"]
-    # Create dict to take converted data
+    schedule_type = scheduleData.get("Type", "Heating")
     if scheduleName != "":
         scheduleOutput = {
             "Name": scheduleName,
             "Description": "Schedule for " + scheduleName,
-            "Type": "Heating",
+            "Type": schedule_type,
         }
-    # Convert to human readable format for yaml
-    # Iterate through each day
+    elif schedule_type != "Heating":
+        scheduleOutput = {"Type": schedule_type}
+    else:
+        scheduleOutput = {}
     for day, sched in scheduleData.items():
-        if day.lower() in (WEEKDAYS + WEEKENDS + SPECIALDAYS):
-            schedDay = {}
-            # Iterate through setpoint key for each day
-            for setpoint, times in sched.items():
-                if setpoint == "SetPoints":
-                    # Iterate all times
-                    schedSetpoints = []
-                    # Iterate through each setpoint entry
-                    for k in times:
-                        schedTime = {}
-                        for key, value in k.items():
-                            # Convert values and keys to human readable version
-                            if key == "Time":
-                                value = (
-                                    datetime.strptime(format(value, "04d"), "%H%M")
-                                ).strftime("%H:%M")
-                            if key == "DegreesC":
-                                key = "Temp"
-                                if value < 0:
-                                    value = "Off"
-                                else:
-                                    value = round(value / 10,1)
-                            tmp = {key: value}
-                            schedTime.update(tmp)
-                        schedSetpoints.append(schedTime.copy())
-            scheduleOutput.update({day: schedSetpoints})
+        if day.lower() in SCHEDULE_DAYS:
+            scheduleOutput[day] = _from_wiser_setpoints(
+                (sched or {}).get("SetPoints") or [], schedule_type
+            )
     return scheduleOutput
 
 
 def convert_to_wiser_schedule(scheduleData: dict):
     """
     Description: Converts from human readable format to wiser format
-    
-    Param: scheduleData
-    Param: mode
+
+    Param: scheduleData, left unchanged
+    Returns the hub's own form, SetPoints with integer times in time order,
+    with Weekdays and Weekends expanded to each day they cover. Raises
+    ValueError for an unknown time or a temperature out of range.
     """
-    # Convert to wiser format for setting schedules
-    # Iterate through each day
-    scheduleOutput = {"Type": "Heating"}
+    schedule_type = scheduleData.get("Type", "Heating")
+    scheduleOutput = {"Type": schedule_type}
     for day, times in scheduleData.items():
-        if day.lower() in (WEEKDAYS + WEEKENDS + SPECIALDAYS):
-            schedDay = {}
-            schedSetpoints = []
-            # Iterate through each set of times for a day
-            for k in times:
-                schedTime = {}
-                for key, value in k.items():
-                    # Convert values and key to wiser format
-                    if key == "Time":
-                        value = str(value).replace(":", "")
-                    if key == "Temp":
-                        key = "DegreesC"
-                        if value == "Off":
-                            value = -200
-                        else:
-                            value = int(value * 10)
-                    tmp = {key: value}
-                    schedTime.update(tmp)
-                schedSetpoints.append(schedTime.copy())
-                schedDay = {"Setpoints": schedSetpoints}
-            # If using special days, convert to one entry for each day of week
-            if day.lower() in SPECIALDAYS:
-                if day.lower() == "weekdays":
-                    for d in WEEKDAYS:
-                        scheduleOutput.update({d.capitalize(): schedDay})
-                if day.lower() == "weekends":
-                    for d in WEEKENDS:
-                        scheduleOutput.update({d.capitalize(): schedDay})
-            else:
-                scheduleOutput.update({day: schedDay})
+        hub_days = SCHEDULE_DAYS.get(day.lower())
+        if hub_days is None:
+            continue
+        schedDay = {
+            "SetPoints": _to_wiser_setpoints(day, times or [], schedule_type)
+        }
+        for hub_day in hub_days:
+            scheduleOutput[hub_day] = schedDay
     return scheduleOutput
+
+
+def validate_schedule(scheduleData: dict):
+    """
+    convert_to_wiser_schedule for a schedule uploaded from a file, checked
+    by reading the result back and converting it again. Raises ValueError if
+    any day would not come back as the schedule being sent.
+    """
+    hub_schedule = convert_to_wiser_schedule(scheduleData)
+    again = canonical_schedule(
+        convert_to_wiser_schedule(convert_from_wiser_schedule(hub_schedule))
+    )
+    changed = [
+        day
+        for day, setpoints in canonical_schedule(hub_schedule).items()
+        if again.get(day) != setpoints
+    ]
+    if changed:
+        raise ValueError(
+            "Schedule does not convert back the same for {}".format(", ".join(changed))
+        )
+    return hub_schedule
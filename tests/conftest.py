@@ -0,0 +1,21 @@
+"""
+Load the component's Home Assistant independent modules as the "wiser" package.
+
+custom_components/wiser/__init__.py needs Home Assistant, the modules tested
+here only import each other and the standard library, so the package is
+registered without running its __init__.
+"""
+import os
+import sys
+import types
+
+COMPONENT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "custom_components",
+    "wiser",
+)
+
+if "wiser" not in sys.modules:
+    package = types.ModuleType("wiser")
+    package.__path__ = [COMPONENT_DIR]
+    sys.modules["wiser"] = package
@@ -0,0 +1,102 @@
+"""Tests for the whole-house heating figures"""
+from wiser.analytics import HouseAnalytics
+from wiser.snapshot import WiserHubSnapshot
+
+
+def room(room_id, name, temperature, setpoint=200, demand=0, output="Off"):
+    return {
+        "id": room_id,
+        "Name": name,
+        "CalculatedTemperature": temperature,
+        "CurrentSetPoint": setpoint,
+        "PercentageDemand": demand,
+        "ControlOutputState": output,
+    }
+
+
+def hub(rooms, channels=()):
+    return WiserHubSnapshot({"Room": list(rooms), "HeatingChannel": list(channels)})
+
+
+def test_house_figures():
+    house = HouseAnalytics(
+        hub(
+            [
+                room(1, "Lounge", 180, setpoint=210, demand=60, output="On"),
+                room(2, "Kitchen", 200, setpoint=190, demand=20),
+                room(3, "Hall", 220, setpoint=-200),
+                room(4, "Study", 190, setpoint=200),
+            ]
+        )
+    ).house
+    assert house["rooms"] == 4
+    assert house["heat_demand"] == 20.0
+    assert house["mean_temperature"] == 19.8
+    # (18.0 * 60 + 20.0 * 20) / 80
+    assert house["demand_weighted_temperature"] == 18.5
+    assert house["rooms_calling_for_heat"] == ["Lounge", "Kitchen"]
+    # Off setpoints are never below
+    assert house["rooms_below_setpoint"] == {"Lounge": 3.0, "Study": 1.0}
+
+
+def test_rooms_without_a_real_temperature_are_left_out_of_temperatures():
+    house = HouseAnalytics(
+        hub(
+            [
+                room(1, "Lounge", 200, demand=40),
+                room(2, "No sensor", -32768, setpoint=250, demand=50),
+                room(3, "Missing", None, setpoint=250),
+                room(4, "Too hot", 1000, setpoint=250),
+                room(5, "Cold store", -199, setpoint=50),
+            ]
+        )
+    ).house
+    assert house["rooms"] == 5
+    # Demand still counts every room
+    assert house["heat_demand"] == 18.0
+    assert house["mean_temperature"] == round((20.0 - 19.9) / 2, 1)
+    assert house["demand_weighted_temperature"] == 20.0
+    assert house["rooms_below_setpoint"] == {"Cold store": 24.9}
+
+
+def test_float_temperatures_are_accepted():
+    house = HouseAnalytics(hub([room(1, "Lounge", 201.0)])).house
+    assert house["mean_temperature"] == 20.1
+
+
+def test_heating_channels_aggregate_their_own_rooms():
+    analytics = HouseAnalytics(
+        hub(
+            [
+                room(1, "Lounge", 180, demand=80),
+                room(2, "Kitchen", 200),
+                room(3, "Bedroom", 170, demand=40),
+            ],
+            [
+                {
+                    "id": 1,
+                    "Name": "Channel-1",
+                    "RoomIds": [1, 2, 99],
+                    "PercentageDemand": 40,
+                    "HeatingRelayState": "On",
+                },
+                {"id": 2, "Name": "Channel-2", "RoomIds": [3]},
+            ],
+        )
+    )
+    first = analytics.channels[1]
+    assert first["rooms"] == 2
+    assert first["heat_demand"] == 40.0
+    assert first["mean_temperature"] == 19.0
+    assert first["name"] == "Channel-1"
+    assert first["percentage_demand"] == 40
+    assert first["relay_state"] == "On"
+    assert analytics.channels[2]["rooms_calling_for_heat"] == ["Bedroom"]
+
+
+def test_no_rooms():
+    analytics = HouseAnalytics(hub([], [{"id": 1, "Name": "Channel-1"}]))
+    assert analytics.house["rooms"] == 0
+    assert analytics.house["heat_demand"] is None
+    assert analytics.house["mean_temperature"] is None
+    assert analytics.channels[1]["rooms"] == 0
@@ -0,0 +1,183 @@
+"""Tests for battery life forecasting"""
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from wiser.battery import (
+    BATTERY_INTERVAL,
+    BATTERY_LOW_VOLTAGE,
+    SECONDS_PER_DAY,
+    BatteryTrend,
+    WiserBatteryMonitor,
+)
+from wiser.snapshot import WiserHubSnapshot
+
+START = 1600000000
+LOW = BATTERY_LOW_VOLTAGE["iTRV"]
+
+
+def declining(life_days, quantise=round, start_voltage=31.0):
+    """Hub readings, in tenths, of a voltage falling linearly to LOW over
+    life_days, and the day the reading first shows LOW"""
+    rate = (start_voltage - LOW) / life_days
+
+    def reading(day):
+        return int(quantise(start_voltage - rate * day))
+
+    hours = range(int(life_days * 2 * 24))
+    low_day = next(hour / 24 for hour in hours if reading(hour / 24) <= LOW)
+    return reading, low_day
+
+
+def feed(trend, reading, days, every=BATTERY_INTERVAL):
+    for step in range(int(days * SECONDS_PER_DAY / every) + 1):
+        timestamp = START + step * every
+        trend.add(timestamp, reading(step * every / SECONDS_PER_DAY))
+    return START + int(days * SECONDS_PER_DAY)
+
+
+@pytest.mark.parametrize("quantise", [round, math.floor])
+@pytest.mark.parametrize("life_days", [100, 300])
+@pytest.mark.parametrize("watched", [0.5, 0.7, 0.9])
+def test_forecast_of_a_quantised_linear_decline(quantise, life_days, watched):
+    reading, low_day = declining(life_days, quantise)
+    trend = BatteryTrend(START)
+    now = feed(trend, reading, low_day * watched)
+
+    expected = low_day * (1 - watched)
+    assert trend.days_until(LOW, now) == pytest.approx(expected, abs=1)
+
+
+def test_no_forecast_before_two_steps():
+    reading, low_day = declining(300)
+    trend = BatteryTrend(START)
+    # Watching starts part way down the first step, the first drop is a step
+    now = feed(trend, reading, low_day * 0.25)
+    assert trend.steps == 1
+    assert trend.slope() is None
+    assert trend.days_until(LOW, now) is None
+
+
+def test_no_forecast_for_a_steady_voltage():
+    trend = BatteryTrend(START)
+    now = feed(trend, lambda day: 30, 60)
+    assert trend.days_until(LOW, now) is None
+
+
+def test_single_low_readings_are_not_steps():
+    trend = BatteryTrend(START)
+    # A reading one tenth low every 10 hours
+    feed(trend, lambda day: 29 if round(day * 24) % 10 == 5 else 30, 60)
+    assert trend.steps == 0
+    assert trend.level == 30
+
+
+def test_overdue_step_moves_the_forecast_out():
+    reading, low_day = declining(100)
+    trend = BatteryTrend(START)
+    now = feed(trend, reading, low_day * 0.5)
+    on_time = trend.days_until(LOW, now)
+
+    # The voltage then holds for 30 days, longer than a step should take
+    held = reading(low_day * 0.5)
+    days_per_step = -1 / trend.slope()
+    for hour in range(1, 30 * 24 + 1):
+        trend.add(now + hour * 3600, held)
+    later = now + 30 * SECONDS_PER_DAY
+
+    remaining = trend.days_until(LOW, later)
+    assert remaining == pytest.approx((held - 1 - LOW) * days_per_step, abs=0.5)
+    assert remaining > on_time - 30
+
+
+def test_low_now_is_zero_days():
+    trend = BatteryTrend(START)
+    now = feed(trend, lambda day: max(LOW, 30 - int(day / 5)), 40)
+    assert trend.days_until(LOW, now) == 0.0
+
+
+def test_state_round_trip():
+    reading, low_day = declining(100)
+    trend = BatteryTrend(START)
+    now = feed(trend, reading, low_day * 0.6)
+
+    state = trend.as_list()
+    restored = BatteryTrend(state[0], state[1:])
+    assert restored.as_list() == state
+    assert restored.days_until(LOW, now) == trend.days_until(LOW, now)
+
+
+class FakeStore:
+    """Records what the monitor asks the storage helper to save"""
+
+    def __init__(self, stored=None):
+        self.stored = stored
+        self.saves = 0
+
+    async def async_load(self):
+        return self.stored
+
+    def async_delay_save(self, data_func, delay):
+        self.saves += 1
+        self.stored = data_func()
+
+
+def hub(voltage, product_type="iTRV"):
+    return WiserHubSnapshot(
+        {
+            "Device": [
+                {"id": 5, "ProductType": product_type, "BatteryVoltage": voltage},
+                {"id": 6, "ProductType": "SmartPlug"},
+            ]
+        }
+    )
+
+
+def test_monitor_samples_once_per_interval():
+    store = FakeStore()
+    monitor = WiserBatteryMonitor(store)
+    assert monitor.record(hub(30), START) == [5]
+    assert monitor.record(hub(30), START + BATTERY_INTERVAL - 1) == []
+    assert monitor.record(hub(30), START + BATTERY_INTERVAL) == [5]
+    assert store.saves == 2
+    assert set(store.stored) == {"5"}
+
+
+def test_monitor_forecast_and_battery_change():
+    monitor = WiserBatteryMonitor(FakeStore())
+    reading, low_day = declining(100)
+    for hour in range(int(low_day * 0.6 * 24) + 1):
+        monitor.record(hub(reading(hour / 24)), START + hour * 3600)
+    now = START + int(low_day * 0.6 * 24) * 3600
+
+    days, due = monitor.forecast(5, "iTRV", now)
+    assert days == pytest.approx(low_day * 0.4, abs=1)
+    # days is rounded to a tenth, due is not
+    expected = datetime.fromtimestamp(now, timezone.utc) + timedelta(days=days)
+    assert abs(due - expected) <= timedelta(hours=2.4)
+    assert monitor.forecast(5, "SmartPlug", now) == (None, None)
+
+    # New batteries start the trend again
+    monitor.record(hub(31), now + BATTERY_INTERVAL)
+    assert monitor.forecast(5, "iTRV", now + BATTERY_INTERVAL) == (None, None)
+
+
+def test_monitor_reloads_saved_trends():
+    store = FakeStore()
+    monitor = WiserBatteryMonitor(store)
+    reading, low_day = declining(100)
+    for hour in range(int(low_day * 0.6 * 24) + 1):
+        monitor.record(hub(reading(hour / 24)), START + hour * 3600)
+    now = START + int(low_day * 0.6 * 24) * 3600
+
+    reloaded = WiserBatteryMonitor(FakeStore(store.stored))
+    asyncio.run(reloaded.async_load())
+    assert reloaded.forecast(5, "iTRV", now) == monitor.forecast(5, "iTRV", now)
+
+
+def test_monitor_ignores_unreadable_saved_trends():
+    monitor = WiserBatteryMonitor(FakeStore({"5": [START, 1.0]}))
+    asyncio.run(monitor.async_load())
+    assert monitor.trends == {}
@@ -0,0 +1,175 @@
+"""Tests for the coalescing hub write queue"""
+import asyncio
+
+import pytest
+
+from wiser.commands import WiserCommandQueue
+
+
+class FakeHass:
+    """The two parts of hass the queue uses"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def async_create_task(self, coro):
+        return self.loop.create_task(coro)
+
+
+class Hub:
+    """Records the writes sent and the refreshes that followed them"""
+
+    def __init__(self):
+        self.sent = []
+        self.refreshes = 0
+
+    def command(self, value, error=None):
+        async def send():
+            self.sent.append(value)
+            if error is not None:
+                raise error
+            return value
+
+        return send
+
+    async def refresh(self):
+        self.refreshes += 1
+
+
+def run(test):
+    """Run test(queue, hub) on a fresh event loop"""
+
+    async def main():
+        hub = Hub()
+        queue = WiserCommandQueue(
+            FakeHass(asyncio.get_running_loop()), hub.refresh, delay=0
+        )
+        return await test(queue, hub)
+
+    return asyncio.run(main())
+
+
+def test_writes_to_one_key_collapse_into_the_last():
+    async def test(queue, hub):
+        results = await asyncio.gather(
+            *(queue.async_send(("Room", 1, "SetPoint"), hub.command(v)) for v in (1, 2, 3))
+        )
+        assert results == [3, 3, 3]
+        assert hub.sent == [3]
+        assert hub.refreshes == 1
+
+    run(test)
+
+
+def test_writes_to_different_keys_are_all_sent_with_one_refresh():
+    async def test(queue, hub):
+        results = await asyncio.gather(
+            queue.async_send(("Room", 1, "Mode"), hub.command("manual")),
+            queue.async_send(("Room", 1, "SetPoint"), hub.command(210)),
+            queue.async_send(("SmartPlug", 3), hub.command("On")),
+        )
+        assert results == ["manual", 210, "On"]
+        assert hub.sent == ["manual", 210, "On"]
+        assert hub.refreshes == 1
+
+    run(test)
+
+
+def test_coalesced_write_is_sent_in_the_order_last_asked_for():
+    async def test(queue, hub):
+        await asyncio.gather(
+            queue.async_send(("Room", 1, "Mode"), hub.command("manual")),
+            queue.async_send(("Room", 1, "SetPoint"), hub.command(210)),
+            queue.async_send(("Room", 1, "Mode"), hub.command("auto")),
+        )
+        assert hub.sent == [210, "auto"]
+
+    run(test)
+
+
+def test_an_error_only_fails_the_callers_of_that_key():
+    async def test(queue, hub):
+        failed, sent = await asyncio.gather(
+            queue.async_send(("Room", 1), hub.command(1, ValueError("bad"))),
+            queue.async_send(("Room", 2), hub.command(2)),
+            return_exceptions=True,
+        )
+        assert isinstance(failed, ValueError)
+        assert sent == 2
+        assert hub.sent == [1, 2]
+        assert hub.refreshes == 1
+
+    run(test)
+
+
+def test_writes_queued_while_sending_join_the_flush():
+    async def test(queue, hub):
+        later = []
+
+        async def first():
+            # Queued mid batch, sent before the one refresh
+            later.append(
+                asyncio.ensure_future(queue.async_send(("Room", 2), hub.command(2)))
+            )
+            await asyncio.sleep(0)
+            hub.sent.append(1)
+            return 1
+
+        assert await queue.async_send(("Room", 1), first) == 1
+        assert await later[0] == 2
+        assert hub.sent == [1, 2]
+        assert hub.refreshes == 1
+
+    run(test)
+
+
+def test_callers_resolve_after_the_refresh():
+    async def test(queue, hub):
+        pending = asyncio.ensure_future(queue.async_send(("Room", 1), hub.command(1)))
+        done_at_refresh = []
+
+        async def refresh():
+            done_at_refresh.append(pending.done())
+
+        queue._refresh = refresh
+        assert await pending == 1
+        assert done_at_refresh == [False]
+
+    run(test)
+
+
+def test_failed_refresh_still_resolves_callers():
+    async def test(queue, hub):
+        async def refresh():
+            raise RuntimeError("refresh failed")
+
+        queue._refresh = refresh
+        assert await queue.async_send(("Room", 1), hub.command(1)) == 1
+
+    run(test)
+
+
+def test_is_queued_until_sent():
+    async def test(queue, hub):
+        key = ("Schedule", 4)
+        pending = asyncio.ensure_future(queue.async_send(key, hub.command(1)))
+        await asyncio.sleep(0)
+        assert queue.is_queued(key)
+        await pending
+        assert not queue.is_queued(key)
+
+    run(test)
+
+
+def test_cancel_drops_queued_writes():
+    async def test(queue, hub):
+        queue._delay = 60
+        pending = asyncio.ensure_future(queue.async_send(("Room", 1), hub.command(1)))
+        await asyncio.sleep(0)
+        queue.async_cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        assert hub.sent == []
+        assert not queue.is_queued(("Room", 1))
+
+    run(test)
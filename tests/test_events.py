@@ -0,0 +1,75 @@
+"""Tests for the events fired on hub changes"""
+import pytest
+
+from wiser.events import (
+    EVENT_BOOST_ENDED,
+    EVENT_BOOST_STARTED,
+    EVENT_OVERRIDE,
+    EVENT_SETPOINT_ORIGIN,
+    EVENT_WINDOW,
+    hub_events,
+)
+from wiser.snapshot import WiserHubSnapshot
+
+
+def hub(override="None", **room):
+    return WiserHubSnapshot(
+        {
+            "System": {"OverrideType": override},
+            "Room": [
+                {
+                    "id": 1,
+                    "Name": "Lounge",
+                    "SetpointOrigin": "FromSchedule",
+                    "WindowState": "Closed",
+                    **room,
+                }
+            ],
+        }
+    )
+
+
+def event_types(old, new):
+    return [event_type for event_type, _data in hub_events(old, new)]
+
+
+def test_no_events_without_changes():
+    assert event_types(hub(), hub()) == []
+
+
+def test_room_change_carries_old_and_new():
+    events = list(hub_events(hub(), hub(WindowState="Open")))
+    assert events == [
+        (
+            EVENT_WINDOW,
+            {"type": "Room", "id": 1, "name": "Lounge", "old": "Closed", "new": "Open"},
+        )
+    ]
+
+
+def test_system_override():
+    assert event_types(hub(), hub(override="Away")) == [EVENT_OVERRIDE]
+
+
+@pytest.mark.parametrize("origin", ["FromBoost", "FromBoostDuringAway"])
+def test_boost_started_and_ended_at_home_or_away(origin):
+    assert event_types(hub(), hub(SetpointOrigin=origin)) == [
+        EVENT_SETPOINT_ORIGIN,
+        EVENT_BOOST_STARTED,
+    ]
+    assert event_types(hub(SetpointOrigin=origin), hub()) == [
+        EVENT_SETPOINT_ORIGIN,
+        EVENT_BOOST_ENDED,
+    ]
+
+
+def test_boost_continuing_into_away_is_not_a_new_boost():
+    assert event_types(
+        hub(SetpointOrigin="FromBoost"),
+        hub(override="Away", SetpointOrigin="FromBoostDuringAway"),
+    ) == [EVENT_SETPOINT_ORIGIN, EVENT_OVERRIDE]
+
+
+def test_added_rooms_do_not_fire():
+    empty = WiserHubSnapshot({"System": {"OverrideType": "None"}})
+    assert event_types(empty, hub()) == []
@@ -0,0 +1,117 @@
+"""Tests for the hub connection circuit breaker"""
+import pytest
+
+from wiser import health as health_module
+from wiser.health import (
+    HEALTH_CLOSED,
+    HEALTH_HALF_OPEN,
+    HEALTH_OPEN,
+    JITTER,
+    HubHealth,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the breaker's monotonic clock"""
+    now = [1000.0]
+    monkeypatch.setattr(health_module, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(health_module.random, "uniform", lambda low, high: 1.0)
+
+
+def open_circuit(health):
+    for _ in range(health.failure_threshold):
+        health.record_failure("timed out")
+
+
+def test_starts_closed_and_available():
+    health = HubHealth()
+    assert health.state == HEALTH_CLOSED
+    assert health.available
+    assert health.allow_request()
+
+
+def test_opens_after_the_failure_threshold(clock):
+    health = HubHealth(failure_threshold=2)
+    assert not health.record_failure("timed out")
+    assert health.available
+    assert health.record_failure("timed out again")
+    assert health.state == HEALTH_OPEN
+    assert not health.available
+    assert health.last_error == "timed out again"
+    assert not health.allow_request()
+
+
+def test_half_open_probe_after_the_backoff(clock, no_jitter):
+    health = HubHealth(failure_threshold=2, base_backoff=15)
+    open_circuit(health)
+    assert health.retry_delay() == 30
+
+    clock[0] += 29
+    assert not health.allow_request()
+    clock[0] += 1
+    assert health.allow_request()
+    assert health.state == HEALTH_HALF_OPEN
+    # Only one probe while half open
+    assert not health.allow_request()
+
+
+def test_waiting_until_the_backoff_has_passed(clock, no_jitter):
+    health = HubHealth(failure_threshold=2, base_backoff=15)
+    assert not health.waiting
+    open_circuit(health)
+    assert health.waiting
+
+    clock[0] += 29.6
+    # Under half a second left, still refused
+    assert health.waiting
+    assert not health.allow_request()
+    clock[0] += 0.4
+    assert not health.waiting
+    assert health.allow_request()
+    assert not health.waiting
+
+
+def test_failed_probe_reopens_with_a_longer_backoff(clock, no_jitter):
+    health = HubHealth(failure_threshold=2, base_backoff=15)
+    open_circuit(health)
+    clock[0] += 30
+    assert health.allow_request()
+
+    assert not health.record_failure("still down")
+    assert health.state == HEALTH_OPEN
+    assert health.retry_delay() == 60
+
+
+def test_success_closes_and_resets(clock):
+    health = HubHealth()
+    open_circuit(health)
+    clock[0] += health.max_backoff * 2
+    assert health.allow_request()
+
+    assert health.record_success()
+    assert health.state == HEALTH_CLOSED
+    assert health.failures == 0
+    assert health.last_error is None
+    assert not health.record_success()
+
+
+def test_backoff_doubles_up_to_the_maximum(no_jitter):
+    health = HubHealth(base_backoff=15, max_backoff=600)
+    delays = []
+    for _ in range(8):
+        health.failures += 1
+        delays.append(health.backoff())
+    assert delays == [15, 30, 60, 120, 240, 480, 600, 600]
+
+
+def test_backoff_jitter_stays_in_bounds():
+    health = HubHealth(base_backoff=100)
+    health.failures = 1
+    for _ in range(100):
+        assert 100 * (1 - JITTER) <= health.backoff() <= 100 * (1 + JITTER)
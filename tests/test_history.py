@@ -0,0 +1,86 @@
+"""Tests for the history ring buffers"""
+from wiser.history import MISSING, HistoryBuffer, WiserHistory, summarise
+from wiser.snapshot import WiserHubSnapshot
+
+START = 1600000000
+
+
+def test_buffer_keeps_the_newest_samples_oldest_first():
+    buffer = HistoryBuffer(2, size=3)
+    for step in range(5):
+        buffer.append(START + step, [step, 10 * step])
+    assert buffer.count == 3
+    assert list(buffer.samples(0)) == [(START + 2, 2), (START + 3, 3), (START + 4, 4)]
+    assert list(buffer.samples(1, since=START + 3)) == [
+        (START + 3, 30),
+        (START + 4, 40),
+    ]
+
+
+def test_buffer_skips_missing_values():
+    buffer = HistoryBuffer(1, size=3)
+    buffer.append(START, [5])
+    buffer.append(START + 1, [MISSING])
+    assert list(buffer.samples(0)) == [(START, 5)]
+
+
+def test_summarise_slope_per_hour_in_units():
+    # Tenths of a degree rising 0.5 degrees an hour
+    samples = [(START + step * 720, 200 + step) for step in range(11)]
+    summary = summarise(samples, scale=10)
+    assert summary["count"] == 11
+    assert summary["first"] == START
+    assert summary["last"] == START + 7200
+    assert summary["min"] == 20.0
+    assert summary["max"] == 21.0
+    assert summary["mean"] == 20.5
+    assert summary["slope_per_hour"] == 0.5
+
+
+def test_summarise_without_a_spread_of_times():
+    assert summarise([]) == {"count": 0}
+    assert summarise([(START, 7)])["slope_per_hour"] is None
+
+
+def hub(rooms, devices=()):
+    return WiserHubSnapshot({"Room": list(rooms), "Device": list(devices)})
+
+
+def test_history_samples_once_per_interval():
+    history = WiserHistory(interval=300, size=10)
+    lounge = {"id": 1, "CalculatedTemperature": 200, "CurrentSetPoint": 210}
+    assert history.record(hub([lounge]), START)
+    assert not history.record(hub([lounge]), START + 299)
+    assert history.record(hub([dict(lounge, CalculatedTemperature=205)]), START + 300)
+
+    result = history.query("Room", 1, names=["temperature", "demand"])
+    assert set(result) == {"temperature", "demand"}
+    assert result["temperature"]["count"] == 2
+    assert result["temperature"]["max"] == 20.5
+    assert result["temperature"]["slope_per_hour"] == 6.0
+    # Not reported by the hub
+    assert result["demand"] == {"count": 0}
+
+
+def test_history_values_in_real_units():
+    history = WiserHistory()
+    device = {
+        "id": 5,
+        "BatteryVoltage": 29,
+        "ReceptionOfController": {"Rssi": -70, "Lqi": 120},
+    }
+    history.record(hub([{"id": 1, "CalculatedTemperature": -32768}], [device]), START)
+    result = history.query("Device", 5)
+    assert result["battery_voltage"]["mean"] == 2.9
+    assert result["rssi"]["mean"] == -70
+    assert result["lqi"]["mean"] == 120
+    # The hub's own value for a room without a reading
+    assert history.query("Room", 1)["temperature"] == {"count": 0}
+
+
+def test_history_forgets_removed_objects():
+    history = WiserHistory(interval=300, size=10)
+    history.record(hub([{"id": 1}, {"id": 2}]), START)
+    history.record(hub([{"id": 1}]), START + 300)
+    assert set(history.buffers) == {("Room", 1)}
+    assert history.query("Room", 2) == {}
@@ -0,0 +1,37 @@
+"""Tests for the adaptive poll interval"""
+from datetime import timedelta
+
+import pytest
+
+from wiser.polling import POLL_FAST, POLL_IDLE, POLL_NORMAL, AdaptivePollPolicy
+from wiser.snapshot import WiserHubSnapshot
+
+
+def hub(override="None", **room):
+    return WiserHubSnapshot(
+        {
+            "System": {"OverrideType": override},
+            "Room": [{"id": 1, "SetpointOrigin": "FromSchedule", **room}],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "snapshot, mode",
+    [
+        (hub(), POLL_IDLE),
+        (hub(PercentageDemand=20), POLL_NORMAL),
+        (hub(ControlOutputState="On"), POLL_FAST),
+        (hub(override="Away", PercentageDemand=20), POLL_IDLE),
+        (hub(SetpointOrigin="FromBoost"), POLL_FAST),
+        (hub(override="Away", SetpointOrigin="FromBoostDuringAway"), POLL_FAST),
+    ],
+)
+def test_mode(snapshot, mode):
+    assert AdaptivePollPolicy(timedelta(seconds=30)).mode(snapshot) == mode
+
+
+def test_fast_after_a_command():
+    policy = AdaptivePollPolicy(timedelta(seconds=30))
+    policy.command_sent()
+    assert policy.interval(hub()) == (timedelta(seconds=10), POLL_FAST)
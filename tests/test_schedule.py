@@ -0,0 +1,108 @@
+"""Tests for compiled schedule lookups"""
+from datetime import datetime
+
+import pytest
+
+from wiser.schedule import CompiledSchedule
+
+MONDAY = datetime(2026, 10, 19)
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def at(day, hour, minute=0, second=0):
+    return MONDAY.replace(day=MONDAY.day + day, hour=hour, minute=minute, second=second)
+
+
+def schedule(setpoints=None, **days):
+    """Every day gets setpoints unless given its own list of (hhmm, tenths)"""
+    setpoints = setpoints or [(630, 210), (900, 160), (1730, 210), (2230, 160)]
+    return {
+        "id": 1,
+        "Type": "Heating",
+        **{
+            day: {
+                "SetPoints": [
+                    {"Time": time, "DegreesC": degrees}
+                    for time, degrees in days.get(day, setpoints)
+                ]
+            }
+            for day in DAYS
+        },
+    }
+
+
+def test_monday_is_the_start_of_the_week():
+    assert MONDAY.weekday() == 0
+
+
+def test_next_change_later_the_same_day():
+    compiled = CompiledSchedule(schedule())
+    assert compiled.next_change(at(0, 7, 15, 42)) == (at(0, 9), 160)
+    assert compiled.next_change(at(0, 18)) == (at(0, 22, 30), 160)
+
+
+def test_next_change_at_a_change_is_the_one_after():
+    compiled = CompiledSchedule(schedule())
+    assert compiled.next_change(at(0, 6, 30)) == (at(0, 9), 160)
+
+
+def test_next_change_crosses_midnight():
+    compiled = CompiledSchedule(schedule())
+    assert compiled.next_change(at(2, 23)) == (at(3, 6, 30), 210)
+
+
+def test_next_change_wraps_from_sunday_to_monday():
+    compiled = CompiledSchedule(schedule())
+    assert compiled.next_change(at(6, 23, 59)) == (at(7, 6, 30), 210)
+
+
+def test_next_change_skips_setpoints_that_change_nothing():
+    compiled = CompiledSchedule(
+        schedule(Monday=[(630, 210), (800, 210), (900, 160), (1200, 160)])
+    )
+    assert compiled.next_change(at(0, 7)) == (at(0, 9), 160)
+    assert compiled.next_change(at(0, 9, 30)) == (at(1, 6, 30), 210)
+
+
+def test_next_change_is_a_week_on_for_one_change_a_week():
+    compiled = CompiledSchedule(
+        schedule([(700, 160)], Wednesday=[(700, 160), (1200, 200), (1300, 160)])
+    )
+    assert compiled.next_change(at(2, 12, 30)) == (at(2, 13), 160)
+    assert compiled.next_change(at(2, 14)) == (at(9, 12), 200)
+
+
+@pytest.mark.parametrize("setpoints", [[], [(700, 180)]])
+def test_next_change_none_without_two_different_setpoints(setpoints):
+    compiled = CompiledSchedule(schedule(setpoints or [(700, 180)], Monday=setpoints))
+    assert compiled.next_change(at(0, 12)) == (None, None)
+
+
+def test_empty_schedule():
+    compiled = CompiledSchedule({"id": 1, "Type": "Heating"})
+    assert not compiled
+    assert compiled.setpoint_at(at(0, 12)) is None
+    assert compiled.next_change(at(0, 12)) == (None, None)
+
+
+def test_setpoint_at():
+    compiled = CompiledSchedule(schedule())
+    assert compiled.setpoint_at(at(1, 6, 29)) == 160
+    assert compiled.setpoint_at(at(1, 6, 30)) == 210
+    # Before Monday's first change the last one of Sunday is in force
+    assert compiled.setpoint_at(at(0, 0, 1)) == 160
+
+
+def test_off_setpoints_and_lower_case_days():
+    compiled = CompiledSchedule(
+        {
+            "monday": {
+                "SetPoints": [
+                    {"Time": 800, "DegreesC": -200},
+                    {"Time": 1000, "DegreesC": 190},
+                ]
+            }
+        }
+    )
+    assert compiled.setpoint_at(at(0, 9)) == -200
+    assert compiled.next_change(at(0, 9)) == (at(0, 10), 190)
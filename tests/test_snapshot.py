@@ -0,0 +1,142 @@
+"""Tests for the optimistic overlay of written values"""
+import pytest
+
+from wiser import snapshot as snapshot_module
+from wiser.snapshot import OptimisticOverlay, WiserHubSnapshot
+
+
+def hub(**room):
+    return WiserHubSnapshot(
+        {
+            "System": {"OverrideType": "None"},
+            "Room": [
+                {
+                    "id": 1,
+                    "Mode": "Auto",
+                    "SetpointOrigin": "FromSchedule",
+                    "CurrentSetPoint": 180,
+                    "DisplayedSetPoint": 180,
+                    **room,
+                }
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the overlay's monotonic clock"""
+    now = [1000.0]
+    monkeypatch.setattr(snapshot_module, "monotonic", lambda: now[0])
+    return now
+
+
+def test_apply_shows_written_values_without_changing_the_snapshot():
+    overlay = OptimisticOverlay()
+    current = hub()
+    overlay.add(("Room", 1, "SetPoint"), "Room", 1, {"CurrentSetPoint": 210})
+    overlay.add(("System", "RequestOverride"), "System", None, {"OverrideType": "Away"})
+
+    shown = overlay.apply(current)
+    assert shown.room(1)["CurrentSetPoint"] == 210
+    assert shown.room(1)["Mode"] == "Auto"
+    assert shown.system["OverrideType"] == "Away"
+    assert current.room(1)["CurrentSetPoint"] == 180
+
+
+def test_reconcile_keeps_entries_not_yet_sent(clock):
+    overlay = OptimisticOverlay()
+    overlay.add(("Room", 1, "SetPoint"), "Room", 1, {"CurrentSetPoint": 210})
+    clock[0] += 3600
+    overlay.reconcile(hub())
+    assert overlay
+
+
+def test_reconcile_drops_confirmed_entries(clock):
+    overlay = OptimisticOverlay()
+    entry = overlay.add(("Room", 1, "SetPoint"), "Room", 1, {"CurrentSetPoint": 210})
+    overlay.mark_sent(entry)
+
+    overlay.reconcile(hub())
+    assert overlay
+
+    overlay.reconcile(hub(CurrentSetPoint=210))
+    assert not overlay
+
+
+def test_reconcile_rolls_back_after_the_timeout(clock, caplog):
+    overlay = OptimisticOverlay()
+    entry = overlay.add(("Room", 1, "Mode"), "Room", 1, {"Mode": "Manual"})
+    overlay.mark_sent(entry)
+
+    clock[0] += snapshot_module.OPTIMISTIC_TIMEOUT
+    overlay.reconcile(hub())
+    assert overlay
+
+    clock[0] += 1
+    overlay.reconcile(hub())
+    assert not overlay
+    assert "Hub did not apply" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "expected, reported",
+    [
+        ({"OverrideType": None}, "None"),
+        ({"OverrideType": "None"}, None),
+    ],
+)
+def test_reconcile_treats_none_and_the_string_none_alike(expected, reported):
+    overlay = OptimisticOverlay()
+    entry = overlay.add(("System", "RequestOverride"), "System", None, expected)
+    overlay.mark_sent(entry)
+    overlay.reconcile(WiserHubSnapshot({"System": {"OverrideType": reported}}))
+    assert not overlay
+
+
+@pytest.mark.parametrize("origin", ["FromBoost", "FromBoostDuringAway"])
+def test_reconcile_confirms_a_boost_at_home_or_away(origin):
+    overlay = OptimisticOverlay()
+    entry = overlay.add(
+        ("Room", 1, "Mode"),
+        "Room",
+        1,
+        {"SetpointOrigin": "FromBoost", "CurrentSetPoint": 220},
+    )
+    overlay.mark_sent(entry)
+    overlay.reconcile(hub(SetpointOrigin=origin, CurrentSetPoint=220))
+    assert not overlay
+
+
+def test_later_write_owns_the_values_it_sets(clock):
+    overlay = OptimisticOverlay()
+    mode = overlay.add(
+        ("Room", 1, "Mode"), "Room", 1, {"Mode": "Manual", "CurrentSetPoint": 180}
+    )
+    set_point = overlay.add(("Room", 1, "SetPoint"), "Room", 1, {"CurrentSetPoint": 210})
+    assert overlay.apply(hub()).room(1)["CurrentSetPoint"] == 210
+
+    overlay.mark_sent(mode)
+    overlay.mark_sent(set_point)
+    overlay.reconcile(hub(Mode="Manual", CurrentSetPoint=210))
+    assert not overlay
+
+
+def test_write_replacing_the_item_drops_earlier_values():
+    overlay = OptimisticOverlay()
+    overlay.add(("Room", 1, "SetPoint"), "Room", 1, {"CurrentSetPoint": 210})
+    overlay.add(("Room", 1, "Mode"), "Room", 1, {"Mode": "Auto"}, replaces_item=True)
+
+    shown = overlay.apply(hub(Mode="Manual", CurrentSetPoint=160)).room(1)
+    assert shown["Mode"] == "Auto"
+    assert shown["CurrentSetPoint"] == 160
+
+
+def test_discard_leaves_a_newer_entry_for_the_key():
+    overlay = OptimisticOverlay()
+    key = ("Room", 1, "SetPoint")
+    first = overlay.add(key, "Room", 1, {"CurrentSetPoint": 210})
+    overlay.add(key, "Room", 1, {"CurrentSetPoint": 220})
+
+    overlay.discard(key, first)
+    assert overlay.apply(hub()).room(1)["CurrentSetPoint"] == 220
@@ -0,0 +1,118 @@
+"""Tests for the zigbee mesh model"""
+from math import exp
+
+import pytest
+
+from wiser.snapshot import WiserHubSnapshot
+from wiser.topology import FAST_AVERAGE, SLOW_AVERAGE, LinkAverage, WiserTopology
+
+START = 1600000000
+
+
+def device(device_id, node_id, parent_node_id, product_type="iTRV", **reception):
+    item = {
+        "id": device_id,
+        "ProductType": product_type,
+        "NodeId": node_id,
+        "ParentNodeId": parent_node_id,
+    }
+    if reception:
+        item["ReceptionOfController"] = {
+            "Lqi": reception["lqi"],
+            "Rssi": reception["rssi"],
+        }
+    return item
+
+
+def hub(*devices):
+    return WiserHubSnapshot({"Device": list(devices)})
+
+
+CONTROLLER = device(0, 0, None, "Controller")
+
+
+def test_link_averages_follow_a_change_at_their_own_rates():
+    average = LinkAverage(100, START)
+    average.update(40, START)
+    fast, slow = average.averages(START + 3600)
+    assert fast == pytest.approx(40 + 60 * exp(-3600 / FAST_AVERAGE))
+    assert slow == pytest.approx(40 + 60 * exp(-3600 / SLOW_AVERAGE))
+
+    # An update carries on from the averages, not from the last value
+    average.update(80, START + 3600)
+    assert average.averages(START + 3600) == pytest.approx((fast, slow))
+
+
+def test_link_falling_then_poor():
+    topology = WiserTopology()
+    topology.update(hub(CONTROLLER, device(5, 11, 0, lqi=100, rssi=-60)), START)
+    topology.update(hub(CONTROLLER, device(5, 11, 0, lqi=40, rssi=-60)), START + 60)
+
+    link = topology.link(5, START + 3600)
+    assert link["link_lqi_baseline"] == 100
+    assert 60 <= link["link_lqi_average"] < 80
+    assert link["link_problems"] == ["LQI falling"]
+    assert topology.link(5, START + 4 * 3600)["link_problems"] == ["poor LQI"]
+
+
+def test_weakest_direction_is_used():
+    item = device(5, 11, 0, lqi=120, rssi=-60)
+    item["ReceptionOfDevice"] = {"Lqi": 90, "Rssi": -90}
+    topology = WiserTopology()
+    topology.update(hub(CONTROLLER, item), START)
+    link = topology.link(5, START)
+    assert link["link_lqi_average"] == 90
+    assert link["link_problems"] == ["poor RSSI"]
+
+
+def test_hops_and_repeaters():
+    topology = WiserTopology()
+    topology.update(
+        hub(
+            CONTROLLER,
+            device(1, 10, 0, "SmartPlug"),
+            device(2, 20, 10, "SmartPlug"),
+            device(3, 30, 10),
+            device(4, 40, 20),
+        ),
+        START,
+    )
+    assert topology.link(0, START)["hops"] == 0
+    assert topology.link(1, START)["repeating_for"] == 2
+    assert topology.link(3, START)["hops"] == 2
+    assert topology.link(4, START)["hops"] == 3
+    assert topology.problems(START) == {4: ["too many hops"]}
+
+
+def test_orphans_have_no_route_until_their_parent_appears():
+    topology = WiserTopology()
+    orphan = device(3, 30, 10)
+    topology.update(hub(CONTROLLER, orphan), START)
+    assert topology.problems(START) == {3: ["no route"]}
+
+    # Only the new repeater is updated, the orphan's route is rebuilt too
+    plug = device(1, 10, 0, "SmartPlug")
+    assert topology.update(hub(CONTROLLER, orphan, plug), START + 60, {1})
+    assert topology.link(3, START + 60)["hops"] == 2
+    assert topology.problems(START + 60) == {}
+
+    # And lost again when it leaves
+    assert topology.update(hub(CONTROLLER, orphan), START + 120, {1})
+    assert topology.problems(START + 120) == {3: ["no route"]}
+
+
+def test_routing_loops_have_no_route():
+    topology = WiserTopology()
+    topology.update(
+        hub(CONTROLLER, device(1, 10, 20, "SmartPlug"), device(2, 20, 10, "SmartPlug")),
+        START,
+    )
+    assert topology.problems(START) == {1: ["no route"], 2: ["no route"]}
+
+
+def test_unchanged_devices_do_not_rebuild():
+    topology = WiserTopology()
+    snapshot = hub(CONTROLLER, device(5, 11, 0, lqi=100, rssi=-60))
+    assert topology.update(snapshot, START)
+    assert not topology.update(snapshot, START + 60)
+    assert topology.link(99, START) == {}
@@ -0,0 +1,203 @@
+"""Tests for the schedule conversions in util.py"""
+import copy
+
+import pytest
+
+from wiser import util
+from wiser.const import SPECIALDAYS, WEEKDAYS, WEEKENDS
+from wiser.util import (
+    SCHEDULE_DAYS,
+    convert_from_wiser_schedule,
+    convert_to_wiser_schedule,
+    schedule_unchanged,
+    validate_schedule,
+)
+
+DAYS = [day.capitalize() for day in WEEKDAYS + WEEKENDS]
+
+
+def hub_schedule(schedule_type="Heating", on=210):
+    return {
+        "id": 2,
+        "Type": schedule_type,
+        **{
+            day: {
+                "SetPoints": [
+                    {"Time": 630, "DegreesC": on},
+                    {"Time": 900 + index, "DegreesC": -200},
+                    {"Time": 1730, "DegreesC": on},
+                    {"Time": 2300, "DegreesC": -200},
+                ]
+            }
+            for index, day in enumerate(DAYS)
+        },
+    }
+
+
+def test_schedule_days_cover_every_day_key():
+    assert set(SCHEDULE_DAYS) == set(WEEKDAYS + WEEKENDS + SPECIALDAYS)
+    assert SCHEDULE_DAYS["weekdays"] == tuple(day.capitalize() for day in WEEKDAYS)
+    assert SCHEDULE_DAYS["weekends"] == tuple(day.capitalize() for day in WEEKENDS)
+
+
+@pytest.mark.parametrize("schedule_type", ["Heating", "OnOff"])
+def test_round_trip(schedule_type):
+    original = hub_schedule(schedule_type, 210 if schedule_type == "Heating" else 1100)
+    readable = convert_from_wiser_schedule(original, "Lounge")
+    assert readable["Name"] == "Lounge"
+    assert readable["Type"] == schedule_type
+
+    converted = convert_to_wiser_schedule(readable)
+    assert converted["Type"] == schedule_type
+    for day in DAYS:
+        assert converted[day] == original[day]
+
+
+def test_readable_values():
+    readable = convert_from_wiser_schedule(hub_schedule())
+    assert "Type" not in readable
+    assert readable["Monday"] == [
+        {"Time": "06:30", "Temp": 21.0},
+        {"Time": "09:00", "Temp": "Off"},
+        {"Time": "17:30", "Temp": 21.0},
+        {"Time": "23:00", "Temp": "Off"},
+    ]
+    assert convert_from_wiser_schedule(hub_schedule("OnOff", 1100))["Sunday"][0] == {
+        "Time": "06:30",
+        "State": "On",
+    }
+
+
+def test_conversions_leave_their_input_unchanged():
+    original = hub_schedule()
+    before = copy.deepcopy(original)
+    readable = convert_from_wiser_schedule(original, "Lounge")
+    assert original == before
+
+    readable["Weekdays"] = [{"Time": "1800", "Temp": 19}, {"Time": "7:00", "Temp": 20.5}]
+    readable_before = copy.deepcopy(readable)
+    convert_to_wiser_schedule(readable)
+    assert readable == readable_before
+
+
+def test_special_days_expand_and_times_are_sorted():
+    converted = convert_to_wiser_schedule(
+        {
+            "Weekdays": [{"Time": "18:00", "Temp": 19}, {"Time": "7:00", "Temp": 20.5}],
+            "Weekends": [{"Time": 800, "Temp": "off"}],
+        }
+    )
+    assert converted["Type"] == "Heating"
+    for day in WEEKDAYS:
+        assert converted[day.capitalize()] == {
+            "SetPoints": [
+                {"Time": 700, "DegreesC": 205},
+                {"Time": 1800, "DegreesC": 190},
+            ]
+        }
+    for day in WEEKENDS:
+        assert converted[day.capitalize()] == {
+            "SetPoints": [{"Time": 800, "DegreesC": -200}]
+        }
+
+
+@pytest.mark.parametrize("temp", [4.9, 30.5, -5, "warm", None])
+def test_out_of_range_or_invalid_temperatures_raise(temp):
+    with pytest.raises(ValueError):
+        convert_to_wiser_schedule({"Monday": [{"Time": "06:30", "Temp": temp}]})
+
+
+def test_boundary_temperatures_and_off_are_accepted():
+    converted = convert_to_wiser_schedule(
+        {
+            "Monday": [
+                {"Time": "06:30", "Temp": 5},
+                {"Time": "07:30", "Temp": 30},
+                {"Time": "08:30", "Temp": "Off"},
+            ]
+        }
+    )
+    assert [setpoint["DegreesC"] for setpoint in converted["Monday"]["SetPoints"]] == [
+        50,
+        300,
+        -200,
+    ]
+
+
+def test_on_off_states_are_not_range_checked_but_must_be_on_or_off():
+    converted = convert_to_wiser_schedule(
+        {"Type": "OnOff", "Monday": [{"Time": "06:30", "State": "on"}]}
+    )
+    assert converted["Monday"]["SetPoints"] == [{"Time": 630, "DegreesC": 1100}]
+    with pytest.raises(ValueError):
+        convert_to_wiser_schedule(
+            {"Type": "OnOff", "Monday": [{"Time": "06:30", "State": "maybe"}]}
+        )
+
+
+@pytest.mark.parametrize("time", ["06:30", "0630", "6:30", 630])
+def test_duplicate_times_raise(time):
+    with pytest.raises(ValueError, match="06:30"):
+        convert_to_wiser_schedule(
+            {
+                "Monday": [
+                    {"Time": "06:30", "Temp": 20},
+                    {"Time": "12:00", "Temp": 18},
+                    {"Time": time, "Temp": 21},
+                ]
+            }
+        )
+
+
+@pytest.mark.parametrize("time", ["24:00", "12:60", "noon", None])
+def test_invalid_times_raise(time):
+    with pytest.raises(ValueError):
+        convert_to_wiser_schedule({"Monday": [{"Time": time, "Temp": 20}]})
+
+
+def test_validate_schedule_returns_the_hub_form():
+    readable = convert_from_wiser_schedule(hub_schedule(), "Lounge")
+    assert validate_schedule(readable) == convert_to_wiser_schedule(readable)
+    with pytest.raises(ValueError):
+        validate_schedule({"Monday": [{"Time": "06:30", "Temp": 31}]})
+
+
+def test_validate_schedule_rejects_a_schedule_that_does_not_read_back(monkeypatch):
+    def lossy(schedule, name=""):
+        readable = convert_from_wiser_schedule(schedule, name)
+        readable["Tuesday"] = readable["Tuesday"][:1]
+        return readable
+
+    monkeypatch.setattr(util, "convert_from_wiser_schedule", lossy)
+    with pytest.raises(ValueError, match="Tuesday"):
+        validate_schedule(convert_from_wiser_schedule(hub_schedule()))
+
+
+def test_schedule_unchanged_ignores_order_case_and_id():
+    current = hub_schedule()
+    new = copy.deepcopy(current)
+    del new["id"]
+    new["monday"] = new.pop("Monday")
+    new["monday"]["SetPoints"].reverse()
+    assert schedule_unchanged(current, new)
+
+    readable = convert_from_wiser_schedule(current)
+    assert schedule_unchanged(current, convert_to_wiser_schedule(readable))
+
+
+def test_schedule_unchanged_only_compares_days_being_sent():
+    current = hub_schedule()
+    assert schedule_unchanged(current, {"Type": "Heating", "Monday": current["Monday"]})
+
+
+def test_schedule_unchanged_detects_changes():
+    current = hub_schedule()
+    changed = copy.deepcopy(current)
+    changed["Friday"]["SetPoints"][0]["DegreesC"] = 200
+    assert not schedule_unchanged(current, changed)
+
+    missing = copy.deepcopy(current)
+    missing["Friday"]["SetPoints"].pop()
+    assert not schedule_unchanged(current, missing)
+
+    assert not schedule_unchanged(current, hub_schedule("OnOff"))